@@ -5,9 +5,12 @@ from __future__ import absolute_import
 from .__main__ import cli
 
 from . import noisediode
+from . import ndreport
 from . import correlator
 from . import scans
+from . import sensors
 from . import targets
+from . import timeconv
 
 from .simulate import user_logger, verify_and_connect, start_session
 from .utility import (
@@ -15,11 +18,13 @@ from .utility import (
     NotAllTargetsUpError,
     read_yaml,
     get_lst,
+    lst2timestamp,
     lst2utc,
+    timestamp2lst,
     datetime2timestamp,
     timestamp2datetime,
 )
-from .observatory import Observatory, collect_targets
+from .observatory import Observatory, catalogue_from_targets, collect_targets
 from .targets import katpoint_target_string
 
 # BEGIN VERSION CHECK
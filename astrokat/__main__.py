@@ -135,6 +135,13 @@ def cli(
         help="Observation file, obs_plan.yaml (**required**)",
     )
 
+    parser.add_argument(
+        "--correlator",
+        type=str,
+        help="Correlator configuration file, only changed values are applied "
+             "and entry values are restored after the observation",
+    )
+
     # Add standard observation script options from sessions
     parser = session_options(
         parser,
@@ -157,6 +164,12 @@ def cli(
         action="store_true",
         help="Ensure all target horizon before continuing",
     )
+    group.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the parsed target cache "
+             "(cache directory set by ASTROKAT_CACHE_DIR)",
+    )
     group.add_argument(
         "--debug", action="store_true", help="verbose logger output for debugging"
     )
@@ -1,9 +1,215 @@
 """Setting correlator configuration values different from default values."""
+from __future__ import absolute_import
+
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
 try:
     from katcorelib import user_logger
 except ImportError:
     from .simulate import user_logger
 
+# Constants and defaults
+_MAX_CBF_REQUESTS = 32  # concurrent F-engine requests
+
+
+def read_gains(filename):
+    """Read per-input F-engine gains from a text file.
+
+    Each line holds either an input name and its gain, or only a gain
+    in input order. Blank lines and lines starting with '#' are ignored.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the gain file
+
+    Returns
+    -------
+    gains: dict or list
+        Gains per input name, or a list of gains in input order
+
+    """
+    named_gains = {}
+    gains = []
+    with open(filename) as fin:
+        for line in fin:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            items = line.replace(",", " ").split()
+            if len(items) > 1:
+                named_gains[items[0]] = _gain_value(items[1])
+            else:
+                gains.append(_gain_value(items[0]))
+    if named_gains and gains:
+        msg = "Gain file {} mixes named and unnamed gains".format(filename)
+        raise RuntimeError(msg)
+    return named_gains or gains
+
+
+def _gain_value(value):
+    """Real gain as float, complex gains as complex."""
+    try:
+        return float(value)
+    except ValueError:
+        return complex(value)
+
+
+def input_gains(inputs, requant_gains):
+    """F-engine gain per input.
+
+    Parameters
+    ----------
+    inputs: list
+        F-engine input names
+    requant_gains: int, float, complex, sequence, dict or str
+        Single gain for all inputs, a gain per input in input order,
+        a dict of gains keyed on input name, or the name of a gain file
+
+    Returns
+    -------
+    gains: list of (input, gain) tuples
+        Only inputs with a gain are included
+
+    """
+    if isinstance(requant_gains, str):
+        requant_gains = read_gains(requant_gains)
+    if isinstance(requant_gains, dict):
+        unknown = set(requant_gains) - set(str(inp) for inp in inputs)
+        if unknown:
+            msg = "Gains given for unknown F-engine inputs {}".format(sorted(unknown))
+            raise RuntimeError(msg)
+        return [(inp, requant_gains[str(inp)])
+                for inp in inputs if str(inp) in requant_gains]
+    if np.ndim(requant_gains) == 0:
+        return [(inp, requant_gains) for inp in inputs]
+    if len(requant_gains) != len(inputs):
+        msg = ("Number of gains ({}) does not match number of F-engine inputs ({})"
+               .format(len(requant_gains), len(inputs)))
+        raise RuntimeError(msg)
+    return list(zip(inputs, requant_gains))
+
+
+def _reply_arguments_(response):
+    """Values returned by a successful KATCP request."""
+    reply = getattr(response, "reply", None)
+    if reply is None:
+        # (reply, informs) tuple
+        reply = response[0]
+    if not reply.reply_ok():
+        msg = "F-engine request failed: {}".format(reply.arguments)
+        raise RuntimeError(msg)
+    return reply.arguments[1:]
+
+
+def _same_value(current, requested):
+    """True if the current setting already matches the requested value."""
+    if current is None:
+        return False
+    try:
+        return bool(np.allclose(np.asarray(current, dtype=complex),
+                                np.asarray(requested, dtype=complex)))
+    except (TypeError, ValueError):
+        return False
+
+
+def fengine_snapshot(session):
+    """Read the current F-engine gains and FFT shift.
+
+    Parameters
+    ----------
+    session: `SessionCBF()`
+        Simplify and normalise access to a CBF stream within session
+
+    Returns
+    -------
+    state: dict
+        'requant_gains' dict of gains keyed on input name and 'fft_shift'
+
+    """
+    inputs = list(session.cbf.fengine.inputs or [])
+
+    def _get_gain_(inp):
+        gains = [_gain_value(gain)
+                 for gain in _reply_arguments_(session.cbf.fengine.req.gain(inp))]
+        return gains[0] if len(gains) == 1 else gains
+
+    pool = ThreadPool(min(len(inputs), _MAX_CBF_REQUESTS) or 1)
+    try:
+        gains = pool.map(_get_gain_, inputs)
+    finally:
+        pool.close()
+        pool.join()
+    fft_shift = _reply_arguments_(session.cbf.fengine.req.fft_shift())
+    return {"requant_gains": dict(zip([str(inp) for inp in inputs], gains)),
+            "fft_shift": int(fft_shift[0]) if fft_shift else None}
+
+
+def update_fengines(session, state, requant_gains=None, fft_shift=None):
+    """Set the F-engine gains and FFT shift that differ from the current state.
+
+    Parameters
+    ----------
+    session: `SessionCBF()`
+        Simplify and normalise access to a CBF stream within session
+    state: dict
+        Current F-engine settings, as returned by `fengine_snapshot`
+    requant_gains: int, float, complex, sequence, dict or str
+        Requested gains, see `set_fengines`
+    fft_shift: int
+        Requested Fast Fourier Transform shift
+
+    Returns
+    -------
+    state: dict
+        F-engine settings after the update
+
+    """
+    current_gains = state["requant_gains"]
+    changed_gains = {}
+    if requant_gains is not None:
+        inputs = list(session.cbf.fengine.inputs or [])
+        for inp, gain in input_gains(inputs, requant_gains):
+            if not _same_value(current_gains.get(str(inp)), gain):
+                changed_gains[str(inp)] = gain
+        user_logger.info("F-engine gains unchanged for {} of {} inputs"
+                         .format(len(inputs) - len(changed_gains), len(inputs)))
+    if fft_shift is not None and _same_value(state["fft_shift"], fft_shift):
+        user_logger.info("F-engine FFT shift schedule unchanged")
+        fft_shift = None
+    if changed_gains or fft_shift is not None:
+        set_fengines(session,
+                     requant_gains=changed_gains or None,
+                     fft_shift=fft_shift)
+    new_gains = dict(current_gains)
+    new_gains.update(changed_gains)
+    return {"requant_gains": new_gains,
+            "fft_shift": state["fft_shift"] if fft_shift is None else fft_shift}
+
+
+def restore_fengines(session, entry):
+    """Return the F-engine gains and FFT shift to their entry settings.
+
+    The current settings are read again rather than taken from the setup,
+    which may have applied only some of the requested settings.
+
+    Parameters
+    ----------
+    session: `SessionCBF()`
+        Simplify and normalise access to a CBF stream within session
+    entry: dict
+        F-engine settings to restore, as returned by `fengine_snapshot`
+
+    Returns
+    -------
+    state: dict
+        F-engine settings after the restore
+
+    """
+    return update_fengines(session, fengine_snapshot(session), **entry)
+
 
 def set_fengines(session, requant_gains=None, fft_shift=None):
     """Set the f-engine gains.
@@ -12,30 +218,65 @@ def set_fengines(session, requant_gains=None, fft_shift=None):
     ----------
     session: `SessionCBF()`
         Simplify and normalise access to a CBF stream within session
-    requant_gains: int
-        F-engine gain
+    requant_gains: int, float, complex, sequence, dict or str
+        F-engine gain, a single gain for all inputs, a gain per input in
+        input order, a dict of gains keyed on input name,
+        or the name of a gain file (see `read_gains`)
     fft_shift: int
         Fast Fourier Transform shift
 
     """
-    if not session.cbf.fengine.inputs:
+    inputs = list(session.cbf.fengine.inputs or [])
+    if not inputs:
         msg = "Cannot set the F-engine gains"
         raise RuntimeError(msg)
 
-    for inp in session.cbf.fengine.inputs:
-        # Set the gain to a single non complex number if needed
-        if requant_gains is not None:
-            # TODO: read and store values before assignment
-            session.cbf.fengine.req.gain(inp, requant_gains)
-            msg = "F-engine {} gain set to {}".format(str(inp), requant_gains)
-            user_logger.info(msg)
-        # Set the FFT-shift schedule
-        if fft_shift is not None:
-            # TODO: read and store values before assignment
-            session.cbf.fengine.req.fft_shift(fft_shift)
-            msg = "F-engine FFT shift schedule set to {}".format(fft_shift)
-            user_logger.info(msg)
-    # TODO: return input values
+    # Set the FFT-shift schedule, applies to all inputs
+    if fft_shift is not None:
+        try:
+            _reply_arguments_(session.cbf.fengine.req.fft_shift(fft_shift))
+        except RuntimeError as err:
+            msg = "Setting F-engine FFT shift failed: {}".format(err)
+            raise RuntimeError(msg)
+        msg = "F-engine FFT shift schedule set to {}".format(fft_shift)
+        user_logger.info(msg)
+
+    if requant_gains is None:
+        return
+    gains = input_gains(inputs, requant_gains)
+
+    def _set_gain_(input_gain):
+        inp, gain = input_gain
+        # per-channel gains are sent as separate request arguments
+        if isinstance(gain, (list, tuple, np.ndarray)):
+            request = session.cbf.fengine.req.gain(inp, *gain)
+        else:
+            request = session.cbf.fengine.req.gain(inp, gain)
+        try:
+            _reply_arguments_(request)
+        except RuntimeError as err:
+            return err
+        return None
+
+    # Gain requests are sent concurrently so that setup time
+    # does not grow with the number of inputs
+    pool = ThreadPool(min(len(gains), _MAX_CBF_REQUESTS) or 1)
+    try:
+        errors = pool.map(_set_gain_, gains)
+    finally:
+        pool.close()
+        pool.join()
+    failed = []
+    for (inp, gain), error in zip(gains, errors):
+        if error is not None:
+            user_logger.error("F-engine {} gain not set: {}".format(str(inp), error))
+            failed.append(str(inp))
+            continue
+        msg = "F-engine {} gain set to {}".format(str(inp), gain)
+        user_logger.info(msg)
+    if failed:
+        msg = "Setting F-engine gains failed for inputs {}".format(failed)
+        raise RuntimeError(msg)
 
 
 # -fin-
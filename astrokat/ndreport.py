@@ -0,0 +1,304 @@
+"""Noise diode timing verification from observation logs.
+
+Noise diode switch reports, per antenna digitiser timestamps and slews
+are extracted from the log of an observation (or dry-run) and all
+timing checks are evaluated as array operations over the full
+observation. Digitiser timestamps, slews and the capture start time
+are only logged with debug output enabled, and slews are only logged
+by dry-runs.
+"""
+from __future__ import division
+from __future__ import absolute_import
+
+import re
+
+from collections import namedtuple
+
+import numpy as np
+
+from .timeconv import to_timestamp
+
+# noise diode states
+ND_OFF = 0
+ND_ON = 1
+ND_PATTERN = 2
+
+_NUMBER = r"(\d+(?:\.\d*)?)"
+_LOG_TIME = re.compile(r"^(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?)Z?")
+_ND_SWITCH = re.compile(r"Report: noise-diode (on|off) at " + _NUMBER)
+_ND_PATTERN_ON = re.compile(r"Report: Switch noise-diode pattern on at " + _NUMBER)
+_ND_PATTERN = re.compile(r"Repeat noise diode pattern every {} sec, "
+                         r"with {} sec on".format(_NUMBER, _NUMBER))
+_ND_RESET = re.compile(r'Resetting all noise diodes to "(on|off)"')
+_ND_ANTENNA = re.compile(r"(?:Noise diode for antenna \w+ set at "
+                         r"|Set noise diode for antenna \w+ at timestamp )" + _NUMBER)
+_CAPTURE_START = re.compile(r"Capture started at " + _NUMBER)
+_SLEW = re.compile(r"Slewing to .+ at {} for {} sec".format(_NUMBER, _NUMBER))
+
+Timeline = namedtuple("Timeline", [
+    "nd_start",  # noise diode state change timestamps [sec]
+    "nd_state",  # ND_OFF, ND_ON or ND_PATTERN
+    "nd_cycle",  # pattern cycle length [sec]
+    "nd_on",  # pattern on time per cycle [sec]
+    "antenna_spread",  # spread of digitiser timestamps per request [sec]
+    "slew_start",  # slew start timestamps [sec]
+    "slew_end",  # slew end timestamps [sec]
+    "capture_start",  # capture start timestamp, None if not logged
+    "end_time",  # last log timestamp
+])
+
+
+def _log_time(line):
+    """Timestamp of a log line, None if the line has no time stamp."""
+    match = _LOG_TIME.match(line.strip())
+    if match is None:
+        return None
+    return to_timestamp(np.datetime64(match.group(1).replace(" ", "T")))
+
+
+def parse_log(lines):
+    """Extract the noise diode timeline from observation log lines.
+
+    Parameters
+    ----------
+    lines: iterable of str
+        Observation log, as written by the observe script or dry-run
+
+    Returns
+    -------
+    timeline: Timeline
+        Noise diode states, digitiser timestamp spread and slews as arrays
+
+    """
+    nd_events = []
+    antenna_spread = []
+    antenna_timestamps = []
+    slews = []
+    pattern = (np.nan, np.nan)
+    capture_start = None
+    end_time = None
+    for line in lines:
+        line_time = _log_time(line)
+        if line_time is not None:
+            end_time = line_time
+        match = _ND_ANTENNA.search(line)
+        if match is not None:
+            antenna_timestamps.append(float(match.group(1)))
+            continue
+        match = _ND_PATTERN.search(line)
+        if match is not None:
+            pattern = (float(match.group(1)), float(match.group(2)))
+            continue
+        switch = _ND_SWITCH.search(line)
+        pattern_on = _ND_PATTERN_ON.search(line)
+        if switch is not None or pattern_on is not None:
+            if switch is not None:
+                state = ND_ON if switch.group(1) == "on" else ND_OFF
+                nd_events.append((float(switch.group(2)), state, np.nan, np.nan))
+            else:
+                nd_events.append((float(pattern_on.group(1)), ND_PATTERN) + pattern)
+            # digitiser timestamps reported for this request
+            if antenna_timestamps:
+                antenna_spread.append(np.ptp(antenna_timestamps))
+            antenna_timestamps = []
+            continue
+        match = _ND_RESET.search(line)
+        if match is not None and line_time is not None:
+            state = ND_ON if match.group(1) == "on" else ND_OFF
+            nd_events.append((line_time, state, np.nan, np.nan))
+            continue
+        match = _SLEW.search(line)
+        if match is not None:
+            start = float(match.group(1))
+            slews.append((start, start + float(match.group(2))))
+            continue
+        match = _CAPTURE_START.search(line)
+        if match is not None and capture_start is None:
+            capture_start = float(match.group(1))
+
+    nd_events = np.array(nd_events, dtype=float).reshape(-1, 4)
+    # digitisers apply requests in timestamp order
+    nd_events = nd_events[np.argsort(nd_events[:, 0], kind="mergesort")]
+    slews = np.array(slews, dtype=float).reshape(-1, 2)
+    return Timeline(nd_start=nd_events[:, 0],
+                    nd_state=nd_events[:, 1].astype(int),
+                    nd_cycle=nd_events[:, 2],
+                    nd_on=nd_events[:, 3],
+                    antenna_spread=np.array(antenna_spread, dtype=float),
+                    slew_start=slews[:, 0],
+                    slew_end=slews[:, 1],
+                    capture_start=capture_start,
+                    end_time=end_time)
+
+
+def _segment_on_time(timeline, idx, timestamps):
+    """Noise diode on time from the start of segments `idx` to `timestamps`."""
+    elapsed = np.maximum(timestamps - timeline.nd_start[idx], 0.0)
+    state = timeline.nd_state[idx]
+    cycle = timeline.nd_cycle[idx]
+    on_time = timeline.nd_on[idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pattern = (np.floor(elapsed / cycle) * on_time
+                   + np.minimum(np.mod(elapsed, cycle), on_time))
+    return np.where(state == ND_ON,
+                    elapsed,
+                    np.where(state == ND_PATTERN, pattern, 0.0))
+
+
+def nd_on_time(timeline, timestamps):
+    """Accumulated noise diode on time up to each timestamp.
+
+    The noise diode is assumed off before the first state change.
+
+    Parameters
+    ----------
+    timeline: Timeline
+        Noise diode timeline from :func:`parse_log`
+    timestamps: float or array
+        UTC seconds since the Unix epoch
+
+    Returns
+    -------
+    on_time: array
+        Seconds the noise diode was on from the first state change
+
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    n_segments = len(timeline.nd_start)
+    if n_segments == 0:
+        return np.zeros_like(timestamps)
+    segments = np.arange(n_segments - 1)
+    segment_total = _segment_on_time(timeline,
+                                     segments,
+                                     timeline.nd_start[segments + 1])
+    cumulative = np.r_[0.0, np.cumsum(segment_total)]
+    idx = np.searchsorted(timeline.nd_start, timestamps, side="right") - 1
+    segment = np.maximum(idx, 0)
+    on_time = cumulative[segment] + _segment_on_time(timeline, segment, timestamps)
+    return np.where(idx >= 0, on_time, 0.0)
+
+
+def _dump_start(timeline, dump_start):
+    if dump_start is None:
+        dump_start = timeline.capture_start
+    if dump_start is None:
+        raise ValueError("Dump start time not in log, a dump start is required")
+    return dump_start
+
+
+def _end_time(timeline, end_time):
+    if end_time is None:
+        end_time = timeline.end_time
+    if end_time is None:
+        raise ValueError("No log time stamps, an end time is required")
+    return end_time
+
+
+def dump_coverage(timeline, dump_period, dump_start=None, end_time=None):
+    """Fraction of each correlator dump with the noise diode on.
+
+    Parameters
+    ----------
+    timeline: Timeline
+        Noise diode timeline from :func:`parse_log`
+    dump_period: float
+        Correlator integration time [sec]
+    dump_start: float, optional
+        Timestamp of the first dump, default is the logged capture start
+    end_time: float, optional
+        End of the last dump, default is the time of the last log line
+
+    Returns
+    -------
+    dump_edges: array
+        Start timestamps of the dumps
+    coverage: array
+        Noise diode on fraction per dump
+
+    """
+    dump_start = _dump_start(timeline, dump_start)
+    end_time = _end_time(timeline, end_time)
+    n_dumps = max(int(np.floor((end_time - dump_start) / dump_period)), 0)
+    edges = dump_start + dump_period * np.arange(n_dumps + 1)
+    coverage = np.diff(nd_on_time(timeline, edges)) / dump_period
+    return edges[:-1], coverage
+
+
+def transition_offsets(timeline, dump_period, dump_start=None):
+    """Distance of each noise diode state change from the nearest dump edge.
+
+    Parameters
+    ----------
+    timeline: Timeline
+        Noise diode timeline from :func:`parse_log`
+    dump_period: float
+        Correlator integration time [sec]
+    dump_start: float, optional
+        Timestamp of a dump edge, default is the logged capture start
+
+    Returns
+    -------
+    offsets: array
+        Absolute offsets from the nearest dump edge [sec]
+
+    """
+    dump_start = _dump_start(timeline, dump_start)
+    offset = np.mod(timeline.nd_start - dump_start, dump_period)
+    return np.minimum(offset, dump_period - offset)
+
+
+def slew_overlap(timeline):
+    """Noise diode on time during each slew [sec]."""
+    return (nd_on_time(timeline, timeline.slew_end)
+            - nd_on_time(timeline, timeline.slew_start))
+
+
+def report(timeline,
+           dump_period,
+           dump_start=None,
+           tolerance=1e-3):
+    """Summarise noise diode timing over an observation.
+
+    Parameters
+    ----------
+    timeline: Timeline
+        Noise diode timeline from :func:`parse_log`
+    dump_period: float
+        Correlator integration time [sec]
+    dump_start: float, optional
+        Timestamp of the first dump, default is the logged capture start
+    tolerance: float, optional
+        Allowed timing error [sec]
+
+    Returns
+    -------
+    summary: dict
+        Dump coverage counts, misaligned transitions, digitiser timestamp
+        spread and slew overlaps, the slew values are None if no slews
+        were logged
+
+    """
+    _, coverage = dump_coverage(timeline, dump_period, dump_start=dump_start)
+    fraction = tolerance / dump_period
+    offsets = transition_offsets(timeline, dump_period, dump_start=dump_start)
+    overlap = slew_overlap(timeline)
+    spread = timeline.antenna_spread
+    slews = len(overlap) if len(overlap) else None
+    return {
+        "dumps": len(coverage),
+        "dumps_nd_on": int(np.sum(coverage >= 1.0 - fraction)),
+        "dumps_nd_off": int(np.sum(coverage <= fraction)),
+        "dumps_nd_partial": int(np.sum((coverage > fraction)
+                                       & (coverage < 1.0 - fraction))),
+        "transitions": len(offsets),
+        "misaligned_transitions": int(np.sum(offsets > tolerance)),
+        "max_transition_offset": float(offsets.max()) if len(offsets) else 0.0,
+        "requests_out_of_sync": int(np.sum(spread > tolerance)),
+        "max_antenna_spread": float(spread.max()) if len(spread) else 0.0,
+        "slews": slews,
+        "slews_with_nd": int(np.sum(overlap > tolerance)) if slews else None,
+        "nd_on_during_slews": float(overlap.sum()) if slews else None,
+    }
+
+
+# -fin-
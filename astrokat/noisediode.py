@@ -2,11 +2,16 @@
 from __future__ import division
 from __future__ import absolute_import
 
+import threading
 import time
+from collections import deque
+from multiprocessing.pool import ThreadPool
 
 import katpoint
 import numpy as np
 
+from .sensors import sensor_snapshot
+
 try:
     from katcorelib import user_logger
 except ImportError:
@@ -15,6 +20,206 @@ except ImportError:
 
 # Constants and defaults
 _DEFAULT_LEAD_TIME = 5.0  # lead time [sec]
+_MAX_ND_REQUESTS = 32  # concurrent digitiser requests
+_MIN_LEAD_TIME = 1.0  # lower bound of estimated lead time [sec]
+_MAX_LEAD_TIME = 10.0  # upper bound of estimated lead time [sec]
+
+
+class LeadTimeEstimator(object):
+    """Rolling estimate of the lead time needed to set all digitisers.
+
+    The time taken by each concurrent batch of digitiser requests and the
+    offsets between requested and digitiser reported switch times are
+    recorded as requests are made, the lead time is estimated from the
+    slowest recent batches scaled to the subarray size.
+
+    Parameters
+    ----------
+    min_lead_time : float, optional
+        Lower bound of the estimated lead time [sec]
+    max_lead_time : float, optional
+        Upper bound of the estimated lead time [sec]
+    margin : float, optional
+        Safety factor applied to the measured request times
+    window : int, optional
+        Number of recent requests to base the estimate on
+    """
+
+    def __init__(self,
+                 min_lead_time=_MIN_LEAD_TIME,
+                 max_lead_time=_MAX_LEAD_TIME,
+                 margin=2.0,
+                 window=20):
+        self.min_lead_time = min_lead_time
+        self.max_lead_time = max_lead_time
+        self.margin = margin
+        self._round_times = deque(maxlen=window)
+        self._offsets = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, n_requests, request_time, offsets=(), late=False):
+        """Record a completed set of digitiser requests.
+
+        Parameters
+        ----------
+        n_requests : int
+            Number of requests sent concurrently
+        request_time : float
+            Time from sending the first request to the last reply [sec]
+        offsets : sequence of float, optional
+            Digitiser reported minus requested switch times [sec]
+        late : bool, optional
+            True if requests were skipped because the lead time was too short
+        """
+        n_rounds = int(np.ceil(n_requests / float(_MAX_ND_REQUESTS))) or 1
+        round_time = request_time / n_rounds
+        if late:
+            # back off to the upper bound until the sample ages out
+            round_time = max(round_time, self.max_lead_time)
+        offset = max([0.0] + [float(offset) for offset in offsets])
+        with self._lock:
+            self._round_times.append(round_time)
+            self._offsets.append(offset)
+
+    def reset(self):
+        """Discard all measurements."""
+        with self._lock:
+            self._round_times.clear()
+            self._offsets.clear()
+
+    def lead_time(self, n_ants):
+        """Estimated lead time for a subarray of `n_ants` antennas [sec].
+
+        The default lead time is returned until measurements are available.
+        """
+        with self._lock:
+            if not self._round_times:
+                return _DEFAULT_LEAD_TIME
+            round_time = max(self._round_times)
+            offset = max(self._offsets)
+        n_rounds = int(np.ceil(n_ants / float(_MAX_ND_REQUESTS))) or 1
+        lead_time = self.margin * (round_time * n_rounds + offset)
+        return float(np.clip(lead_time, self.min_lead_time, self.max_lead_time))
+
+
+# lead time estimate shared by all noise diode requests
+lead_time_estimator = LeadTimeEstimator()
+
+
+class NoiseDiodeSchedule(object):
+    """Noise diode transition times aligned to correlator dump edges.
+
+    Parameters
+    ----------
+    dump_period : float, optional
+        Correlator integration time [sec]
+    dump_start : float, optional
+        Timestamp of a dump edge, e.g. the correlator sync time [sec]
+    """
+
+    def __init__(self, dump_period=None, dump_start=None):
+        self.dump_period = dump_period
+        self.dump_start = dump_start
+
+    def set_dump_timing(self, dump_period=None, dump_start=None):
+        """Update the correlator dump timing, None values are not changed."""
+        if dump_period is not None:
+            self.dump_period = float(dump_period)
+        if dump_start is not None:
+            self.dump_start = float(dump_start)
+
+    def reset(self):
+        """Discard the dump timing, transitions are no longer aligned."""
+        self.dump_period = None
+        self.dump_start = None
+
+    def _edge(self, timestamp):
+        """First dump edge number at or after `timestamp`."""
+        # tolerance for timestamps already on a dump edge
+        return np.ceil((timestamp - self.dump_start) / self.dump_period - 1e-6)
+
+    def align(self, timestamp, earliest=None):
+        """Dump edge for a transition at `timestamp`.
+
+        By default this is the first dump edge at or after `timestamp`.
+        With an `earliest` time the nearest dump edge is used instead,
+        delayed to the first dump edge at or after `earliest` if needed
+        (e.g. to allow the lead time), so that a transition adds at most
+        half a dump rather than up to a full dump of dead time.
+        The timestamp is only limited to `earliest` if the dump timing
+        is not known.
+        """
+        if not self.dump_period or self.dump_start is None:
+            if earliest is None:
+                return timestamp
+            return max(timestamp, earliest)
+        if earliest is None:
+            n_dumps = self._edge(timestamp)
+        else:
+            nearest = np.floor((timestamp - self.dump_start) / self.dump_period + 0.5)
+            n_dumps = max(nearest, self._edge(earliest))
+        return self.dump_start + n_dumps * self.dump_period
+
+    def plan(self, start_time, durations):
+        """Transition times for consecutive noise diode states.
+
+        Parameters
+        ----------
+        start_time : float
+            Earliest timestamp for the first transition [sec]
+        durations : sequence of float
+            Time to remain in each state after a transition, rounded to
+            the nearest whole number of dumps and at least one dump [sec]
+
+        Returns
+        -------
+        transitions : list of float
+            Dump aligned timestamps of the first transition and the end
+            of each state
+        """
+        transitions = [self.align(start_time)]
+        for duration in durations:
+            shortest = min(duration, self.dump_period or duration)
+            transitions.append(self.align(transitions[-1] + duration,
+                                          earliest=transitions[-1] + shortest))
+        return transitions
+
+
+# correlator dump timing for the current observation
+nd_schedule = NoiseDiodeSchedule()
+
+
+class NoiseDiodeState(object):
+    """Last noise diode state requested from the digitisers.
+
+    The state is 'off', 'on' or 'pattern', or None if not known,
+    with the pattern setup kept for pattern states.
+    """
+
+    def __init__(self):
+        self.state = None
+        self.nd_setup = None
+
+    def update(self, state, nd_setup=None):
+        """Record a successful noise diode request."""
+        self.state = state
+        self.nd_setup = dict(nd_setup) if nd_setup is not None else None
+
+    def reset(self):
+        """Forget the digitiser state, the next request is always sent."""
+        self.update(None)
+
+    def is_off(self):
+        """True if the noise diodes are known to be off."""
+        return self.state == 'off'
+
+    def is_pattern(self):
+        """True if the noise diodes are known to be running a pattern."""
+        return self.state == 'pattern'
+
+
+# noise diode state for the current observation
+nd_state = NoiseDiodeState()
 
 
 def max_cycle_len_per_band(band):
@@ -29,17 +234,31 @@ def _get_max_cycle_len(kat):
     """Get maximum cycle length for noise diode switching
     """
     if not kat.dry_run:
-        return max_cycle_len_per_band(kat.sensor.sub_band.get_value())
+        # sub-band does not change during an observation, read it once
+        return max_cycle_len_per_band(sensor_snapshot(kat).get("sub_band"))
     else:
         return max_cycle_len_per_band('l')
 
 
+def _get_lead_time_(kat, lead_time=None):
+    """Requested lead time, or the estimated lead time for the subarray
+    """
+    if lead_time is not None:
+        return lead_time
+    if kat.dry_run:
+        return _DEFAULT_LEAD_TIME
+    lead_time = lead_time_estimator.lead_time(len(list(kat.ants)))
+    user_logger.debug('DEBUG: estimated ND lead time {:.2f} sec'
+                      .format(lead_time))
+    return lead_time
+
+
 def _get_nd_timestamp_(lead_time):
-    """Timestamp for ND switch command with lead time
+    """Timestamp for ND switch command with lead time, on a dump edge
     """
     if lead_time is None:
         lead_time = _DEFAULT_LEAD_TIME
-    return time.time() + lead_time
+    return nd_schedule.align(time.time() + lead_time)
 
 
 def _set_dig_nd_(kat,
@@ -88,28 +307,58 @@ def _set_dig_nd_(kat,
         on_fraction = switch
 
     # Noise diodes trigger is evaluated per antenna
-    replies = {}
+    requests = []
     for ant in nd_antennas:
-        ped = getattr(kat, ant)
+        requests.append((ant, timestamp))
+        if cycle:
+            # add time [sec] to ensure all digitisers set at the same time
+            timestamp += cycle_length * on_fraction
+
+    def _request_(ant_request):
+        ant, ant_timestamp = ant_request
         # The digitiser master controller takes about 15-50 ms per request,
         # so start panicking just before the deadline.
-        if time.time() > timestamp - 0.02:
-            user_logger.error('Requested noise diode timestamp %sZ will probably '
-                              'be in the past - please increase lead time',
-                              katpoint.Timestamp(timestamp))
-            skipped = ','.join(nd_antennas[len(replies):])
-            user_logger.error('Skipped setting these noise diodes: %s', skipped)
-            break
-        replies[ant] = ped.req.dig_noise_source(timestamp,
-                                                on_fraction,
-                                                cycle_length)
+        if time.time() > ant_timestamp - 0.02:
+            return None
+        ped = getattr(kat, ant)
+        return ped.req.dig_noise_source(ant_timestamp,
+                                        on_fraction,
+                                        cycle_length)
+
+    # Requests are sent concurrently so that the time to set all digitisers
+    # does not grow with the number of antennas
+    pool = ThreadPool(min(len(requests), _MAX_ND_REQUESTS) or 1)
+    request_start = time.time()
+    try:
+        ant_replies = pool.map(_request_, requests)
+    finally:
+        pool.close()
+        pool.join()
+    request_time = time.time() - request_start
+
+    replies = {}
+    skipped = []
+    for (ant, ant_timestamp), reply in zip(requests, ant_replies):
+        if reply is None:
+            skipped.append(ant)
+            continue
+        replies[ant] = reply
         if kat.dry_run:
             msg = ('Dry-run: Set noise diode for antenna {} at '
-                   'timestamp {}'.format(ant, timestamp))
+                   'timestamp {}'.format(ant, ant_timestamp))
             user_logger.debug(msg)
-        if cycle:
-            # add time [sec] to ensure all digitisers set at the same time
-            timestamp += cycle_length * on_fraction
+    if skipped:
+        user_logger.error('Requested noise diode timestamp %sZ will probably '
+                          'be in the past - please increase lead time',
+                          katpoint.Timestamp(requests[0][1]))
+        user_logger.error('Skipped setting these noise diodes: %s',
+                          ','.join(skipped))
+    if not kat.dry_run:
+        lead_time_estimator.record(len(replies),
+                                   request_time,
+                                   offsets=_reply_offsets_(replies,
+                                                           dict(requests)),
+                                   late=bool(skipped))
 
     # assuming ND for all antennas must be the same
     # only display single timestamp
@@ -142,6 +391,15 @@ def _katcp_reply_(dig_katcp_replies):
     return np.mean(ant_ts_list) if ant_ts_list else np.nan
 
 
+def _reply_offsets_(dig_katcp_replies, ant_timestamps):
+    """Digitiser reported minus requested switch times"""
+    offsets = []
+    for ant, (reply, informs) in dig_katcp_replies.items():
+        if reply.reply_ok() and len(reply.arguments) >= 4:
+            offsets.append(float(reply.arguments[1]) - ant_timestamps[ant])
+    return offsets
+
+
 def _nd_log_msg_(ant,
                  reply,
                  informs):
@@ -193,6 +451,7 @@ def nd_reset(kat,
     user_logger.info('Resetting all noise diodes to "{}"'
                      .format(on_off[switch]))
     kat.ants.req.dig_noise_source(timestamp, switch)
+    nd_state.update(on_off[switch])
 
 
 def _switch_on_off_(kat,
@@ -240,7 +499,7 @@ def on(kat,
         Container for accessing KATCP resources allocated to schedule block.
     timestamp : float, optional (default = None)
         Time since the epoch as a floating point number [sec]
-    lead_time : float, optional (default = system default lead time)
+    lead_time : float, optional (default = estimated lead time)
         Lead time before the noisediode is switched on [sec]
 
     Returns
@@ -250,7 +509,7 @@ def on(kat,
     """
 
     if timestamp is None:
-        timestamp = _get_nd_timestamp_(lead_time)
+        timestamp = _get_nd_timestamp_(_get_lead_time_(kat, lead_time))
 
     true_timestamp = _switch_on_off_(kat,
                                      timestamp,
@@ -273,6 +532,7 @@ def on(kat,
     msg = ('Report: noise-diode on at {}'
            .format(true_timestamp))
     user_logger.info(msg)
+    nd_state.update('on')
     return true_timestamp
 
 
@@ -289,7 +549,7 @@ def off(kat,
         Container for accessing KATCP resources allocated to schedule block.
     timestamp : float, optional (default = None)
         Time since the epoch as a floating point number [sec]
-    lead_time : float, optional (default = system default lead time)
+    lead_time : float, optional (default = estimated lead time)
         Lead time before the noisediode is switched off [sec]
     allow_ts_err: boolean, optional (default = False)
         Allow ND set failures to pass by ignoring NaN timestamps
@@ -301,7 +561,7 @@ def off(kat,
     """
 
     if timestamp is None:
-        timestamp = _get_nd_timestamp_(lead_time)
+        timestamp = _get_nd_timestamp_(_get_lead_time_(kat, lead_time))
 
     true_timestamp = _switch_on_off_(kat, timestamp)
     continue_ = (np.isfinite(true_timestamp) or allow_ts_err)
@@ -313,6 +573,10 @@ def off(kat,
     msg = ('Report: noise-diode off at {}'
            .format(true_timestamp))
     user_logger.info(msg)
+    if np.isfinite(true_timestamp):
+        nd_state.update('off')
+    else:
+        nd_state.reset()
     return true_timestamp
 
 
@@ -328,14 +592,13 @@ def trigger(kat,
         Container for accessing KATCP resources allocated to schedule block.
     duration : float, optional (default = None)
         Duration that the noisediode will be active [sec]
-    lead_time : float, optional (default = system default lead time)
+    lead_time : float, optional (default = estimated lead time)
         Lead time before the noisediode is switched on [sec]
     """
 
     if duration is None:
         return True  # nothing to do
-    if lead_time is None:
-        lead_time = _DEFAULT_LEAD_TIME
+    lead_time = _get_lead_time_(kat, lead_time)
 
     msg = ('Firing noise diode for {}s before target observation'
            .format(duration))
@@ -347,8 +610,9 @@ def trigger(kat,
     if duration > lead_time:
         user_logger.trace('TRACE: Trigger duration > lead_time')
         # allow lead time for all to switch on simultaneously
-        # timestamp on = now + lead
-        on_time = on(kat, lead_time=lead_time)
+        # timestamp on = now + lead, off = on + duration on dump edges
+        on_time, off_time = nd_schedule.plan(time.time() + lead_time, [duration])
+        on_time = on(kat, timestamp=on_time)
         user_logger.debug('DEBUG: on {} ({})'
                           .format(on_time,
                                   time.ctime(on_time)))
@@ -357,7 +621,6 @@ def trigger(kat,
         sleeptime = min(duration - lead_time, lead_time)
         user_logger.trace('TRACE: sleep {}'
                           .format(sleeptime))
-        off_time = on_time + duration
         user_logger.trace('TRACE: desired off_time {} ({})'
                           .format(off_time,
                                   time.ctime(off_time)))
@@ -370,6 +633,8 @@ def trigger(kat,
         user_logger.trace('TRACE: ts after sleep {} ({})'
                           .format(time.time(),
                                   time.ctime(time.time())))
+        # the planned off time may be too close to allow the lead time
+        off_time = nd_schedule.align(off_time, earliest=time.time() + lead_time)
     else:
         user_logger.trace('TRACE: Trigger duration <= lead_time')
         cycle_len = _get_max_cycle_len(kat)
@@ -420,7 +685,7 @@ def pattern(kat,
             'cycle_len': the cycle length [sec],
                            - must be less than 20 sec for L-band,
             etc., etc.
-    lead_time : float, optional (default = system default lead time)
+    lead_time : float, optional (default = estimated lead time)
         Lead time before digitisers pattern is set [sec]
 
     Returns
@@ -428,8 +693,7 @@ def pattern(kat,
     timestamp : float
         Linux timestamp reported by digitiser
     """
-    if lead_time is None:
-        lead_time = _DEFAULT_LEAD_TIME
+    lead_time = _get_lead_time_(kat, lead_time)
 
     # nd pattern length [sec]
     max_cycle_len = _get_max_cycle_len(kat)
@@ -502,6 +766,7 @@ def pattern(kat,
     msg = ('Report: Switch noise-diode pattern on at {}'
            .format(timestamp))
     user_logger.info(msg)
+    nd_state.update('pattern', nd_setup)
     return timestamp
 
 # -fin-
@@ -2,60 +2,129 @@
 from __future__ import division
 from __future__ import absolute_import
 
+import copy
 import ephem
 import json
 import katpoint
 import numpy
 import os
+import threading
 
 from datetime import datetime, timedelta
 
 from .simulate import user_logger, setobserver, MEERKAT_REFERENCE_LOCATION
 from .targets import katpoint_target_string
 
-try:
-    import katconf
-
-    # Set up configuration source
-    _config_path = "/var/kat/config"
-    _node_file = "/var/kat/node.conf"
-    _settings = {}
-    if os.path.isdir(_config_path):
-        katconf.set_config(katconf.environ(override=_config_path))
-    elif os.path.isfile(_node_file):
-        with open(_node_file, "r") as fh:
-            _node_conf = json.loads(fh.read())
-        for _key, _val in _node_conf.items():
-            # Remove comments at the end of the line
-            _val = _val.split("#", 1)[0]
-            _settings[_key] = _val.strip()
-        if _settings.get("configuri", False):
-            katconf.set_config(katconf.environ(_node_conf["configuri"]))
+# reference location and node config availability, resolved on first use
+_node_config = None
+_node_config_lock = threading.Lock()
+
+
+def _load_node_config():
+    """Set up the katconf configuration source, if any, once per process.
+
+    Returns
+    -------
+    location: str
+        Array reference location description
+    available: bool
+        True if the node config is available
+
+    """
+    global _node_config
+    with _node_config_lock:
+        if _node_config is None:
+            _node_config = _read_node_config()
+    return _node_config
+
+
+def _read_node_config():
+    try:
+        import katconf
+
+        # Set up configuration source
+        _config_path = "/var/kat/config"
+        _node_file = "/var/kat/node.conf"
+        _settings = {}
+        if os.path.isdir(_config_path):
+            katconf.set_config(katconf.environ(override=_config_path))
+        elif os.path.isfile(_node_file):
+            with open(_node_file, "r") as fh:
+                _node_conf = json.loads(fh.read())
+            for _key, _val in _node_conf.items():
+                # Remove comments at the end of the line
+                _val = _val.split("#", 1)[0]
+                _settings[_key] = _val.strip()
+            if _settings.get("configuri", False):
+                katconf.set_config(katconf.environ(_node_conf["configuri"]))
+            else:
+                raise ValueError("Could not open node config file using configuri")
         else:
-            raise ValueError("Could not open node config file using configuri")
-    else:
-        raise ValueError("Could not open node config file")
+            raise ValueError("Could not open node config file")
 
-except (ImportError, ValueError):
-    # default reference position for MKAT array
-    _ref_location = MEERKAT_REFERENCE_LOCATION
-    _node_config_available = False
-else:
+    except (ImportError, ValueError):
+        # default reference position for MKAT array
+        return MEERKAT_REFERENCE_LOCATION, False
     # default reference position for MKAT array from katconf
-    _ref_location = (
-        katconf.ArrayConfig().array["array"]["name"]
-        + ", "
-        + katconf.ArrayConfig().array["array"]["position"]
-    )
-    _node_config_available = True
+    array = katconf.ArrayConfig().array["array"]
+    return array["name"] + ", " + array["position"], True
+
+
+def reference_location():
+    """Array reference location description, from node config if available."""
+    return _load_node_config()[0]
+
+
+def node_config_available():
+    """True if the katconf node config is available on this node."""
+    return _load_node_config()[1]
+
+
+_reference_antennas = {}
+_reference_antennas_lock = threading.Lock()
+
+
+def reference_antenna(location=None):
+    """Reference antenna for the array location.
+
+    The location description is only parsed once per process,
+    each call returns an independent copy with its own observer
+    that can be given a date and horizon without affecting others.
+
+    Parameters
+    ----------
+    location: str, optional
+        katpoint antenna description, default is the array reference location
+
+    """
+    if location is None:
+        location = reference_location()
+    with _reference_antennas_lock:
+        try:
+            antenna = _reference_antennas[location]
+        except KeyError:
+            antenna = _reference_antennas[location] = katpoint.Antenna(location)
+    shared_observer = antenna.observer is antenna.ref_observer
+    antenna = copy.copy(antenna)
+    antenna.ref_observer = antenna.ref_observer.copy()
+    if shared_observer:
+        antenna.observer = antenna.ref_observer
+    else:
+        antenna.observer = antenna.observer.copy()
+    return antenna
 
 
 class Observatory(object):
-    """Basic LST calculations using ephem."""
+    """Basic LST calculations using ephem.
+
+    Target queries do not change the observer, use the `date` argument
+    to evaluate at another time, so that one instance can be shared
+    between threads.
+    """
 
     def __init__(self, location=None, horizon=20.0, datetime=None):
-        self.location = _ref_location
-        self.node_config_available = _node_config_available
+        self.location = reference_location()
+        self.node_config_available = node_config_available()
         if location is not None:
             self.location = location
         self.kat = self.get_location()
@@ -69,12 +138,20 @@ class Observatory(object):
                                       second=0,
                                       microsecond=0)
 
-    def _ephem_risetime_(self, ephem_target, lst=True):
+    def _observer_(self, date=None):
+        """Private copy of the observer, at `date` if given."""
+        observer = self.observer.copy()
+        if date is not None:
+            observer.date = date
+        return observer
+
+    def _ephem_risetime_(self, ephem_target, lst=True, date=None):
         midnight_plus_one = ((self._midnight_() + timedelta(seconds=1))
                              .strftime("%H:%M:%S"))
         midnight_plus_one = ephem.hours(midnight_plus_one)
+        observer = self._observer_(date)
         try:
-            rise_time = self.observer.next_rising(ephem_target)
+            rise_time = observer.next_rising(ephem_target.copy())
         except ephem.AlwaysUpError:
             return midnight_plus_one
         except AttributeError:
@@ -82,17 +159,19 @@ class Observatory(object):
 
         if not lst:
             return rise_time
-        self.observer.date = rise_time
-        return self.observer.sidereal_time()
+        observer.date = rise_time
+        return observer.sidereal_time()
 
-    def _ephem_settime_(self, ephem_target, lst=True):
+    def _ephem_settime_(self, ephem_target, lst=True, date=None):
         midnight = self._midnight_() + timedelta(days=1)
         midnight_minus_one = ((midnight - timedelta(seconds=1))
                               .strftime("%H:%M:%S"))
         midnight_minus_one = ephem.hours(midnight_minus_one)
+        observer = self._observer_(date)
+        ephem_target = ephem_target.copy()
         try:
-            rise_time = self.observer.next_rising(ephem_target)
-            set_time = self.observer.next_setting(ephem_target, start=rise_time)
+            rise_time = observer.next_rising(ephem_target)
+            set_time = observer.next_setting(ephem_target, start=rise_time)
         except ephem.AlwaysUpError:
             return midnight_minus_one
         except AttributeError:
@@ -100,13 +179,116 @@ class Observatory(object):
 
         if not lst:
             return set_time
-        self.observer.date = set_time
-        return self.observer.sidereal_time()
+        observer.date = set_time
+        return observer.sidereal_time()
+
+    def _precess_to_date(self, ra, dec, date=None):
+        """Precess J2000 (ra, dec) [rad] to `date` (IAU 1976)."""
+        if date is None:
+            date = self.observer.date
+        centuries = (float(ephem.Date(date)) - float(ephem.J2000)) / 36525.
+        arcsec = numpy.pi / 180. / 3600.
+        zeta = (2306.2181 + (0.30188 + 0.017998 * centuries) * centuries) * centuries
+        z = (2306.2181 + (1.09468 + 0.018203 * centuries) * centuries) * centuries
+        theta = (2004.3109 - (0.42665 + 0.041833 * centuries) * centuries) * centuries
+        zeta, z, theta = zeta * arcsec, z * arcsec, theta * arcsec
+        a_ = numpy.cos(dec) * numpy.sin(ra + zeta)
+        b_ = (numpy.cos(theta) * numpy.cos(dec) * numpy.cos(ra + zeta)
+              - numpy.sin(theta) * numpy.sin(dec))
+        c_ = (numpy.sin(theta) * numpy.cos(dec) * numpy.cos(ra + zeta)
+              + numpy.cos(theta) * numpy.sin(dec))
+        ra_date = (numpy.arctan2(a_, b_) + z) % (2. * numpy.pi)
+        dec_date = numpy.arcsin(numpy.clip(c_, -1., 1.))
+        return ra_date, dec_date
+
+    def rise_set_lst(self, ra, dec, horizon=None, date=None):
+        """Rise and set LST of fixed celestial targets in closed form.
+
+        Vectorised alternative to the ephem rise and set time calculations
+        for (ra, dec) targets, using the hour angle at which each target
+        crosses the horizon.
 
-    def target_rise_and_set_times(self, target, lst=True):
-        """Target rise and set LST times"""
-        rise_lst = self._ephem_risetime_(target, lst=lst)
-        set_lst = self._ephem_settime_(target, lst=lst)
+        Parameters
+        ----------
+        ra: float or array
+            J2000 right ascension [rad]
+        dec: float or array
+            J2000 declination [rad]
+        horizon: float, optional
+            Horizon elevation [deg], default is the observer horizon
+        date: ephem.Date, optional
+            Date of the calculation, default is the observer date
+
+        Returns
+        -------
+        rise_lst, set_lst: array
+            Rise and set LST [rad].
+            Targets that are always up rise at 00:00:01 and set at 23:59:59
+            (as for the ephem calculations), targets that never rise are NaN.
+
+        """
+        if horizon is None:
+            horizon = self.observer.horizon
+        else:
+            horizon = numpy.deg2rad(horizon)
+        ra, dec = self._precess_to_date(numpy.asarray(ra, dtype=float),
+                                        numpy.asarray(dec, dtype=float),
+                                        date=date)
+        lat = float(self.observer.lat)
+        cos_ha = ((numpy.sin(horizon) - numpy.sin(lat) * numpy.sin(dec))
+                  / (numpy.cos(lat) * numpy.cos(dec)))
+        hour_angle = numpy.arccos(numpy.clip(cos_ha, -1., 1.))
+        rise_lst = (ra - hour_angle) % (2. * numpy.pi)
+        set_lst = (ra + hour_angle) % (2. * numpy.pi)
+        always_up = cos_ha < -1.
+        rise_lst = numpy.where(always_up, float(ephem.hours("00:00:01")), rise_lst)
+        set_lst = numpy.where(always_up, float(ephem.hours("23:59:59")), set_lst)
+        never_up = cos_ha > 1.
+        rise_lst = numpy.where(never_up, numpy.nan, rise_lst)
+        set_lst = numpy.where(never_up, numpy.nan, set_lst)
+        return rise_lst, set_lst
+
+    def _rise_set_lst_(self, bodies, date=None):
+        """Rise and set LST for a list of ephem bodies.
+
+        Fixed bodies use the closed form `rise_set_lst` in a single call,
+        moving bodies fall back to the ephem calculations.
+        """
+        rise_lst = [None] * len(bodies)
+        set_lst = [None] * len(bodies)
+        fixed = [idx for idx, body in enumerate(bodies)
+                 if type(body) is ephem.FixedBody]
+        if fixed:
+            radec = []
+            for idx in fixed:
+                body = bodies[idx]
+                if body._epoch == ephem.J2000:
+                    radec.append((body._ra, body._dec))
+                else:
+                    # e.g. B1950 catalogue coordinates
+                    j2000 = ephem.Equatorial(ephem.Equatorial(body._ra,
+                                                              body._dec,
+                                                              epoch=body._epoch),
+                                             epoch=ephem.J2000)
+                    radec.append((j2000.ra, j2000.dec))
+            ra, dec = numpy.array(radec, dtype=float).T
+            fixed_rise, fixed_set = self.rise_set_lst(ra, dec, date=date)
+            for cnt, idx in enumerate(fixed):
+                if numpy.isnan(fixed_rise[cnt]):
+                    # never up, let ephem report it
+                    continue
+                rise_lst[idx] = ephem.hours(fixed_rise[cnt])
+                set_lst[idx] = ephem.hours(fixed_set[cnt])
+        for idx, body in enumerate(bodies):
+            if rise_lst[idx] is None:
+                rise_lst[idx] = self._ephem_risetime_(body, date=date)
+                set_lst[idx] = self._ephem_settime_(body, date=date)
+        return rise_lst, set_lst
+
+    def target_rise_and_set_times(self, target, lst=True, date=None):
+        """Target rise and set LST times, from `date` or the observer date"""
+        rise_lst = self._ephem_risetime_(target, lst=lst, date=date)
+        set_lst = self._ephem_settime_(target, lst=lst, date=date)
         return rise_lst, set_lst
 
     def read_file_from_node_config(self, catalogue_file):
@@ -122,6 +304,8 @@ class Observatory(object):
         if not self.node_config_available:
             raise AttributeError("Node config is not configured")
         else:
+            import katconf
+
             err_msg = "Catalogue file does not exist in node config!"
             assert katconf.resource_exists(catalogue_file), err_msg
             return katconf.resource_template(catalogue_file)
@@ -133,7 +317,7 @@ class Observatory(object):
         a MeerKAT wrapper around the PyEphem.observer object
 
         """
-        return katpoint.Antenna(self.location)
+        return reference_antenna(self.location)
 
     def get_observer(self, horizon=20.0):
         """Get the MeerKAT observer object.
@@ -213,10 +397,8 @@ class Observatory(object):
         str_flag:
 
         """
-        start_lst = []
-        for target in target_list:
-            target_ = self.get_target(target).body
-            start_lst.append(self._ephem_risetime_(target_))
+        bodies = [self.get_target(target).body for target in target_list]
+        start_lst, _ = self._rise_set_lst_(bodies)
 
         start_lst_float = numpy.asarray(start_lst, dtype=float)
         idx_map = (start_lst_float >= 1)
@@ -244,14 +426,12 @@ class Observatory(object):
         str_flag:
 
         """
-        end_lst = []
+        bodies = [self.get_target(target).body for target in target_list]
+        start_lst, end_lst = self._rise_set_lst_(bodies)
         end_lst_float = []
-        for target in target_list:
-            target_ = self.get_target(target).body
-            start_lst = self._ephem_risetime_(target_)
-            end_lst.append(self._ephem_settime_(target_))
-            end_lst_float.append(float(end_lst[-1]))
-            if start_lst > end_lst[-1]:
+        for rise_lst, set_lst in zip(start_lst, end_lst):
+            end_lst_float.append(float(set_lst))
+            if rise_lst > set_lst:
                 end_lst_float[-1] += 24.
         idx_map = (numpy.asarray(end_lst_float) % 24. <= 2. * numpy.pi)
         end_lst_float = numpy.asarray(end_lst_float, dtype=float)
@@ -276,24 +456,24 @@ def collect_targets(kat, args):
     """
     from_names = from_strings = from_catalogues = num_catalogues = 0
     catalogue = katpoint.Catalogue()
-    catalogue.antenna = katpoint.Antenna(_ref_location)
+    catalogue.antenna = reference_antenna()
 
     setobserver(catalogue.antenna.observer)
 
     for arg in args:
-        try:
-            # First assume the string is a catalogue file name
+        if os.path.isfile(arg):
+            # Only real files are read as catalogue files
             count_before_add = len(catalogue)
             try:
-                catalogue.add(open(arg))
+                with open(arg) as fin:
+                    catalogue.add(fin)
             except ValueError:
                 msg = "Catalogue {} contains bad targets".format(arg)
                 user_logger.warning(msg)
             from_catalogues += len(catalogue) - count_before_add
             num_catalogues += 1
-        except IOError:
-            # If the file failed to load,
-            # assume it is a name or description string
+        else:
+            # Assume it is a name or description string
             # With no comma in target string,
             # assume it's the name of a target
             # to be looked up in standard catalogue
@@ -325,4 +505,40 @@ def collect_targets(kat, args):
     return catalogue
 
 
+def catalogue_from_targets(target_list, antenna=None):
+    """Build katpoint catalogue from known target descriptions.
+
+    Bulk alternative to `collect_targets` for targets that have already
+    been parsed, no catalogue files or target names are looked up.
+
+    Parameters
+    ----------
+    target_list: list or numpy.recarray
+        katpoint target description strings, or the target table
+        returned by `astrokat.targets.read`
+    antenna: katpoint.Antenna, optional
+        Catalogue antenna, default is a new `reference_antenna`
+
+    """
+    if getattr(target_list, "dtype", None) is not None and target_list.dtype.names:
+        target_list = target_list["target"]
+    catalogue = katpoint.Catalogue()
+    if antenna is None:
+        antenna = reference_antenna()
+    catalogue.antenna = antenna
+
+    setobserver(catalogue.antenna.observer)
+
+    for target in target_list:
+        try:
+            catalogue.add(target)
+        except ValueError as err:
+            msg = "Invalid target {}, skipping it [{}]".format(target, err)
+            user_logger.warning(msg)
+    if len(catalogue) == 0:
+        raise ValueError("No known targets found in argument list")
+    user_logger.info("Found {} target(s)".format(len(catalogue)))
+    return catalogue
+
+
 # -fin-
@@ -4,13 +4,23 @@ import ephem
 import logging
 import numpy as np
 import os
+import threading
 import time
+import yaml
+
+from contextlib import contextmanager
 
 import astrokat
-from astrokat.utility import datetime2timestamp, timestamp2datetime
+import katpoint
+from astrokat.correlator import fengine_snapshot, restore_fengines, update_fengines
+from astrokat.observatory import reference_antenna
+from astrokat.sensors import sensor_snapshot
+from astrokat.timeconv import SIDEREAL_RATE, to_ephem_date, to_timestamp
+from astrokat.utility import file_hash, timestamp2datetime
 from astrokat import (
     NoTargetsUpError,
     NotAllTargetsUpError,
+    catalogue_from_targets,
     get_lst,
     noisediode,
     read_yaml,
@@ -20,14 +30,12 @@ from astrokat import (
 
 try:
     from katcorelib import (
-        collect_targets,
         user_logger,
         start_session,
         verify_and_connect,
     )
 except ImportError:
     from astrokat import (
-        collect_targets,
         user_logger,
         start_session,
         verify_and_connect,
@@ -71,6 +79,33 @@ def _get_radec_from_azel(observer, orig_target_str, timestamp):
 # -- Utility functions --
 
 
+def restore_nd_pattern(kat, nd_setup):
+    """Restore the noise diode pattern programmed at setup if it is off.
+
+    Parameters
+    ----------
+    kat : session kat container-like object
+    nd_setup: dict
+        Noise diode pattern setup from the observation plan
+
+    Returns
+    -------
+    restored: bool
+        True if the pattern was requested
+
+    """
+    if nd_setup is None or "cycle_len" not in nd_setup:
+        return False
+    if not noisediode.nd_state.is_off():
+        return False
+    user_logger.info('Observation: Restoring ND pattern')
+    noisediode.pattern(kat,
+                       nd_setup,
+                       lead_time=nd_setup.get('lead_time'),
+                       )
+    return True
+
+
 def observe(session, ref_antenna, target_info, **kwargs):
     """Target observation functionality.
 
@@ -112,18 +147,24 @@ def observe(session, ref_antenna, target_info, **kwargs):
         if "cycle_len" not in nd_setup:
             nd_setup = None
 
-    # implement target specific noise diode behaviour
+    # implement target specific noise diode behaviour,
+    # requests are only sent when the noise diode state changes
     nd_period = None
-    nd_restore = False
     if target_info["noise_diode"] is not None:
         if "off" in target_info["noise_diode"]:
             user_logger.info('Observation: No ND for target')
-            nd_restore = True
             # disable noise diode pattern for target
-            noisediode.off(session.kat,
-                           lead_time=nd_lead)
+            if noisediode.nd_state.is_off():
+                user_logger.debug('DEBUG: noise diode already off')
+            else:
+                noisediode.off(session.kat,
+                               lead_time=nd_lead)
         else:
             nd_period = float(target_info["noise_diode"])
+    else:
+        # restore pattern programmed at setup, after targets without ND
+        # or with an ND trigger, which also leaves the noise diode off
+        restore_nd_pattern(session.kat, nd_setup)
 
     msg = "Initialising {} {} {}".format(
         obs_type.capitalize(), ", ".join(target.tags[1:]), target_name
@@ -201,14 +242,6 @@ def observe(session, ref_antenna, target_info, **kwargs):
             target_visible = True
     user_logger.trace("TRACE: ts after {} {}".format(obs_type, time.time()))
 
-    if (nd_setup is not None and nd_restore):
-        # restore pattern if programmed at setup
-        user_logger.info('Observation: Restoring ND pattern')
-        noisediode.pattern(session.kat,
-                           nd_setup,
-                           lead_time=nd_lead,
-                           )
-
     return target_visible
 
 
@@ -234,17 +267,28 @@ def cadence_target(target_list):
 def above_horizon(target,
                   observer,
                   horizon=20.0,
-                  duration=0.0):
+                  duration=0.0,
+                  ephem_table=None):
     """Check target visibility.
        Utility function to calculate ephem horizontal coordinates
+       Moving bodies with an `EphemerisTable` are evaluated by interpolation
     """
 
     # use local copies so you do not overwrite target time attribute
     horizon = ephem.degrees(str(horizon))
 
+    if ephem_table is not None:
+        timestamps = np.array([time.time(), time.time() + duration])
+        if ephem_table.covers(timestamps):
+            _, elev = ephem_table.azel(timestamps)
+            user_logger.trace(
+                "TRACE: target (start, end) el= ({}, {})".format(*elev)
+            )
+            return bool(np.all(elev > horizon))
+
     # must be celestial target (ra, dec)
     # check that target is visible at start of track
-    start_ = timestamp2datetime(time.time())
+    start_ = to_ephem_date(time.time())
     [azim, elev] = _horizontal_coordinates(target, observer, start_)
     user_logger.trace(
         "TRACE: target at start (az, el)= ({}, {})".format(azim, elev)
@@ -254,7 +298,7 @@ def above_horizon(target,
 
     # check that target will be visible at end of track
     if duration:
-        end_ = timestamp2datetime(time.time() + duration)
+        end_ = to_ephem_date(time.time() + duration)
         [azim, elev] = _horizontal_coordinates(target, observer, end_)
         user_logger.trace(
             "TRACE: target at end (az, el)= ({}, {})".format(azim, elev)
@@ -264,6 +308,122 @@ def above_horizon(target,
     return True
 
 
+def next_rise_time(obs_targets, observer, horizon=20.0, end_time=None):
+    """Find the first target to rise above the horizon after the current time.
+
+    Parameters
+    ----------
+    obs_targets: numpy.recarray
+        Observation loop target table
+    observer: ephem.Observer
+        Observer location, the observer itself is not changed
+    horizon: float
+        minimum pointing angle in degrees
+    end_time: float, optional
+        UTC timestamp, only targets that rise in time to be observed
+        for their full duration before `end_time` are considered
+
+    Returns
+    -------
+    rise_time: float
+        UTC timestamp of the first rise, None if no target rises in time
+    name: str
+        Name of the rising target
+
+    """
+    now = time.time()
+    observer = observer.copy()
+    observer.date = to_ephem_date(now)
+    observer.horizon = ephem.degrees(str(horizon))
+    timestamps = np.full(len(obs_targets), np.nan)
+    fixed = []
+    radec = []
+    for cnt, target in enumerate(obs_targets):
+        katpt_target = target["target"]
+        if not isinstance(katpt_target, katpoint.Target):
+            katpt_target = katpoint.Target(katpt_target)
+        if katpt_target.body_type == "azel":
+            # (az, el) targets do not rise
+            continue
+        body = katpt_target.body
+        if type(body) is ephem.FixedBody:
+            fixed.append(cnt)
+            radec.append((body._ra, body._dec))
+            continue
+        # moving bodies
+        try:
+            timestamps[cnt] = to_timestamp(observer.next_rising(body.copy()))
+        except (ephem.AlwaysUpError, ephem.NeverUpError):
+            continue
+    if fixed:
+        ra, dec = np.array(radec, dtype=float).T
+        # closed form rise times at the observer location and horizon
+        observatory = astrokat.Observatory()
+        observatory.observer = observer
+        rise_lst, set_lst = observatory.rise_set_lst(ra, dec, date=observer.date)
+        # always up targets are reported as rising at 00:00:01
+        always_up = ((rise_lst == float(ephem.hours("00:00:01")))
+                     & (set_lst == float(ephem.hours("23:59:59"))))
+        lst_wait = (rise_lst - float(observer.sidereal_time())) % (2. * np.pi)
+        fixed_rise = now + lst_wait / (2. * np.pi) * 86400. / SIDEREAL_RATE
+        # never up targets have NaN rise times
+        timestamps[fixed] = np.where(always_up, np.nan, fixed_rise)
+    if end_time is not None:
+        late = timestamps + obs_targets["duration"] > end_time
+        timestamps[late] = np.nan
+    if np.all(np.isnan(timestamps)):
+        return None, None
+    first = int(np.nanargmin(timestamps))
+    return float(timestamps[first]), obs_targets[first]["name"]
+
+
+def slew_to_first_visible(session, ref_antenna, obs_targets, horizon=20.0):
+    """Slew to the first target of an observation loop that is visible now.
+
+    Parameters
+    ----------
+    session: `CaptureSession` object
+    ref_antenna: katpoint.Antenna
+        Reference antenna, its observer is not changed
+    obs_targets: numpy.recarray
+        Observation loop target table, targets may be katpoint targets
+        or description strings if the loop has not started yet
+    horizon: float
+        minimum pointing angle in degrees
+
+    Returns
+    -------
+    name: str
+        Name of the target slewed to, None if no target is visible
+
+    """
+    for target in obs_targets:
+        target_info = {name: target[name] for name in obs_targets.dtype.names}
+        katpt_target = target_info["target"]
+        if not isinstance(katpt_target, katpoint.Target):
+            katpt_target = katpoint.Target(katpt_target, antenna=ref_antenna)
+            target_info["target"] = katpt_target
+        # make sure the target would be visible for the entire duration
+        if type(katpt_target.body) is ephem.FixedBody:
+            if not above_horizon(target=katpt_target.body.copy(),
+                                 observer=ref_antenna.observer.copy(),
+                                 horizon=horizon,
+                                 duration=target_info["duration"]):
+                continue
+        observe(session, ref_antenna, target_info, slewonly=True)
+        return target_info["name"]
+    return None
+
+
+def _lst_window_end(observer, end_lst):
+    """UTC timestamp at which the LST reaches `end_lst` hours."""
+    observer = observer.copy()
+    now = time.time()
+    observer.date = to_ephem_date(now)
+    local_lst = np.degrees(observer.sidereal_time()) / 15.0
+    return now + ((end_lst - local_lst) % 24.0) * 3600.0 / SIDEREAL_RATE
+
+
 class Telescope(object):
     """The telescope class.
 
@@ -277,16 +437,22 @@ class Telescope(object):
 
         # unpack user specified correlator setup values
         if correlator is not None:
-            correlator_config = read_yaml(correlator)
-            self.feng = correlator_config["Fengine"]
-            self.xeng = correlator_config["Xengine"]
-            self.beng = correlator_config["Bengine"]
+            # correlator configuration is not an observation plan
+            with open(correlator) as stream:
+                correlator_config = yaml.safe_load(stream) or {}
+            self.feng = correlator_config.get("Fengine")
+            self.xeng = correlator_config.get("Xengine")
+            self.beng = correlator_config.get("Bengine")
         else:
             self.feng = self.xeng = self.beng = None
+        # F-engine settings on entry, restored before the session closes
+        self._feng_entry = None
         # Check options and build KAT configuration,
         # connecting to proxies and devices
         # create single kat object, cannot repeatedly recreate
         self.array = verify_and_connect(opts)
+        # sensor values read in batches and cached for the observation
+        self.sensors = sensor_snapshot(self.array)
 
     def __enter__(self):
         """Verify subarray setup correct for observation before doing any work."""
@@ -305,12 +471,68 @@ class Telescope(object):
         user_logger.info("Observation clean up")
         user_logger.info("Returning telescope to startup state")
         # Ensure known exit state before quitting
-        # TODO: Return correlator settings to entry values
         # switch noise-source pattern off (ensure this after each observation)
         # if NaN returned at off command, allow to continue
         noisediode.nd_reset(self.array, "now")
         self.array.disconnect()
 
+    def correlator_setup(self, session):
+        """Apply the requested F-engine settings.
+
+        The current settings are read first and only values that differ
+        are sent, the entry settings are restored by `fengine_restore`.
+
+        Parameters
+        ----------
+        session: `CaptureSession` object
+            Session with access to the CBF
+
+        """
+        if not self.feng:
+            return
+        requant_gains = self.feng.get("requant_gain")
+        fft_shift = self.feng.get("fft_shift")
+        if self.array.dry_run:
+            user_logger.info("Dry-run: F-engine gains {}, FFT shift {}"
+                             .format(requant_gains, fft_shift))
+            return
+        # entry settings are kept before applying anything so that
+        # a partly applied setup is also restored
+        self._feng_entry = fengine_snapshot(session)
+        update_fengines(session,
+                        self._feng_entry,
+                        requant_gains=requant_gains,
+                        fft_shift=fft_shift)
+
+    @contextmanager
+    def fengine_restore(self, session):
+        """Restore the F-engine entry settings while `session` is still open.
+
+        A failed restore is logged rather than raised if the observation
+        itself failed, so that the original error is reported.
+
+        Parameters
+        ----------
+        session: `CaptureSession` object
+            Session with access to the CBF
+
+        """
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            entry, self._feng_entry = self._feng_entry, None
+            if entry is not None:
+                user_logger.info("Returning F-engine settings to entry values")
+                try:
+                    restore_fengines(session, entry)
+                except Exception as err:
+                    if not failed:
+                        raise
+                    user_logger.error("F-engine settings not restored: {}"
+                                      .format(err))
+
     def subarray_setup(self, instrument):
         """Set up the array for observing.
 
@@ -333,13 +555,20 @@ class Telescope(object):
         if self.opts.obs_plan_params["instrument"] is None:
             return
 
-        approved_sb_sensor = self.array.sched.sensor.get("approved_schedule")
-        if not approved_sb_sensor:
+        self.sensors.add("approved_schedule",
+                         self.array.sched.sensor.get("approved_schedule"))
+        for key in instrument.keys():
+            self.sensors.add("sub_{}".format(key))
+        self.sensors.add("sub_band")
+        # read all sensors needed for the checks in a single batch
+        self.sensors.refresh()
+
+        if not self.sensors.available("approved_schedule"):
             user_logger.info(
                 "Skipping instrument checks - approved_schedule does not exist"
             )
             return
-        approved_sb_sensor_value = approved_sb_sensor.get_value()
+        approved_sb_sensor_value = self.sensors.get("approved_schedule")
         if self.array.sb_id_code not in approved_sb_sensor_value:
             user_logger.info(
                 "Skipping instrument checks - {} "
@@ -352,7 +581,7 @@ class Telescope(object):
             user_logger.trace("{}: {}".format(key, conf_param))
             sensor_name = "sub_{}".format(key)
             user_logger.trace("{}".format(sensor_name))
-            sub_sensor = self.array.sensor.get(sensor_name).get_value()
+            sub_sensor = self.sensors.get(sensor_name)
             if isinstance(conf_param, list):
                 conf_param = set(conf_param)
             if isinstance(sub_sensor, list):
@@ -385,6 +614,172 @@ class Telescope(object):
                 )
 
 
+def prepare_targets(obs_dict, loop_cntr, plan_hash=None, start_time=None):
+    """Target table of an observation loop, prepared when the loop is reached.
+
+    Process the flat list of targets into a structure with sources
+    convert celestial targets coordinates to all be equatorial (ra,dec)
+    horizontal coordinates (alt, az)
+     for scans, the coordinates will be converted to enable delay tracking
+     for tracks the coordinates will be left as is with no delay tracking
+    planetary bodies are passed through to katpoint Target as is
+    elliptical solar bodies such as comets are also passed through as katpoint Targets
+    mosaic definitions are expanded to (ra, dec) pointings
+
+    The prepared table replaces the loop target list,
+    and is cached on disk keyed by the plan content if `plan_hash` is given.
+
+    Parameters
+    ----------
+    obs_dict: dict
+        Observation loop from the observation plan
+    loop_cntr: int
+        Index of the observation loop
+    plan_hash: str, optional
+        Content hash of the observation plan
+    start_time: datetime, optional
+        Fixed observation start time, default is the current time
+
+    """
+    if isinstance(obs_dict.get("target_list"), np.recarray):
+        return obs_dict["target_list"]
+    fixed_start = start_time is not None
+    if not fixed_start:
+        start_time = timestamp2datetime(time.time())
+    target_items = obs_dict.get("target_list", [])
+    key = None
+    # only (az, el) conversions depend on the start time,
+    # without a fixed start time those cannot be reused
+    time_dependent = any("azel" in item for item in target_items)
+    mkat = astrokat.Observatory(datetime=start_time)
+    if plan_hash is not None and (fixed_start or not time_dependent):
+        key = targets.cache_key(plan_hash,
+                                _cache_version(),
+                                loop_cntr,
+                                start_time if time_dependent else None,
+                                mkat.location if time_dependent else None)
+        obs_targets = targets.load_cached(key)
+        if obs_targets is not None:
+            obs_dict["target_list"] = obs_targets
+            return obs_targets
+    obs_targets = targets.read(target_items,
+                               observer=mkat.observer)
+    # mosaic pointings expand directly into the target table
+    if "mosaic" in obs_dict:
+        obs_targets = np.concatenate(
+            [obs_targets, targets.read_mosaic(obs_dict["mosaic"])]
+        ).view(np.recarray)
+    if key is not None:
+        targets.save_cached(key, obs_targets)
+    obs_dict["target_list"] = obs_targets
+    return obs_targets
+
+
+def array_location(kat):
+    """Reference antenna description of the live array.
+
+    Catalogues collected by katcorelib use the antenna of the kat session
+    sources, catalogues built from parsed targets use the same location.
+
+    Parameters
+    ----------
+    kat: session kat container-like object
+
+    Returns
+    -------
+    location: str
+        katpoint antenna description, None for dry-runs or if not available
+
+    """
+    if kat.dry_run:
+        return None
+    antenna = getattr(getattr(kat, "sources", None), "antenna", None)
+    return getattr(antenna, "description", None)
+
+
+def dump_timing(kat, session):
+    """Correlator integration time and sync time.
+
+    Parameters
+    ----------
+    kat: `Telescope` object
+    session: `CaptureSession` object
+
+    Returns
+    -------
+    dump_period: float
+        Correlator integration time [sec]
+    sync_time: float
+        Correlator sync time, None for dry-runs or if not available
+
+    """
+    if kat.array.dry_run:
+        return 0.5, None
+    cbf_corr = session.cbf.correlator
+    kat.sensors.add("int_time", cbf_corr.sensor.int_time)
+    kat.sensors.add("sync_time", getattr(cbf_corr.sensor, "sync_time", None))
+    sync_time = kat.sensors.get("sync_time", None)
+    if sync_time is None:
+        user_logger.warning("Correlator sync_time sensor not available, noise "
+                            "diode transitions are aligned to the capture start")
+    return kat.sensors.get("int_time"), sync_time
+
+
+def _cache_version():
+    """Package version identifying cached target tables.
+
+    Without katversion the version string changes every minute,
+    the content of the target parser identifies the code instead.
+    """
+    if "+unknown" not in astrokat.__version__:
+        return astrokat.__version__
+    return file_hash(targets.__file__)
+
+
+def _start_capture_init(session):
+    """Start capture initialisation in a background thread.
+
+    The only session call made while the capture is initialised is the
+    slew to the first target, all other session calls wait for `join`.
+    On the live system capture_init is a request to the subarray data
+    proxy and the slew drives the antenna proxies. Both are sent through
+    katcp resource clients, which hand blocking requests from any thread
+    over to the client ioloop thread. The slew does not announce the
+    target or change the capture state, so the two calls share no session
+    state.
+
+    Parameters
+    ----------
+    session: `CaptureSession`
+
+    Returns
+    -------
+    join: callable
+        Waits for initialisation to complete, re-raising any error
+        unless called with `reraise=False`
+
+    """
+    errors = []
+
+    def _capture_init_():
+        try:
+            session.capture_init()
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=_capture_init_, name="capture_init")
+    # do not keep the script alive if the observation is aborted
+    thread.daemon = True
+    thread.start()
+
+    def join(reraise=True):
+        thread.join()
+        if errors and reraise:
+            raise errors[0]
+
+    return join
+
+
 def run_observation(opts, kat):
     """Extract control and observation information provided in observation file."""
     obs_plan_params = opts.obs_plan_params
@@ -393,9 +788,11 @@ def run_observation(opts, kat):
 
     # set up duration periods for observation control
     obs_duration = -1
+    start_time = None
     if "durations" in obs_plan_params:
         if "obs_duration" in obs_plan_params["durations"]:
             obs_duration = obs_plan_params["durations"]["obs_duration"]
+        start_time = obs_plan_params["durations"].get("start_time")
     # check for nonsensical observation duration setting
     if abs(obs_duration) < 1e-5:
         user_logger.error("Unexpected value: obs_duration: {}".format(obs_duration))
@@ -424,9 +821,17 @@ def run_observation(opts, kat):
         session_opts["pointing_solution_max_age"] = max_age
         session_opts["pointing_solution_max_dist"] = max_dist
 
+    # parsed target tables are cached on disk, keyed by the plan content
+    plan_hash = None
+    if opts.yaml and not opts.no_cache:
+        plan_hash = file_hash(opts.yaml)
+
     nr_obs_loops = len(obs_plan_params["observation_loop"])
-    with start_session(kat.array, **vars(opts)) as session:
+    location = array_location(kat.array)
+    with start_session(kat.array, **vars(opts)) as session, \
+            kat.fengine_restore(session):
         session.standard_setup(**vars(opts))
+        kat.correlator_setup(session)
 
         # Each observation loop contains a number of observation cycles over LST ranges
         # For a single observation loop, only a start LST and duration is required
@@ -439,44 +844,23 @@ def run_observation(opts, kat):
                 user_logger.info("Loop LST range {}."
                                  .format(observation_cycle["LST"]))
             # Unpack all target information
-            if not ("target_list" in observation_cycle.keys()):
+            if not ("target_list" in observation_cycle.keys()
+                    or "mosaic" in observation_cycle.keys()):
                 user_logger.error(
                     "No targets provided - stopping script instead of hanging around"
                 )
                 continue
-            obs_targets = observation_cycle["target_list"]
-            target_list = obs_targets["target"].tolist()
-            # build katpoint catalogues for tidy handling of targets
-            catalogue = collect_targets(kat.array, target_list)
-            obs_tags = []
-            for tgt in obs_targets:
-                # catalogue names are no longer unique
-                name = tgt["name"]
-                # add tag evaluation to identify catalogue targets
-                tags = tgt["target"].split(",")[1].strip()
-                for cat_tgt in catalogue:
-                    if name == cat_tgt.name:
-                        if ("special" in cat_tgt.tags
-                                or "xephem" in cat_tgt.tags
-                                or tags == " ".join(cat_tgt.tags)):
-                            tgt["target"] = cat_tgt
-                            obs_tags.extend(cat_tgt.tags)
-                            break
-            obs_tags = list(set(obs_tags))
-            cal_tags = [tag for tag in obs_tags if tag[-3:] == "cal"]
-
             # observer object handle to track the observation timing in a more user
             # friendly way
 #             observer = catalogue._antenna.observer
-            ref_antenna = catalogue.antenna
+            ref_antenna = reference_antenna(location)
             observer = ref_antenna.observer
-            start_datetime = timestamp2datetime(time.time())
-            observer.date = ephem.Date(start_datetime)
+            start_timestamp = time.time()
+            observer.date = to_ephem_date(start_timestamp)
             user_logger.trace(
                 "TRACE: requested start time "
-                "({}) {}".format(datetime2timestamp(start_datetime), start_datetime)
+                "({}) {}".format(start_timestamp, timestamp2datetime(start_timestamp))
             )
-            user_logger.trace("TRACE: observer at start\n {}".format(observer))
 
             # Only observe targets in valid LST range
             if nr_obs_loops > 1 and obs_cntr < nr_obs_loops - 1:
@@ -525,6 +909,47 @@ def run_observation(opts, kat):
                         user_logger.error(log_msg)
                     continue
 
+            # targets are only prepared once the loop is known to be observable
+            obs_targets = prepare_targets(observation_cycle,
+                                          obs_cntr,
+                                          plan_hash=plan_hash,
+                                          start_time=start_time)
+            # the final seconds before the next loop starts are used to slew
+            # to its first target, rather than to overrun into the next loop
+            next_loop_start = None
+            if next_start_lst is not None:
+                next_loop_start = _lst_window_end(observer, next_start_lst)
+            overrun = False
+            preslew = False
+            # build katpoint catalogues for tidy handling of targets
+            catalogue = catalogue_from_targets(obs_targets, antenna=ref_antenna)
+            obs_tags = []
+            for tgt in obs_targets:
+                # catalogue names are no longer unique
+                name = tgt["name"]
+                # add tag evaluation to identify catalogue targets
+                tags = tgt["target"].split(",")[1].strip()
+                for cat_tgt in catalogue:
+                    if name == cat_tgt.name:
+                        if ("special" in cat_tgt.tags
+                                or "xephem" in cat_tgt.tags
+                                or tags == " ".join(cat_tgt.tags)):
+                            tgt["target"] = cat_tgt
+                            obs_tags.extend(cat_tgt.tags)
+                            break
+            obs_tags = list(set(obs_tags))
+            cal_tags = [tag for tag in obs_tags if tag[-3:] == "cal"]
+
+            user_logger.trace("TRACE: observer at start\n {}".format(observer))
+
+            # tabulate moving body ephemerides once for the observation window
+            ephem_tables = {}
+            table_end = time.time() + (obs_duration if obs_duration > 0 else 86400.)
+            for cat_tgt in catalogue:
+                if cat_tgt.body_type in ("special", "xephem"):
+                    ephem_tables[cat_tgt.name] = targets.EphemerisTable(
+                        cat_tgt.body, observer, time.time(), table_end)
+
             # Verify that it is worth while continuing with the observation
             # The filter functions uses the current time as timestamps
             # and thus incorrectly set the simulation timestamp
@@ -565,6 +990,17 @@ def run_observation(opts, kat):
                 )
             )
 
+            # Noise diode transitions are aligned to correlator dump edges
+            # once the capture start time is known
+            # Dump edges are whole integrations from the correlator sync time
+            dump_period, sync_time = dump_timing(kat, session)
+            user_logger.debug('DEBUG: Correlator integration time {} [sec]'
+                              .format(dump_period))
+            noisediode.nd_schedule.reset()
+            noisediode.nd_schedule.set_dump_timing(dump_period=dump_period,
+                                                   dump_start=sync_time)
+            noisediode.nd_state.reset()
+
             # TODO: setup of noise diode pattern should be moved to sessions
             #  so it happens in the line above
             if "noise_diode" in obs_plan_params:
@@ -572,13 +1008,6 @@ def run_observation(opts, kat):
                 nd_lead = nd_setup.get('lead_time')
 
                 # Set noise diode period to multiple of correlator integration time.
-                if not kat.array.dry_run:
-                    cbf_corr = session.cbf.correlator
-                    dump_period = cbf_corr.sensor.int_time.get_value()
-                else:
-                    dump_period = 0.5  # sec
-                user_logger.debug('DEBUG: Correlator integration time {} [sec]'
-                                  .format(dump_period))
 
                 if "cycle_len" in nd_setup:
                     if (nd_setup['cycle_len'] >= dump_period):
@@ -601,17 +1030,37 @@ def run_observation(opts, kat):
 
             # Adding explicit init after "Capture-init failed" exception was
             # encountered
-            session.capture_init()
+            # Capture initialisation and the first slew are independent,
+            # initialise in the background while slewing
+            capture_init_done = _start_capture_init(session)
+
+            # Go to first target before starting capture
+            user_logger.info("Slewing to first target")
+            try:
+                if slew_to_first_visible(session,
+                                         ref_antenna,
+                                         obs_targets,
+                                         horizon=opts.horizon) is None:
+                    observe(session, ref_antenna, obs_targets[0], slewonly=True)
+            except BaseException:
+                # the session is only closed once the capture is initialised
+                capture_init_done(reraise=False)
+                raise
+            capture_init_done()
             user_logger.debug(
                 "DEBUG: Initialise capture start with timestamp "
                 "{} ({})".format(int(time.time()), timestamp2datetime(time.time()))
             )
-
-            # Go to first target before starting capture
-            user_logger.info("Slewing to first target")
-            observe(session, ref_antenna, obs_targets[0], slewonly=True)
             # Only start capturing once we are on target
             session.capture_start()
+            if sync_time is None:
+                # no correlator sync time (e.g. dry-run),
+                # dumps are assumed to start with the capture
+                user_logger.debug("DEBUG: Correlator sync time not available")
+                noisediode.nd_schedule.set_dump_timing(dump_start=time.time())
+            # first dump edge of the capture
+            capture_start = noisediode.nd_schedule.align(time.time())
+            user_logger.debug("DEBUG: Capture started at {:.3f}".format(capture_start))
             user_logger.trace(
                 "TRACE: capture start time after slew "
                 "({}) {}".format(time.time(), timestamp2datetime(time.time()))
@@ -665,6 +1114,15 @@ def run_observation(opts, kat):
                                 "continuing".format(target["name"], opts.horizon)
                             )
                         continue
+                    # skip targets that would overrun into the next loop
+                    if (next_loop_start is not None
+                            and time.time() + target_duration > next_loop_start):
+                        user_logger.debug(
+                            "DEBUG: {} would overrun into next LST loop, "
+                            "skipping".format(target["name"])
+                        )
+                        overrun = True
+                        continue
                     user_logger.trace(
                         "TRACE: observer after horizon check\n {}".format(observer)
                     )
@@ -700,7 +1158,8 @@ def run_observation(opts, kat):
                         if above_horizon(target=cat_target.body,
                                          observer=cat_target.antenna.observer.copy(),
                                          horizon=opts.horizon,
-                                         duration=tgt["duration"]):
+                                         duration=tgt["duration"],
+                                         ephem_table=ephem_tables.get(tgt["name"])):
                             if observe(session, ref_antenna, tgt, **obs_plan_params):
                                 targets_visible += True
                                 tgt["obs_cntr"] += 1
@@ -819,8 +1278,17 @@ def run_observation(opts, kat):
                     user_logger.info("Observation list completed - ending observation")
                     done = True
 
+                # slew to the next loop once no target fits before it starts
+                if overrun and not targets_visible:
+                    user_logger.info(
+                        "Moving to next LST loop, {:.0f} sec before it "
+                        "starts".format(next_loop_start - time.time())
+                    )
+                    preslew = True
+                    done = True
+
                 # for multiple loop, check start lst of next loop
-                if next_start_lst is not None:
+                if next_start_lst is not None and not overrun:
                     check_local_lst = observer.sidereal_time()
                     if (check_local_lst > next_start_lst) or (
                         not _next_day(next_start_lst, next_end_lst, check_local_lst)
@@ -828,14 +1296,60 @@ def run_observation(opts, kat):
                         user_logger.info("Moving to next LST loop")
                         done = True
 
+                # Wait for the next target to rise within the LST range
+                # and observation duration, rather than ending early
+                if not targets_visible and not done:
+                    end_time = _lst_window_end(observer, end_lst)
+                    if obs_duration > 0:
+                        end_time = min(end_time, session.start_time + obs_duration)
+                    rise_time, rise_target = next_rise_time(obs_targets,
+                                                            observer,
+                                                            horizon=opts.horizon,
+                                                            end_time=end_time)
+                    if rise_time is not None:
+                        # margin to be safely above the horizon
+                        wait_time = max(rise_time - time.time(), 0.0) + 1.0
+                        user_logger.info(
+                            "No targets currently visible - waiting {:.0f} sec "
+                            "for {} to rise".format(wait_time, rise_target)
+                        )
+                        time.sleep(wait_time)
+                        continue
+
                 # End if there is nothing to do
-                if not targets_visible:
+                if not targets_visible and not overrun:
                     user_logger.warning(
                         "No more targets to observe - stopping script "
                         "instead of hanging around"
                     )
                     done = True
 
+            # targets without ND must not leave the pattern off after the loop
+            restore_nd_pattern(kat.array, obs_plan_params.get("noise_diode"))
+
+            if preslew:
+                next_obs_targets = prepare_targets(next_obs_plan,
+                                                   obs_cntr + 1,
+                                                   plan_hash=plan_hash,
+                                                   start_time=start_time)
+                next_target = slew_to_first_visible(session,
+                                                    ref_antenna,
+                                                    next_obs_targets,
+                                                    horizon=opts.horizon)
+                if next_target is not None:
+                    user_logger.info(
+                        "Slewed to {}, first target of next LST loop".format(
+                            next_target)
+                    )
+                # margin to be safely inside the next LST range
+                wait_time = next_loop_start - time.time() + 1.0
+                if wait_time > 0:
+                    user_logger.info(
+                        "Waiting {:.0f} sec for next LST loop to start".format(
+                            wait_time)
+                    )
+                    time.sleep(wait_time)
+
     user_logger.trace("TRACE: observer at end\n {}".format(observer))
     # display observation cycle statistics
     # currently only available for single LST range observations
@@ -913,7 +1427,8 @@ def main(args):
 
     # unpack observation from observation plan
     if opts.yaml:
-        opts.obs_plan_params = read_yaml(opts.yaml)
+        # target lists are streamed from the file when the targets are read
+        opts.obs_plan_params = read_yaml(opts.yaml, stream_target_lists=True)
 
     # ensure sessions has the YAML horizon value if given
     if "horizon" in opts.obs_plan_params:
@@ -927,26 +1442,8 @@ def main(args):
     if opts.trace:
         user_logger.setLevel(logging.TRACE)
 
-    # process the flat list of targets into a structure with sources
-    # convert celestial targets coordinates to all be equatorial (ra,dec)
-    # horizontal coordinates (alt, az)
-    #  for scans, the coordinates will be converted to enable delay tracking
-    #  for tracks the coordinates will be left as is with no delay tracking
-    # planetary bodies are passed through to katpoint Target as is
-    # elliptical solar bodies such as comets are also passed through as katpoint Targets
-    for obs_dict in opts.obs_plan_params['observation_loop']:
-        start_ts = timestamp2datetime(time.time())
-        if "durations" in opts.obs_plan_params:
-            obs_time_info = opts.obs_plan_params["durations"]
-            if "start_time" in obs_time_info:
-                start_ts = obs_time_info["start_time"]
-        mkat = astrokat.Observatory(datetime=start_ts)
-        obs_targets = targets.read(obs_dict["target_list"],
-                                   observer=mkat.observer)
-        obs_dict['target_list'] = obs_targets
-
     # setup and observation
-    with Telescope(opts) as kat:
+    with Telescope(opts, correlator=opts.correlator) as kat:
         run_observation(opts, kat)
 
 
@@ -0,0 +1,183 @@
+"""Cached snapshot of telescope sensor values."""
+from __future__ import absolute_import
+
+import re
+import threading
+import weakref
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from katcorelib import user_logger
+except ImportError:
+    from .simulate import user_logger
+
+# Constants and defaults
+_MAX_SENSOR_READS = 16  # concurrent sensor reads
+_REQUIRED = object()  # no default, the sensor must exist
+
+
+def _parse_value(value):
+    """Typed sensor value from its KATCP string representation."""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _read_resource_(resource, sensors):
+    """Read sensors of one KATCP resource with a single ?sensor-value request.
+
+    Parameters
+    ----------
+    resource: KATCP resource client
+        Resource serving all the `sensors`
+    sensors: list of (name, sensor) tuples
+
+    Returns
+    -------
+    values: dict
+        Sensor values keyed on name, sensors not in the reply are left out
+
+    """
+    pattern = "/^({})$/".format("|".join(re.escape(sensor.name)
+                                         for _, sensor in sensors))
+    response = resource.req.sensor_value(pattern)
+    reply = getattr(response, "reply", None)
+    informs = getattr(response, "informs", None)
+    if reply is None:
+        # (reply, informs) tuple
+        reply, informs = response
+    if not reply.reply_ok():
+        msg = "Sensor request failed: {}".format(reply.arguments)
+        raise RuntimeError(msg)
+    readings = {}
+    for inform in informs:
+        # timestamp, count, name, status, value
+        _, _, katcp_name, _, value = inform.arguments[:5]
+        if isinstance(katcp_name, bytes):
+            katcp_name = katcp_name.decode("utf-8")
+        readings[katcp_name] = _parse_value(value)
+    return dict((name, readings[sensor.name])
+                for name, sensor in sensors if sensor.name in readings)
+
+
+class SensorSnapshot(object):
+    """Telescope sensor values read together and cached until refreshed.
+
+    Array sensors are found by name on the kat connection, sensors of
+    other resources (e.g. the correlator) can be added explicitly.
+    Sensors served by the same KATCP resource are read with a single
+    request, other sensors are read concurrently.
+
+    Parameters
+    ----------
+    kat : session kat container-like object
+        Container for accessing KATCP resources allocated to schedule block.
+    """
+
+    def __init__(self, kat):
+        self.kat = kat
+        self._sensors = {}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self._sensors
+
+    def add(self, name, sensor=None):
+        """Register a sensor, by default the array sensor `name`.
+
+        Sensors are only registered once, the cached value of an already
+        registered sensor is kept.
+
+        Returns
+        -------
+        sensor : sensor object or None if the sensor does not exist
+        """
+        with self._lock:
+            if name in self._sensors:
+                return self._sensors[name]
+        if sensor is None:
+            sensor = self.kat.sensor.get(name)
+        with self._lock:
+            return self._sensors.setdefault(name, sensor)
+
+    def available(self, name):
+        """True if sensor `name` exists."""
+        return bool(self.add(name))
+
+    def refresh(self, names=None):
+        """Read the registered sensors, all of them by default."""
+        if names is None:
+            names = list(self._sensors)
+        resources = {}
+        single = []
+        for name in names:
+            sensor = self.add(name)
+            parent_name = getattr(sensor, "parent_name", None)
+            if sensor and parent_name and getattr(sensor, "name", None):
+                resources.setdefault(parent_name, []).append((name, sensor))
+            else:
+                single.append((name, sensor))
+
+        values = {}
+        for parent_name, sensors in resources.items():
+            try:
+                values.update(_read_resource_(getattr(self.kat, parent_name),
+                                              sensors))
+            except (AttributeError, RuntimeError, TypeError, ValueError) as err:
+                user_logger.debug("DEBUG: {} sensors not read in one request ({})"
+                                  .format(parent_name, err))
+            single.extend((name, sensor) for name, sensor in sensors
+                          if name not in values)
+
+        def _read_(name_sensor):
+            name, sensor = name_sensor
+            return name, sensor.get_value() if sensor else None
+
+        if single:
+            pool = ThreadPool(min(len(single), _MAX_SENSOR_READS))
+            try:
+                values.update(pool.map(_read_, single))
+            finally:
+                pool.close()
+                pool.join()
+        with self._lock:
+            self._values.update(values)
+
+    def get(self, name, default=_REQUIRED):
+        """Cached value of sensor `name`, read on first use.
+
+        Returns `default` if the sensor does not exist,
+        without a default a missing sensor raises a RuntimeError.
+        """
+        if name not in self._values:
+            self.refresh([name])
+        if not self._sensors[name]:
+            if default is _REQUIRED:
+                msg = "Sensor {} is not available".format(name)
+                raise RuntimeError(msg)
+            return default
+        return self._values[name]
+
+
+# one snapshot per kat connection
+_snapshots = weakref.WeakKeyDictionary()
+_snapshots_lock = threading.Lock()
+
+
+def sensor_snapshot(kat):
+    """Sensor snapshot shared by all users of the `kat` connection."""
+    with _snapshots_lock:
+        snapshot = _snapshots.get(kat)
+        if snapshot is None:
+            snapshot = _snapshots[kat] = SensorSnapshot(kat)
+        return snapshot
+
+
+# -fin-
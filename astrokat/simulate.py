@@ -7,11 +7,13 @@ import logging
 import numpy
 import time
 import sys
+import threading
 import katpoint
 
 from collections import namedtuple
 
-from .utility import get_lst, datetime2timestamp, timestamp2datetime
+from .timeconv import to_ephem_date, to_timestamp
+from .utility import get_lst
 
 global simobserver
 simobserver = ephem.Observer()
@@ -32,6 +34,8 @@ _AZ_SPEED_DEG_PER_SEC = 2.0
 _AZ_ACCEL_DEG_PER_SEC_SQ = 1.0
 _AZ_LONG_SLEW_DEG = 0.0
 _AZ_LONG_SLEW_SETTLE_TIME_SEC = 6.1
+# Window over which moving body ephemerides are tabulated
+_EPHEM_TABLE_WINDOW_SEC = 24. * 3600.
 
 
 def setobserver(update):
@@ -153,15 +157,20 @@ class SimSession(object):
         self.obs_params = kat.obs_params
         self.kat = kat
         self.track_ = False
-        self.start_time = datetime2timestamp(simobserver.date.datetime())
+        self.start_time = to_timestamp(simobserver.date)
         if "durations" in self.obs_params:
             if "start_time" in self.obs_params["durations"]:
-                self.start_time = datetime2timestamp(
+                self.start_time = to_timestamp(
                     self.obs_params["durations"]["start_time"]
                 )
         self.time = self.start_time
         self.katpt_current = None
         self.capture_initialised = False
+        # simulated time at which work in background threads completes
+        self._main_thread = threading.current_thread()
+        self._background_time = self.time
+        # interpolated ephemerides for moving bodies, keyed on target description
+        self._ephem_tables = {}
 
         # Taken from mkat_session.py to ensure similar behaviour than site
         # systems
@@ -172,13 +181,18 @@ class SimSession(object):
             """Simulate sleep.
 
             Simulate the sleep functionality, a wait for a specified
-            number of seconds until next telescope action
+            number of seconds until next telescope action.
+            Sleeps in background threads run concurrently with the
+            main thread and do not advance the session time
 
             """
+            if threading.current_thread() is not self._main_thread:
+                self._background_time = (max(self._background_time, self.time)
+                                         + seconds)
+                return
             self.time += seconds
             global simobserver
-            now = timestamp2datetime(self.time)
-            simobserver.date = ephem.Date(now)
+            simobserver.date = to_ephem_date(self.time)
 
         time.sleep = simsleep
 
@@ -216,6 +230,12 @@ class SimSession(object):
             user_logger.info('INIT')
             self.capture_initialised = True
 
+    def capture_start(self):
+        """Simulate data capture start, waits for background initialisation."""
+        wait = self._background_time - self.time
+        if wait > 0:
+            time.sleep(wait)
+
     def track(self, target, duration=0, announce=False, slew_only=False):
         """Simulate the track source functionality during observations.
 
@@ -365,11 +385,44 @@ class SimSession(object):
             The elevation co-ordinate of the target in degrees.
 
         """
-        az, el = target.azel(simobserver.date)
+        if target.body_type in ("special", "xephem") and target.antenna is not None:
+            timestamp = to_timestamp(simobserver.date)
+            az, el = self._ephem_table(target, timestamp).azel(timestamp)
+        else:
+            az, el = target.azel(simobserver.date)
         az = katpoint.rad2deg(az)
         el = katpoint.rad2deg(el)
         return az, el
 
+    def _ephem_table(self, target, timestamp):
+        """Get the interpolated ephemeris table of a moving target.
+
+        Tables are built on first use and rebuilt once the simulated time
+        leaves the tabulated window.
+
+        Parameters
+        ----------
+        target: katpoint.Target
+            Special or xephem target with antenna set.
+        timestamp: float
+            Time at which the ephemeris is needed.
+
+        Returns
+        -------
+        table: `astrokat.targets.EphemerisTable`
+
+        """
+        from .targets import EphemerisTable
+
+        table = self._ephem_tables.get(target.description)
+        if table is None or not table.covers(timestamp):
+            table = EphemerisTable(target.body,
+                                   target.antenna.observer,
+                                   timestamp,
+                                   timestamp + _EPHEM_TABLE_WINDOW_SEC)
+            self._ephem_tables[target.description] = table
+        return table
+
     def _fake_slew_(self, target):
         slew_time = 0
         az, el = self._target_azel(target)
@@ -377,8 +430,10 @@ class SimSession(object):
             if self.katpt_current is None:
                 slew_time = _DEFAULT_SLEW_TIME_SEC
             else:
-                user_logger.debug("Slewing to {}".format(target.name))
                 slew_time = self._slew_time(az, el)
+            # slew start and duration for timeline reports
+            user_logger.debug("Slewing to {} at {:.3f} for {:.3f} sec"
+                              .format(target.name, time.time(), slew_time))
             self.katpt_current = target
         return slew_time, az, el
 
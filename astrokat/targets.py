@@ -1,19 +1,17 @@
-from astropy import units as u
-from astropy.coordinates import Galactic, ICRS
-from astropy.coordinates import SkyCoord, AltAz
-from astropy.coordinates import (solar_system_ephemeris,
-                                 get_body)
-from astropy.coordinates import Longitude, Latitude, EarthLocation
-from astropy.time import Time
-
+import ephem
+import hashlib
+import katpoint
 import numpy as np
+import os
+import six
+import tempfile
 
 try:
     from katcorelib import user_logger
 except ImportError:
     from .simulate import user_logger
 
-from .utility import datetime2timestamp, timestamp2datetime
+from .timeconv import to_ephem_date, to_timestamp
 
 # target description definition
 tgt_desc = {
@@ -52,10 +50,57 @@ tgt_desc = {
 # do not follow standard celestial orbits.
 SUPPORTED_COORDINATE_TYPES = ["radec", "azel", "gal", "special", "xephem"]
 
+# mosaic pointing grid layouts and sky projections (katpoint projection codes)
+MOSAIC_GRIDS = ["hex", "square"]
+MOSAIC_PROJECTIONS = list(katpoint.plane_to_sphere.keys())
+
+# astropy is slow to import and only imported when a conversion needs it,
+# the common radec and gal cases use the ephem/numpy fast path below
+
+# Galactic (l, b) to ICRS rotation, columns are the galactic unit vectors in ICRS
+# (matches the astropy Galactic -> ICRS transform to well below 1 mas)
+_GALACTIC_TO_ICRS = np.array(
+    [[-0.0548756577125922, 0.4941094371927267, -0.8676661375596585],
+     [-0.8734370519556162, -0.4448297212232957, -0.1980763372730006],
+     [-0.4838350736167156, 0.7469821839866677, 0.4559838136873021]])
+
 
 # -- library function --
+def _sexagesimal(value, precision=3, alwayssign=False):
+    """Format float(s) (hours or degrees) as padded XX:MM:SS.f string(s)"""
+    values = np.asarray(value, dtype=float)
+    scale = 10 ** precision
+    # round once on the total so that 59.9999 sec carries into the minutes
+    total = np.round(np.abs(values) * 3600. * scale).astype(np.int64)
+    seconds, fraction = np.divmod(total, scale)
+    minutes, seconds = np.divmod(seconds, 60)
+    degrees, minutes = np.divmod(minutes, 60)
+    signs = np.where(values < 0, "-", "+" if alwayssign else "")
+    str_format = "%s%02d:%02d:%02d.%0" + str(precision) + "d"
+    strings = [str_format % fields
+               for fields in zip(np.atleast_1d(signs).tolist(),
+                                 np.atleast_1d(degrees).tolist(),
+                                 np.atleast_1d(minutes).tolist(),
+                                 np.atleast_1d(seconds).tolist(),
+                                 np.atleast_1d(fraction).tolist())]
+    if values.ndim == 0:
+        return strings[0]
+    return strings
+
+
+def radec_deg_to_string(ra_deg, dec_deg):
+    """ICRS string format HH:MM:SS.f, DD:MM:SS.f from float degrees
+
+    Fast path equivalent of `radec_to_string` without astropy Angle objects
+    """
+    ra_str = _sexagesimal((ra_deg % 360.) / 15.)
+    dec_str = _sexagesimal(dec_deg, alwayssign=True)
+    return ra_str, dec_str
+
+
 def radec_to_string(ra_float, dec_float):
     """ICRS string format HH:MM:SS.f, DD:MM:SS.f"""
+    from astropy import units as u
     ra_str = ra_float.to_string(unit=u.hourangle,
                                 sep=':',
                                 precision=3,
@@ -73,10 +118,12 @@ def radec_from_pointing_object(pointing,
                                as_radians=False,
                                as_string=False):
     """Astropy object to ICRS format as strings"""
+    from astropy.coordinates import ICRS
     pnt_radec = pointing.transform_to(ICRS())
     if as_string:
-        ra_hms, dec_dms = radec_to_string(pnt_radec.ra,
-                                          pnt_radec.dec)
+        # also formats arrays of coordinates, returned as lists of strings
+        ra_hms, dec_dms = radec_deg_to_string(pnt_radec.ra.deg,
+                                              pnt_radec.dec.deg)
         return ra_hms, dec_dms
     elif as_radians:
         return pnt_radec.ra.rad, pnt_radec.dec.rad
@@ -99,6 +146,12 @@ def unpack_target_coords(target_coord):
 
 
 # -- coordinate conversion utilities --
+def _obs_time(timestamp):
+    """Astropy UTC `Time` directly from Unix timestamp(s), keeping sub-seconds"""
+    from astropy.time import Time
+    return Time(np.asarray(timestamp, dtype=float), format="unix", scale="utc")
+
+
 def observer_as_earth_location(observer):
     """Reference position is given in geodetic coordinates (lat, lon, height)
 
@@ -110,6 +163,8 @@ def observer_as_earth_location(observer):
     -------
     location: Geocentric location as `Astropy.EarthLocation`
     """
+    from astropy import units as u
+    from astropy.coordinates import Longitude, Latitude, EarthLocation
 
     location = EarthLocation.from_geodetic(Longitude(str(observer.lon),
                                                      u.degree,
@@ -133,19 +188,25 @@ def radec_to_altaz(ra_hms, dec_dms, location, timestamp,
     ra_hms: RA string HH:MM:SS.f
     dec_dms: Decl string DD:MM:SS.f
     location: Telescope geocentric position, `Astropy.EarthLocaton`
-    timestamp: Unix timestamp
+    timestamp: Unix timestamp, float or array
 
     Returns
     -------
-    tuple: (alt, az) horizontal coordinates in degrees
+    tuple: (alt, az) horizontal coordinates in degrees,
+           arrays matching the timestamp shape
     """
+    from astropy import units as u
+    from astropy.coordinates import SkyCoord, AltAz
 
-    obs_time = timestamp2datetime(timestamp)
-    obs_time = obs_time.strftime("%Y-%m-%d %H:%M:%S")
-    obs_time = Time(obs_time)
+    obs_time = _obs_time(timestamp)
     observer = AltAz(location=location, obstime=obs_time)
 
-    target = SkyCoord(ra=ra_hms, dec=dec_dms, frame='icrs')
+    target = SkyCoord(ra=ra_hms, dec=dec_dms, unit=(u.hourangle, u.deg), frame='icrs')
+    if obs_time.shape:
+        # single target over a series of times
+        target = SkyCoord(ra=np.full(obs_time.shape, target.ra.deg) * u.deg,
+                          dec=np.full(obs_time.shape, target.dec.deg) * u.deg,
+                          frame='icrs')
     tgt_altaz = target.transform_to(observer)
     if as_radians:
         return tgt_altaz.alt.rad, tgt_altaz.az.rad
@@ -163,17 +224,18 @@ def altaz_to_radec(az_deg, el_deg, location, timestamp,
     az_deg: Azimuth angle, float degrees
     el_deg: Elevation angle, float degrees
     location: Telescope geocentric position, `Astropy.EarthLocaton`
-    timestamp: Unix timestamp
+    timestamp: Unix timestamp, float or array
 
     Returns
     -------
-    tuple: (ra, dec) equatorial coordinates in degrees
+    tuple: (ra, dec) equatorial coordinates in degrees,
+           arrays (lists of strings) matching the timestamp shape
     """
+    from astropy import units as u
+    from astropy.coordinates import AltAz
 
-    obs_time = timestamp2datetime(timestamp)
-    obs_time = obs_time.strftime("%Y-%m-%d %H:%M:%S")
-    obs_time = Time(obs_time)
-
+    obs_time = _obs_time(timestamp)
+    az_deg, el_deg = np.broadcast_arrays(az_deg, el_deg, obs_time.jd1)[:2]
     pointing = AltAz(alt=el_deg * u.deg,
                      az=az_deg * u.deg,
                      location=location,
@@ -198,12 +260,20 @@ def galactic_to_radec(l_deg, b_deg,
     -------
     tuple: (ra, dec) equatorial coordinates in degrees
     """
-    gal_coord = SkyCoord(l=l_deg * u.degree,  # noqa
-                         b=b_deg * u.degree,  # noqa
-                         frame=Galactic)
-    return radec_from_pointing_object(gal_coord,
-                                      as_radians=as_radians,
-                                      as_string=as_string)
+    # fixed rotation, no need for the astropy frame machinery
+    l_rad, b_rad = np.radians(l_deg), np.radians(b_deg)
+    gal_xyz = np.array([np.cos(b_rad) * np.cos(l_rad),
+                        np.cos(b_rad) * np.sin(l_rad),
+                        np.sin(b_rad)])
+    x, y, z = _GALACTIC_TO_ICRS.dot(gal_xyz)
+    ra_rad = np.arctan2(y, x) % (2. * np.pi)
+    dec_rad = np.arctan2(z, np.hypot(x, y))
+    if as_string:
+        return radec_deg_to_string(np.degrees(ra_rad), np.degrees(dec_rad))
+    elif as_radians:
+        return ra_rad, dec_rad
+    else:
+        return np.degrees(ra_rad), np.degrees(dec_rad)
 
 
 def solarbody_to_radec(body, location, timestamp,
@@ -215,24 +285,143 @@ def solarbody_to_radec(body, location, timestamp,
     ----------
     body: Name of solar body, Astropy convention
     location: Telescope geocentric position, `Astropy.EarthLocaton`
-    timestamp: Unix timestamp
+    timestamp: Unix timestamp, float or array
 
     Returns
     -------
-    tuple: (ra, dec) equatorial coordinates in degrees
+    tuple: (ra, dec) equatorial coordinates in degrees,
+           arrays (lists of strings) matching the timestamp shape
     """
-    obs_time = timestamp2datetime(timestamp)
-    obs_time = obs_time.strftime("%Y-%m-%d %H:%M:%S")
-    obs_time = Time(obs_time)
+    from astropy.coordinates import solar_system_ephemeris, get_body
 
     with solar_system_ephemeris.set('builtin'):
-        solar_gcrs = get_body(body, obs_time, location)
+        solar_gcrs = get_body(body, _obs_time(timestamp), location)
     return radec_from_pointing_object(solar_gcrs,
                                       as_radians=as_radians,
                                       as_string=as_string)
+
+
+class EphemerisTable(object):
+    """Interpolated ephemeris of a moving (special or xephem) body.
+
+    The apparent topocentric (ra, dec) of the body is sampled once over the
+    observation window and interpolated linearly, so that horizon checks and
+    slew estimates for moving targets cost as little as for fixed targets.
+    The sample step is halved until the estimated interpolation error is
+    below the requested tolerance.
+
+    Parameters
+    ----------
+    body: `ephem.Body`, e.g. `katpoint.Target.body`
+    observer: `ephem.Observer`, e.g. `katpoint.Antenna.observer`
+    start_time: Unix timestamp at start of observation window
+    end_time: Unix timestamp at end of observation window
+    step: float, initial sample interval [sec]
+    tolerance: float, maximum interpolation error [arcsec]
+    """
+
+    def __init__(self, body, observer, start_time, end_time,
+                 step=300., tolerance=1.):
+        self.start_time = float(start_time)
+        self.end_time = max(float(end_time), self.start_time + step)
+        self.latitude = float(observer.lat)
+        body = body.copy()
+        observer = observer.copy()
+        tolerance = np.radians(tolerance / 3600.)
+        while True:
+            nsamples = int(np.ceil((self.end_time - self.start_time) / step)) + 1
+            timestamps = self.start_time + step * np.arange(nsamples)
+            ra = np.empty(nsamples)
+            dec = np.empty(nsamples)
+            lst = np.empty(nsamples)
+            for cnt, timestamp in enumerate(timestamps):
+                observer.date = to_ephem_date(timestamp)
+                body.compute(observer)
+                ra[cnt] = body.ra
+                dec[cnt] = body.dec
+                lst[cnt] = observer.sidereal_time()
+            ra = np.unwrap(ra)
+            # linear interpolation error is bounded by 1/8 of the second difference
+            if nsamples > 2:
+                max_error = max(np.abs(np.diff(ra, 2)).max(),
+                                np.abs(np.diff(dec, 2)).max()) / 8.
+            else:
+                max_error = 0.
+            if max_error <= tolerance or step <= 1.:
+                break
+            step /= 2.
+        self.step = step
+        self.max_error = np.degrees(max_error) * 3600.  # arcsec
+        self.timestamps = timestamps
+        self.ra = ra
+        self.dec = dec
+        self.lst = np.unwrap(lst)
+
+    def covers(self, timestamps):
+        """True if all timestamps fall inside the tabulated window"""
+        timestamps = np.asarray(timestamps, dtype=float)
+        return bool(np.all((timestamps >= self.timestamps[0])
+                           & (timestamps <= self.timestamps[-1])))
+
+    def radec(self, timestamps):
+        """Apparent topocentric (ra, dec) in radians at Unix timestamp(s)"""
+        ra = np.interp(timestamps, self.timestamps, self.ra) % (2. * np.pi)
+        dec = np.interp(timestamps, self.timestamps, self.dec)
+        return ra, dec
+
+    def azel(self, timestamps):
+        """Horizontal (az, el) in radians at Unix timestamp(s)"""
+        ra, dec = self.radec(timestamps)
+        hour_angle = np.interp(timestamps, self.timestamps, self.lst) - ra
+        sin_lat, cos_lat = np.sin(self.latitude), np.cos(self.latitude)
+        el = np.arcsin(sin_lat * np.sin(dec)
+                       + cos_lat * np.cos(dec) * np.cos(hour_angle))
+        az = np.arctan2(-np.sin(hour_angle) * np.cos(dec),
+                        cos_lat * np.sin(dec)
+                        - sin_lat * np.cos(dec) * np.cos(hour_angle))
+        return az % (2. * np.pi), el
 # -- coordinate conversion utilities --
 
 
+def _radec_string_to_deg(radec_str):
+    """Parse 'ra dec' input string to ICRS (ra, dec) in degrees
+
+    Decimal degrees and colon separated sexagesimal inputs are parsed with
+    numpy/ephem, any other format is handed to astropy
+    """
+    ra_str, dec_str = [coord.strip() for coord in radec_str.split()]
+    try:
+        ra_deg, dec_deg = np.array([ra_str, dec_str], dtype=float)
+    except ValueError:
+        try:
+            ra_deg = np.degrees(float(ephem.hours(ra_str)))
+            dec_deg = np.degrees(float(ephem.degrees(dec_str)))
+        except ValueError:
+            ra_deg = dec_deg = None
+    if ra_deg is not None and abs(dec_deg) <= 90.:
+        return ra_deg % 360., dec_deg
+
+    # unusual formats and invalid values go via astropy for parsing and errors
+    from astropy import units as u
+    from astropy.coordinates import SkyCoord
+    try:
+        ra_deg, dec_deg = np.array([ra_str, dec_str], dtype=float)
+        pointing = SkyCoord(ra=ra_deg * u.degree,
+                            dec=dec_deg * u.degree,
+                            frame='icrs')
+    except ValueError:
+        pointing = SkyCoord(ra=ra_str,
+                            dec=dec_str,
+                            unit=(u.hourangle, u.deg),
+                            frame='icrs')
+    return pointing.ra.deg, pointing.dec.deg
+
+
+def _radec_string_to_hms_dms(radec_str):
+    """Normalise 'ra dec' input to ICRS string format HH:MM:SS.f, DD:MM:SS.f"""
+    return radec_deg_to_string(*_radec_string_to_deg(radec_str))
+
+
 def get_coordinates_as_radec(target_str, observer=None, convert_azel=False):
     """If celestial target is not (Ra, Dec) convert and return (Ra, Dec)"""
 
@@ -243,18 +432,7 @@ def get_coordinates_as_radec(target_str, observer=None, convert_azel=False):
     # a fundamental assumption will be that the user will give coordinates
     # in degrees, thus all input and output are in degrees
     if tgt_type == 'radec':
-        try:
-            ra_deg, dec_deg = np.array(tgt_coord.split(), dtype=float)
-            pointing = SkyCoord(ra=ra_deg * u.degree,
-                                dec=dec_deg * u.degree,
-                                frame='icrs')
-        except ValueError:
-            ra_str, dec_str = tgt_coord.split()
-            pointing = SkyCoord(ra=ra_str.strip(),
-                                dec=dec_str.strip(),
-                                unit=(u.hourangle, u.deg),
-                                frame='icrs')
-        ra_hms, dec_dms = radec_to_string(pointing.ra, pointing.dec)
+        ra_hms, dec_dms = _radec_string_to_hms_dms(tgt_coord)
         tgt_coord = '{} {}'.format(ra_hms, dec_dms)
     elif tgt_type == 'gal':
         l_deg, b_deg = np.array(tgt_coord.split(), dtype=float)
@@ -267,7 +445,7 @@ def get_coordinates_as_radec(target_str, observer=None, convert_azel=False):
         if observer is None:
             raise RuntimeError('(alt, az) -> (ra, dec) need observer input')
         location = observer_as_earth_location(observer)
-        timestamp = datetime2timestamp(observer.date.datetime())
+        timestamp = to_timestamp(observer.date)
         az_deg, el_deg = np.array(tgt_coord.split(), dtype=float)
         user_logger.debug(
             "DEBUG: (az, el) to (ra, dec) conversion @ "
@@ -428,6 +606,13 @@ def read(target_items, observer=None):
     Update all targets to have celestial (Ra, Dec) coordinates
 
     """
+    if hasattr(target_items, "chunks"):
+        # streamed target list, see `astrokat.utility.StreamedTargetList`
+        target_tables = [read(chunk, observer=observer)
+                         for chunk in target_items.chunks()]
+        if not target_tables:
+            return np.recarray(0, dtype=tgt_desc)
+        return np.concatenate(target_tables).view(np.recarray)
     ntargets = len(target_items)
     target_rec_array = np.recarray(ntargets, dtype=tgt_desc)
     for cnt, target_item in enumerate(target_items):
@@ -445,4 +630,283 @@ def read(target_items, observer=None):
     return target_rec_array
 
 
+# -- mosaic pointing grids --
+def mosaic_offsets(extent, spacing, grid="hex"):
+    """Tangent plane offsets of a mosaic pointing grid centred on (0, 0)
+
+    Parameters
+    ----------
+    extent: float or (width, height), mosaic size in degrees
+    spacing: float, distance between neighbouring pointings in degrees
+    grid: 'hex' (hexagonal, alternate rows shifted by half a spacing)
+          or 'square'
+
+    Returns
+    -------
+    tuple: (x, y) offset arrays in degrees, ordered by row then column
+    """
+    if grid not in MOSAIC_GRIDS:
+        raise RuntimeError("Unknown mosaic grid '{}', options are {}"
+                           .format(grid, MOSAIC_GRIDS))
+    spacing = float(spacing)
+    if spacing <= 0:
+        raise RuntimeError("Mosaic spacing must be positive")
+    width, height = np.broadcast_to(np.asarray(extent, dtype=float), (2,))
+    row_spacing = spacing * np.sqrt(3.) / 2. if grid == "hex" else spacing
+    # slightly relaxed limits so that pointings on the edge are kept
+    nrows = int(np.floor(height / 2. / row_spacing + 1e-9))
+    ncols = int(np.floor(width / 2. / spacing + 1e-9)) + 1
+    rows = np.arange(-nrows, nrows + 1)
+    cols = np.arange(-ncols, ncols + 1)
+    col_idx, row_idx = np.meshgrid(cols, rows)
+    x = col_idx * spacing
+    if grid == "hex":
+        # the centre row holds the centre pointing, odd rows are shifted
+        x = x + (row_idx % 2) * spacing / 2.
+    y = row_idx * row_spacing
+    inside = np.abs(x) <= width / 2. + 1e-9 * spacing
+    return x[inside], y[inside]
+
+
+def mosaic(centre, extent, spacing, grid="hex", projection="SIN"):
+    """Equatorial (ra, dec) pointings of a mosaic around a centre
+
+    Parameters
+    ----------
+    centre: 'ra dec' string (same formats as radec target input)
+            or (ra, dec) tuple in degrees
+    extent: float or (width, height), mosaic size in degrees
+    spacing: float, distance between neighbouring pointings in degrees
+    grid: 'hex' or 'square'
+    projection: sky projection of the tangent plane grid, e.g. 'SIN', 'TAN'
+
+    Returns
+    -------
+    tuple: (ra, dec) arrays in degrees
+    """
+    if projection not in katpoint.plane_to_sphere:
+        raise RuntimeError("Unknown mosaic projection '{}', options are {}"
+                           .format(projection, MOSAIC_PROJECTIONS))
+    if isinstance(centre, str):
+        ra0_deg, dec0_deg = _radec_string_to_deg(centre)
+    else:
+        ra0_deg, dec0_deg = centre
+    x, y = mosaic_offsets(extent, spacing, grid=grid)
+    ra, dec = katpoint.plane_to_sphere[projection](np.radians(ra0_deg),
+                                                   np.radians(dec0_deg),
+                                                   np.radians(x),
+                                                   np.radians(y))
+    return np.degrees(ra) % 360., np.degrees(dec)
+
+
+def mosaic_targets(name,
+                   centre,
+                   extent,
+                   spacing,
+                   duration,
+                   grid="hex",
+                   projection="SIN",
+                   tags="target",
+                   cadence=-1,
+                   obs_type="track",
+                   noise_diode=None):
+    """Expand a mosaic definition into an observation target rec-array
+
+    Pointings are named <name>_<number> and inserted directly into the
+    target table, bypassing target string parsing.
+
+    Parameters
+    ----------
+    name: str, mosaic name used as prefix for the pointing names
+    centre, extent, spacing, grid, projection: see `mosaic`
+    duration: float, observation time per pointing [sec]
+    tags, cadence, obs_type, noise_diode: per pointing observation keys,
+        as for target list entries
+
+    Returns
+    -------
+    target_rec_array: `numpy.recarray` with `tgt_desc` fields
+    """
+    ra_deg, dec_deg = mosaic(centre, extent, spacing,
+                             grid=grid, projection=projection)
+    ra_hms = _sexagesimal(ra_deg / 15.)
+    dec_dms = _sexagesimal(dec_deg, alwayssign=True)
+    npointings = len(ra_hms)
+    width = len(str(npointings))
+    name_format = "{}_%0{}d".format(name, width)
+    names = [name_format % cnt for cnt in range(npointings)]
+
+    target_rec_array = np.recarray(npointings, dtype=tgt_desc)
+    target_rec_array["name"] = names
+    target_rec_array["tags"] = tags
+    target_rec_array["target"] = [
+        "%s, radec %s, %s, %s, ()" % (tgt_name, tags, ra, dec)
+        for tgt_name, ra, dec in zip(names, ra_hms, dec_dms)]
+    target_rec_array["target_str"] = [
+        "radec=%s %s" % coord for coord in zip(ra_hms, dec_dms)]
+    target_rec_array["duration"] = float(duration)
+    target_rec_array["cadence"] = float(cadence)
+    target_rec_array["flux_model"] = [()] * npointings
+    target_rec_array["obs_type"] = obs_type
+    target_rec_array["noise_diode"] = noise_diode
+    target_rec_array["last_observed"] = None
+    target_rec_array["obs_cntr"] = 0
+    user_logger.debug("DEBUG: mosaic {} expanded to {} pointings"
+                      .format(name, npointings))
+    return target_rec_array
+
+
+def read_mosaic(mosaic_items):
+    """Read mosaic definitions from YAML input
+
+    Parameters
+    ----------
+    mosaic_items: dict or list of dicts with `mosaic_targets` parameters,
+                  where 'type' and 'nd' are accepted as for target strings
+
+    Returns
+    -------
+    target_rec_array: `numpy.recarray` with `tgt_desc` fields
+    """
+    if isinstance(mosaic_items, dict):
+        mosaic_items = [mosaic_items]
+    tables = []
+    for mosaic_item in mosaic_items:
+        mosaic_item = dict(mosaic_item)
+        if "type" in mosaic_item:
+            mosaic_item["obs_type"] = mosaic_item.pop("type")
+        if "nd" in mosaic_item:
+            mosaic_item["noise_diode"] = str(mosaic_item.pop("nd"))
+        for key in ["name", "centre", "extent", "spacing", "duration"]:
+            if key not in mosaic_item:
+                raise RuntimeError("Mosaic definition needs '{}' parameter"
+                                   .format(key))
+        tables.append(mosaic_targets(**mosaic_item))
+    return np.concatenate(tables).view(np.recarray)
+# -- mosaic pointing grids --
+
+
+# -- parsed target cache --
+def _cache_dir(cache_dir=None):
+    """Directory for parsed target tables, `ASTROKAT_CACHE_DIR` overrides default"""
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            "ASTROKAT_CACHE_DIR",
+            os.path.join(os.path.expanduser("~"), ".cache", "astrokat"))
+    return cache_dir
+
+
+# object columns are cached as strings, with None and empty values flagged
+_CACHE_STR = 0
+_CACHE_NONE = 1
+_CACHE_EMPTY = 2
+
+
+def _encode_column(values):
+    """Object column as string array and value kind flags"""
+    strings = []
+    kinds = np.zeros(len(values), dtype=np.int8)
+    for cnt, value in enumerate(values):
+        if value is None:
+            kinds[cnt] = _CACHE_NONE
+            value = ""
+        elif isinstance(value, tuple) and not value:
+            kinds[cnt] = _CACHE_EMPTY
+            value = ""
+        elif not isinstance(value, six.string_types):
+            raise ValueError("Cannot cache target value {!r}".format(value))
+        strings.append(value)
+    return np.array(strings, dtype="U"), kinds
+
+
+def _decode_column(strings, kinds):
+    """Object column values from cached strings and kind flags"""
+    values = np.empty(len(strings), dtype=object)
+    for cnt, (value, kind) in enumerate(zip(strings.tolist(), kinds.tolist())):
+        if kind == _CACHE_NONE:
+            value = None
+        elif kind == _CACHE_EMPTY:
+            value = ()
+        values[cnt] = value
+    return values
+
+
+def cache_key(*key_items):
+    """Content hash identifying a parsed target table
+
+    Parameters
+    ----------
+    key_items: items that determine the parsed output, such as the YAML file
+               content hash, astrokat version, conversion start time and
+               the observer location for (az, el) targets
+
+    Returns
+    -------
+    key: hex digest string
+    """
+    hasher = hashlib.sha1()
+    for item in key_items:
+        hasher.update(str(item).encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def load_cached(key, cache_dir=None):
+    """Parsed target table from cache, None if not available"""
+    filename = os.path.join(_cache_dir(cache_dir), "{}.npz".format(key))
+    try:
+        # no pickled objects, the cache directory is not trusted
+        with np.load(filename, allow_pickle=False) as cached:
+            target_rec_array = np.recarray(len(cached["name"]), dtype=tgt_desc)
+            for field in target_rec_array.dtype.names:
+                if target_rec_array.dtype[field] == object:
+                    target_rec_array[field] = _decode_column(
+                        cached[field], cached["{}_kind".format(field)])
+                else:
+                    target_rec_array[field] = cached[field]
+    except (IOError, OSError, KeyError, ValueError) as err:
+        if os.path.isfile(filename):
+            user_logger.debug("DEBUG: ignoring unreadable target cache "
+                              "{} ({})".format(filename, err))
+        return None
+    user_logger.debug("DEBUG: parsed targets read from cache {}".format(filename))
+    return target_rec_array
+
+
+def save_cached(key, target_rec_array, cache_dir=None):
+    """Write parsed target table to cache, failures are not fatal"""
+    cache_dir = _cache_dir(cache_dir)
+    filename = os.path.join(cache_dir, "{}.npz".format(key))
+    tmp_filename = None
+    try:
+        columns = {}
+        for field in target_rec_array.dtype.names:
+            if target_rec_array.dtype[field] == object:
+                (columns[field],
+                 columns["{}_kind".format(field)]) = _encode_column(
+                    target_rec_array[field])
+            else:
+                columns[field] = np.asarray(target_rec_array[field])
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write to a temporary file and rename so that concurrent runs
+        # never see partially written cache files
+        fd, tmp_filename = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, **columns)
+        os.rename(tmp_filename, filename)
+        tmp_filename = None
+    except (IOError, OSError, ValueError) as err:
+        user_logger.debug("DEBUG: unable to write target cache "
+                          "{} ({})".format(filename, err))
+        return None
+    finally:
+        # never leave partial cache files behind
+        if tmp_filename is not None and os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+    user_logger.debug("DEBUG: parsed targets written to cache {}".format(filename))
+    return filename
+# -- parsed target cache --
+
+
 # -fin-
@@ -0,0 +1,211 @@
+"""Test F-engine configuration."""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from argparse import Namespace
+
+from astrokat import correlator, observe_main
+
+
+class FakeReply(object):
+    """KATCP reply."""
+
+    def __init__(self, *arguments):
+        self.arguments = ("ok",) + arguments
+
+    def reply_ok(self):
+        return True
+
+
+class FakeFailReply(FakeReply):
+    """Failed KATCP reply."""
+
+    def __init__(self, *arguments):
+        self.arguments = ("fail",) + arguments
+
+    def reply_ok(self):
+        return False
+
+
+class FakeFEngine(object):
+    """Records F-engine requests."""
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.current_gains = dict.fromkeys(inputs, 1.0)
+        self.current_fft_shift = 2047
+        self.gains = {}
+        self.fft_shifts = []
+        self.threads = set()
+        self.failing = set()
+        self.fft_shift_fails = False
+        self.req = Namespace(gain=self._gain, fft_shift=self._fft_shift)
+
+    def _gain(self, inp, *gain):
+        if gain and inp in self.failing:
+            return (FakeFailReply("unknown input"), [])
+        if gain:
+            self.threads.add(threading.current_thread().name)
+            # KATCP arguments are strings, one per channel for per-channel gains
+            values = [correlator._gain_value(str(value)) for value in gain]
+            if len(values) == 1:
+                values = values[0]
+            self.gains[inp] = self.current_gains[inp] = values
+        values = self.current_gains[inp]
+        if not isinstance(values, list):
+            values = [values]
+        return (FakeReply(*[str(value) for value in values]), [])
+
+    def _fft_shift(self, *fft_shift):
+        if fft_shift and self.fft_shift_fails:
+            return (FakeFailReply("invalid shift"), [])
+        if fft_shift:
+            self.fft_shifts.append(fft_shift[0])
+            self.current_fft_shift = fft_shift[0]
+        return (FakeReply(str(self.current_fft_shift)), [])
+
+
+class TestSetFEngines(unittest.TestCase):
+    def setUp(self):
+        self.inputs = ["m{:03d}{}".format(ant, pol) for ant in range(8) for pol in "hv"]
+        self.fengine = FakeFEngine(self.inputs)
+        self.session = Namespace(cbf=Namespace(fengine=self.fengine))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_single_gain(self):
+        correlator.set_fengines(self.session, requant_gains=0.5, fft_shift=2047)
+        self.assertEqual(self.fengine.fft_shifts, [2047])
+        self.assertEqual(self.fengine.gains, dict.fromkeys(self.inputs, 0.5))
+        # gains are not set from the calling thread
+        self.assertNotIn(threading.current_thread().name, self.fengine.threads)
+
+    def test_gain_array(self):
+        gains = [float(cnt) for cnt in range(len(self.inputs))]
+        correlator.set_fengines(self.session, requant_gains=gains)
+        self.assertEqual([self.fengine.gains[inp] for inp in self.inputs], gains)
+        self.assertEqual(self.fengine.fft_shifts, [])
+        with self.assertRaises(RuntimeError):
+            correlator.set_fengines(self.session, requant_gains=gains[1:])
+
+    def test_gain_dict(self):
+        correlator.set_fengines(self.session, requant_gains={"m000h": 2.0})
+        self.assertEqual(self.fengine.gains, {"m000h": 2.0})
+        with self.assertRaises(RuntimeError):
+            correlator.set_fengines(self.session, requant_gains={"m999h": 2.0})
+
+    def test_gain_file(self):
+        gain_file = os.path.join(self.tmp_dir, "gains.txt")
+        with open(gain_file, "w") as fout:
+            fout.write("# input gain\nm000h 2.0\nm000v 1+1j\n\n")
+        correlator.set_fengines(self.session, requant_gains=gain_file)
+        self.assertEqual(self.fengine.gains, {"m000h": 2.0, "m000v": 1 + 1j})
+
+    def test_failed_gain_request(self):
+        self.fengine.failing.add("m000h")
+        with self.assertRaises(RuntimeError):
+            correlator.set_fengines(self.session, requant_gains=0.5)
+        # other inputs are still set
+        self.assertEqual(set(self.fengine.gains), set(self.inputs) - {"m000h"})
+
+    def test_failed_fft_shift_request(self):
+        self.fengine.fft_shift_fails = True
+        with self.assertRaises(RuntimeError):
+            correlator.set_fengines(self.session, requant_gains=0.5, fft_shift=1023)
+        self.assertEqual(self.fengine.current_fft_shift, 2047)
+        # gains are not set after a failed FFT shift
+        self.assertEqual(self.fengine.gains, {})
+
+    def test_no_inputs(self):
+        self.fengine.inputs = []
+        with self.assertRaises(RuntimeError):
+            correlator.set_fengines(self.session, requant_gains=1.0)
+
+
+class TestUpdateFEngines(unittest.TestCase):
+    def setUp(self):
+        self.inputs = ["m000h", "m000v", "m001h", "m001v"]
+        self.fengine = FakeFEngine(self.inputs)
+        self.session = Namespace(cbf=Namespace(fengine=self.fengine))
+
+    def test_snapshot(self):
+        self.fengine.current_gains["m001v"] = 2 + 1j
+        state = correlator.fengine_snapshot(self.session)
+        self.assertEqual(state["fft_shift"], 2047)
+        self.assertEqual(state["requant_gains"]["m000h"], 1.0)
+        self.assertEqual(state["requant_gains"]["m001v"], 2 + 1j)
+        # reading the state does not set anything
+        self.assertEqual(self.fengine.gains, {})
+        self.assertEqual(self.fengine.fft_shifts, [])
+
+    def test_only_differences_sent(self):
+        entry = correlator.fengine_snapshot(self.session)
+        state = correlator.update_fengines(self.session,
+                                           entry,
+                                           requant_gains=[1.0, 1.0, 3.0, 1.0],
+                                           fft_shift=2047)
+        self.assertEqual(self.fengine.gains, {"m001h": 3.0})
+        self.assertEqual(self.fengine.fft_shifts, [])
+        self.assertEqual(state["requant_gains"]["m001h"], 3.0)
+        self.assertEqual(entry["requant_gains"]["m001h"], 1.0)
+
+    def test_restore(self):
+        entry = correlator.fengine_snapshot(self.session)
+        state = correlator.update_fengines(self.session,
+                                           entry,
+                                           requant_gains={"m000v": 5.0},
+                                           fft_shift=1023)
+        self.fengine.gains = {}
+        correlator.update_fengines(self.session, state, **entry)
+        self.assertEqual(self.fengine.gains, {"m000v": 1.0})
+        self.assertEqual(self.fengine.fft_shifts, [1023, 2047])
+        self.assertEqual(correlator.fengine_snapshot(self.session), entry)
+
+    def test_restore_per_channel_gains(self):
+        self.fengine.current_gains["m000h"] = [1.0, 2.0, 1 + 1j]
+        entry = correlator.fengine_snapshot(self.session)
+        self.assertEqual(entry["requant_gains"]["m000h"], [1.0, 2.0, 1 + 1j])
+        state = correlator.update_fengines(self.session, entry, requant_gains=0.5)
+        self.assertEqual(self.fengine.current_gains["m000h"], 0.5)
+        self.fengine.gains = {}
+        correlator.update_fengines(self.session, state, **entry)
+        # per-channel gains restored as one request argument per channel
+        self.assertEqual(self.fengine.gains["m000h"], [1.0, 2.0, 1 + 1j])
+        self.assertEqual(correlator.fengine_snapshot(self.session), entry)
+
+    def test_restore_after_partial_failure(self):
+        entry = correlator.fengine_snapshot(self.session)
+        self.fengine.failing.add("m001h")
+        with self.assertRaises(RuntimeError):
+            correlator.update_fengines(self.session,
+                                       entry,
+                                       requant_gains=[2.0, 3.0, 4.0, 5.0],
+                                       fft_shift=1023)
+        self.fengine.failing.clear()
+        self.assertEqual(self.fengine.current_fft_shift, 1023)
+        self.assertEqual(self.fengine.current_gains["m000h"], 2.0)
+        correlator.restore_fengines(self.session, entry)
+        # only the settings that were applied are sent again
+        self.assertEqual(self.fengine.fft_shifts, [1023, 2047])
+        self.assertEqual(correlator.fengine_snapshot(self.session), entry)
+
+    def test_telescope_restore_after_partial_failure(self):
+        entry = correlator.fengine_snapshot(self.session)
+        telescope = observe_main.Telescope.__new__(observe_main.Telescope)
+        telescope.array = Namespace(dry_run=False)
+        telescope.feng = {"requant_gain": 2.0, "fft_shift": 1023}
+        telescope._feng_entry = None
+        self.fengine.failing.add("m001h")
+        with self.assertRaises(RuntimeError) as raised:
+            with telescope.fengine_restore(self.session):
+                telescope.correlator_setup(self.session)
+        # the setup error is reported, not a restore error
+        self.assertIn("gains failed", str(raised.exception))
+        self.assertEqual(correlator.fengine_snapshot(self.session), entry)
@@ -3,10 +3,15 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import re
+import threading
+import time
 import unittest
+from argparse import Namespace
 
+import numpy as np
 from mock import patch
 
+from astrokat import noisediode
 from .testutils import LoggedTelescope, execute_observe_main
 
 
@@ -64,12 +69,47 @@ class TestAstrokatYAML(unittest.TestCase):
 
         result = LoggedTelescope.user_logger_stream.getvalue()
         self.assertIn("No ND for target", result)
-        self.assertIn("noise-diode off at 1573714914.0", result)
+        self.assertIn("noise-diode off at 1573714911.0", result)
         self.assertIn("Restoring ND pattern", result)
         self.assertIn("noise diode pattern every 0.1 sec, with 0.05 sec on",
                       result)
         self.assertIn("noise-diode pattern on at 1573714803.0", result)
 
+    def test_nd_pattern_consecutive_off(self):
+        """Tests noisediode simulator."""
+        LoggedTelescope.reset_user_logger_stream()
+        execute_observe_main("test_nd/nd-pattern-consecutive-off.yaml")
+
+        result = LoggedTelescope.user_logger_stream.getvalue()
+        # ND only switched off once for consecutive targets without ND
+        self.assertEqual(result.count("No ND for target"), 2)
+        self.assertEqual(result.count("Report: noise-diode off"), 1)
+        self.assertEqual(result.count("Restoring ND pattern"), 1)
+        self.assertIn("noise-diode pattern on at 1573715091.0", result)
+
+    def test_nd_pattern_last_off(self):
+        """Tests noisediode simulator."""
+        LoggedTelescope.reset_user_logger_stream()
+        execute_observe_main("test_nd/nd-pattern-last-off.yaml")
+
+        result = LoggedTelescope.user_logger_stream.getvalue()
+        # pattern restored at the end of the loop
+        self.assertGreater(result.find("Restoring ND pattern"),
+                           result.find("No ND for target"))
+        self.assertEqual(result.count("Restoring ND pattern"), 1)
+
+    def test_nd_pattern_plus_trigger(self):
+        """Tests noisediode simulator."""
+        LoggedTelescope.reset_user_logger_stream()
+        execute_observe_main("test_nd/nd-pattern-plus-trigger.yaml")
+
+        result = LoggedTelescope.user_logger_stream.getvalue()
+        # pattern restored before the target after the trigger
+        self.assertGreater(result.find("Restoring ND pattern"),
+                           result.find("noise-diode off at 1573714856.0"))
+        self.assertEqual(result.count("Restoring ND pattern"), 1)
+        self.assertIn("noise-diode pattern on at 1573714919.0", result)
+
     def test_nd_trigger_long(self):
         """Tests noisediode simulator."""
         execute_observe_main("test_nd/nd-trigger-long.yaml")
@@ -77,8 +117,8 @@ class TestAstrokatYAML(unittest.TestCase):
         result = LoggedTelescope.user_logger_stream.getvalue()
         self.assertIn("Firing noise diode for 15.0s", result)
         self.assertIn("Add lead time of 5.0s", result)
-        self.assertIn("noise-diode on at 1573714853.0", result)
-        self.assertIn("noise-diode off at 1573714868.0", result)
+        self.assertIn("noise-diode on at 1573714850.0", result)
+        self.assertIn("noise-diode off at 1573714865.0", result)
 
     def test_nd_trigger_short(self):
         """Tests noisediode simulator."""
@@ -88,5 +128,125 @@ class TestAstrokatYAML(unittest.TestCase):
         self.assertIn("Firing noise diode for 2.0s", result)
         self.assertIn("Add lead time of 5.0s", result)
         self.assertIn("Set noise diode pattern", result)
-        self.assertIn("noise-diode pattern on at 1573714853.0", result)
-        self.assertIn("noise-diode off at 1573714858.0", result)
+        self.assertIn("noise-diode pattern on at 1573714850.0", result)
+        self.assertIn("noise-diode off at 1573714855.0", result)
+
+
+class FakeReply(object):
+    """Digitiser noise diode request reply."""
+
+    def __init__(self, *arguments):
+        self.arguments = arguments
+
+    def reply_ok(self):
+        return True
+
+
+class FakeDigitiserKat(object):
+    """Fake telescope that only replies when all requests are in flight."""
+
+    def __init__(self, ants):
+        self.dry_run = False
+        self.ants = [Namespace(name=ant) for ant in ants]
+        self.all_sent = threading.Event()
+        self.sent = []
+        self.in_sync = []
+        self._lock = threading.Lock()
+        for ant in ants:
+            req = Namespace(dig_noise_source=self._dig_noise_source)
+            setattr(self, ant, Namespace(req=req))
+
+    def _dig_noise_source(self, timestamp, on_fraction, cycle_length):
+        with self._lock:
+            self.sent.append(timestamp)
+            if len(self.sent) == len(self.ants):
+                self.all_sent.set()
+        self.in_sync.append(self.all_sent.wait(1.0))
+        return (FakeReply("ok", timestamp, on_fraction, cycle_length), [])
+
+
+class TestDigitiserRequests(unittest.TestCase):
+    """Tests noise diode requests to the digitisers."""
+
+    def tearDown(self):
+        noisediode.lead_time_estimator.reset()
+
+    def test_concurrent_requests(self):
+        ants = ["m{:03d}".format(cnt) for cnt in range(16)]
+        kat = FakeDigitiserKat(ants)
+        with patch("time.time", return_value=1573714800.0):
+            timestamp = noisediode._set_dig_nd_(kat, 1573714805.0, switch=1)
+        self.assertTrue(all(kat.in_sync))
+        self.assertEqual(len(kat.sent), len(ants))
+        self.assertEqual(timestamp, 1573714805.0)
+
+    def test_late_requests_skipped(self):
+        kat = FakeDigitiserKat(["m011", "m022"])
+        with patch("time.time", return_value=1573714805.0):
+            timestamp = noisediode._set_dig_nd_(kat, 1573714805.0, switch=1)
+        self.assertEqual(kat.sent, [])
+        self.assertTrue(np.isnan(timestamp))
+
+    def test_requests_update_lead_time(self):
+        kat = FakeDigitiserKat(["m011", "m022"])
+        self.assertEqual(noisediode._get_lead_time_(kat), 5.0)
+        self.assertEqual(noisediode._get_lead_time_(kat, 3.0), 3.0)
+        noisediode._set_dig_nd_(kat, time.time() + 5.0, switch=1)
+        # fast replies shorten the lead time to the lower bound
+        self.assertEqual(noisediode._get_lead_time_(kat), 1.0)
+
+
+class TestLeadTimeEstimator(unittest.TestCase):
+    """Tests adaptive noise diode lead time."""
+
+    def setUp(self):
+        self.estimator = noisediode.LeadTimeEstimator(min_lead_time=0.5,
+                                                      max_lead_time=8.0,
+                                                      margin=2.0)
+
+    def test_default_lead_time(self):
+        self.assertEqual(self.estimator.lead_time(64), 5.0)
+
+    def test_lead_time_estimate(self):
+        self.estimator.record(16, 0.4, offsets=[0.1, -0.2])
+        self.estimator.record(16, 0.3)
+        self.assertAlmostEqual(self.estimator.lead_time(16), 2.0 * (0.4 + 0.1))
+        # more antennas than concurrent requests take more rounds
+        self.assertAlmostEqual(self.estimator.lead_time(64), 2.0 * (0.8 + 0.1))
+
+    def test_lead_time_bounds(self):
+        self.estimator.record(4, 0.01)
+        self.assertEqual(self.estimator.lead_time(4), 0.5)
+        self.estimator.record(4, 0.01, late=True)
+        self.assertEqual(self.estimator.lead_time(4), 8.0)
+
+
+class TestNoiseDiodeSchedule(unittest.TestCase):
+    """Tests noise diode transitions aligned to dump edges."""
+
+    def test_unaligned_without_dump_timing(self):
+        schedule = noisediode.NoiseDiodeSchedule(dump_period=0.5)
+        self.assertEqual(schedule.align(1573714805.3), 1573714805.3)
+
+    def test_align(self):
+        schedule = noisediode.NoiseDiodeSchedule(dump_period=0.5,
+                                                 dump_start=1573714800.1)
+        self.assertAlmostEqual(schedule.align(1573714805.3), 1573714805.6)
+        self.assertAlmostEqual(schedule.align(1573714805.6), 1573714805.6)
+        # nearest dump edge, not before the earliest time
+        self.assertAlmostEqual(schedule.align(1573714805.3, earliest=0.0),
+                               1573714805.1)
+        self.assertAlmostEqual(schedule.align(1573714805.3, earliest=1573714805.2),
+                               1573714805.6)
+
+    def test_plan(self):
+        schedule = noisediode.NoiseDiodeSchedule(dump_period=2.0,
+                                                 dump_start=1573714800.0)
+        transitions = schedule.plan(1573714805.0, [15.0, 1.0])
+        self.assertEqual(transitions, [1573714806.0, 1573714822.0, 1573714824.0])
+        # states end on the nearest dump edge, at least one dump later
+        transitions = schedule.plan(1573714805.0, [14.6, 0.2])
+        self.assertEqual(transitions, [1573714806.0, 1573714820.0, 1573714822.0])
+        schedule.reset()
+        self.assertEqual(schedule.plan(1573714805.0, [15.0]),
+                         [1573714805.0, 1573714820.0])
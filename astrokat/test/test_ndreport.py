@@ -0,0 +1,89 @@
+"""Test noise diode timing report."""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from astrokat import ndreport
+
+LOG = """\
+2019-11-14 07:00:00Z - Repeat noise diode pattern every 2.0 sec, with 1.0 sec on
+2019-11-14 07:00:00Z - Dry-run: Set noise diode for antenna m011 at timestamp 1573714803.0
+2019-11-14 07:00:00Z - Dry-run: Set noise diode for antenna m022 at timestamp 1573714803.0
+2019-11-14 07:00:03Z - Report: Switch noise-diode pattern on at 1573714803.0
+2019-11-14 07:00:03Z - Slewing to azel at 1573714803.000 for 45.000 sec
+2019-11-14 07:00:48Z - DEBUG: Capture started at 1573714848.000
+2019-11-14 07:00:48Z - Noise diode for antenna m011 set at 1573714849.0.
+2019-11-14 07:00:48Z - Noise diode for antenna m022 set at 1573714849.25.
+2019-11-14 07:00:48Z - Report: noise-diode off at 1573714849.25
+2019-11-14 07:00:50Z - Report: noise-diode on at 1573714852.0
+2019-11-14 07:00:55Z - Resetting all noise diodes to "off"
+"""
+
+
+class TestNDReport(unittest.TestCase):
+    def setUp(self):
+        self.timeline = ndreport.parse_log(LOG.splitlines())
+
+    def test_parse_log(self):
+        timeline = self.timeline
+        self.assertEqual(timeline.nd_state.tolist(),
+                         [ndreport.ND_PATTERN, ndreport.ND_OFF,
+                          ndreport.ND_ON, ndreport.ND_OFF])
+        self.assertEqual(timeline.nd_start[-1], 1573714855.0)
+        self.assertEqual(timeline.nd_cycle[0], 2.0)
+        self.assertEqual(timeline.nd_on[0], 1.0)
+        self.assertEqual(timeline.antenna_spread.tolist(), [0.0, 0.25])
+        self.assertEqual(timeline.slew_end.tolist(), [1573714848.0])
+        self.assertEqual(timeline.capture_start, 1573714848.0)
+        self.assertEqual(timeline.end_time, 1573714855.0)
+
+    def test_nd_on_time(self):
+        on_time = ndreport.nd_on_time(self.timeline,
+                                      1573714800.0 + np.array([0., 3.5, 4.5, 52.5, 60.]))
+        np.testing.assert_allclose(on_time, [0.0, 0.5, 1.0, 23.75, 26.25])
+
+    def test_dump_coverage(self):
+        edges, coverage = ndreport.dump_coverage(self.timeline, 0.5)
+        self.assertEqual(edges[0], 1573714848.0)
+        self.assertEqual(len(coverage), 14)
+        # noise diode switched off half way through a dump
+        np.testing.assert_allclose(coverage[:4], [0.0, 0.0, 0.5, 0.0])
+        np.testing.assert_allclose(coverage[8:], 1.0)
+
+    def test_report(self):
+        summary = ndreport.report(self.timeline, 0.5)
+        self.assertEqual(summary["dumps"], 14)
+        self.assertEqual(summary["dumps_nd_partial"], 1)
+        self.assertEqual(summary["misaligned_transitions"], 1)
+        self.assertEqual(summary["max_transition_offset"], 0.25)
+        self.assertEqual(summary["requests_out_of_sync"], 1)
+        self.assertEqual(summary["slews_with_nd"], 1)
+        self.assertEqual(summary["nd_on_during_slews"], 23.0)
+
+    def test_dump_start_required(self):
+        timeline = ndreport.parse_log(LOG.splitlines()[:4])
+        with self.assertRaises(ValueError):
+            ndreport.dump_coverage(timeline, 0.5)
+        edges, _ = ndreport.dump_coverage(timeline, 0.5, dump_start=1573714800.0)
+        self.assertEqual(edges[0], 1573714800.0)
+
+    def test_end_time_required(self):
+        timeline = ndreport.parse_log(["Report: noise-diode on at 1573714852.0"])
+        with self.assertRaises(ValueError):
+            ndreport.dump_coverage(timeline, 0.5, dump_start=1573714800.0)
+        edges, _ = ndreport.dump_coverage(timeline, 0.5,
+                                          dump_start=1573714800.0,
+                                          end_time=1573714801.0)
+        self.assertEqual(len(edges), 2)
+
+    def test_no_slews_logged(self):
+        lines = [line for line in LOG.splitlines() if "Slewing" not in line]
+        summary = ndreport.report(ndreport.parse_log(lines), 0.5)
+        # live logs have no slews, the slew values are not available
+        self.assertIsNone(summary["slews"])
+        self.assertIsNone(summary["slews_with_nd"])
+        self.assertIsNone(summary["nd_on_during_slews"])
+        self.assertEqual(summary["dumps"], 14)
@@ -0,0 +1,136 @@
+"""Test astrokat observatory rise and set calculations."""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import unittest
+
+from multiprocessing.pool import ThreadPool
+
+import ephem
+import katpoint
+import numpy as np
+
+from astrokat import observatory, targets
+
+
+class TestRiseSetLST(unittest.TestCase):
+    def setUp(self):
+        self.observatory = observatory.Observatory(datetime="2019/02/07 16:30:00")
+
+    def test_matches_ephem(self):
+        target_strs = ["J1939-6342, radec, 19:39:25.03, -63:42:45.6",
+                       "3C286, radec, 13:31:08.29, +30:30:33.0",
+                       "G328.24-0.55, radec B1950, 15:50:18.48, -53:41:44.9"]
+        bodies = [katpoint.Target(target).body for target in target_strs]
+        rise_lst, set_lst = self.observatory._rise_set_lst_(bodies)
+        for cnt, body in enumerate(bodies):
+            ephem_observatory = observatory.Observatory(datetime="2019/02/07 16:30:00")
+            exp_rise = ephem_observatory._ephem_risetime_(body)
+            exp_set = ephem_observatory._ephem_settime_(body)
+            # agree to within 10 sec of LST
+            tolerance = 10. / 86400. * 2. * np.pi
+            self.assertAlmostEqual(np.cos(rise_lst[cnt] - exp_rise), 1.,
+                                   delta=tolerance ** 2)
+            self.assertAlmostEqual(np.cos(set_lst[cnt] - exp_set), 1.,
+                                   delta=tolerance ** 2)
+
+    def test_vectorised(self):
+        ra = np.deg2rad([0., 90., 180.])
+        dec = np.deg2rad([-89., -30., 80.])
+        rise_lst, set_lst = self.observatory.rise_set_lst(ra, dec)
+        self.assertEqual(rise_lst.shape, (3,))
+        # circumpolar target is always up
+        self.assertAlmostEqual(rise_lst[0], ephem.hours("00:00:01"))
+        self.assertAlmostEqual(set_lst[0], ephem.hours("23:59:59"))
+        # northern target never rises above the horizon
+        self.assertTrue(np.isnan(rise_lst[2]))
+        self.assertTrue(np.isnan(set_lst[2]))
+        # scalar input
+        rise, _ = self.observatory.rise_set_lst(ra[1], dec[1])
+        self.assertAlmostEqual(float(rise), rise_lst[1])
+
+    def test_queries_do_not_change_observer(self):
+        date = self.observatory.observer.date
+        body = katpoint.Target("Moon, special").body
+        rise_time, set_time = self.observatory.target_rise_and_set_times(body,
+                                                                         lst=False)
+        self.assertEqual(self.observatory.observer.date, date)
+        self.assertGreater(set_time, rise_time)
+        # explicit query time
+        next_day = ephem.Date(date + 1)
+        next_rise, _ = self.observatory.target_rise_and_set_times(body,
+                                                                  lst=False,
+                                                                  date=next_day)
+        self.assertGreater(next_rise, next_day)
+        self.assertEqual(self.observatory.observer.date, date)
+
+    def test_shared_between_threads(self):
+        bodies = [katpoint.Target("t{}, radec, {}, -45:00:00".format(cnt, cnt)).body
+                  for cnt in range(24)]
+        bodies += [katpoint.Target(body).body for body in ["Sun, special",
+                                                           "Moon, special",
+                                                           "Jupiter, special"]]
+        expected = [self.observatory.target_rise_and_set_times(body, lst=False)
+                    for body in bodies]
+        pool = ThreadPool(4)
+        try:
+            results = pool.map(
+                lambda body: self.observatory.target_rise_and_set_times(body,
+                                                                        lst=False),
+                bodies)
+        finally:
+            pool.close()
+        self.assertEqual(results, expected)
+
+
+class TestReferenceAntenna(unittest.TestCase):
+    def test_independent_copies(self):
+        antenna = observatory.reference_antenna()
+        other = observatory.reference_antenna()
+        self.assertEqual(antenna.description, other.description)
+        self.assertIsNot(antenna.observer, other.observer)
+        antenna.observer.date = ephem.Date("2019/02/07 16:30:00")
+        antenna.observer.horizon = np.deg2rad(15.)
+        self.assertNotEqual(other.observer.date, antenna.observer.date)
+        self.assertNotEqual(other.observer.horizon, antenna.observer.horizon)
+
+    def test_observatory_observers(self):
+        mkat = observatory.Observatory(horizon=15., datetime="2019/02/07 16:30:00")
+        other = observatory.Observatory()
+        self.assertAlmostEqual(mkat.observer.horizon, np.deg2rad(15.))
+        self.assertAlmostEqual(other.observer.horizon, np.deg2rad(20.))
+        self.assertNotEqual(mkat.observer.date, other.observer.date)
+
+
+class TestCollectTargets(unittest.TestCase):
+    def setUp(self):
+        self.target_items = [
+            "name=J1939-6342, radec=19:39:25.03 -63:42:45.6, tags=bpcal, duration=30.0",
+            "name=Moon, special=special , tags=target, duration=10.0",
+        ]
+
+    def test_catalogue_from_target_table(self):
+        obs_targets = targets.read(self.target_items)
+        catalogue = observatory.catalogue_from_targets(obs_targets)
+        self.assertEqual([target.name for target in catalogue], ["J1939-6342", "Moon"])
+        self.assertIn("bpcal", catalogue["J1939-6342"].tags)
+        self.assertEqual(catalogue.antenna.description,
+                         observatory.reference_antenna().description)
+
+    def test_catalogue_from_descriptions(self):
+        catalogue = observatory.catalogue_from_targets(
+            ["J1939-6342, radec bpcal, 19:39:25.03, -63:42:45.6",
+             "bad target, radec, 99:99:99"])
+        self.assertEqual(len(catalogue), 1)
+        with self.assertRaises(ValueError):
+            observatory.catalogue_from_targets([])
+
+    def test_collect_targets_file(self):
+        catalogue_file = os.path.join(os.path.dirname(__file__),
+                                      "test_convert",
+                                      "two_calib.csv")
+        catalogue = observatory.collect_targets(
+            None, [catalogue_file, "Sun, special"])
+        self.assertIn("Sun", catalogue)
+        self.assertGreater(len(catalogue), 1)
@@ -2,13 +2,15 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import ephem
 import unittest
 import katpoint
 import re
+from argparse import Namespace
 
 from mock import patch
 
-from astrokat import utility
+from astrokat import observe_main, sensors, utility
 from .testutils import (
     LoggedTelescope,
     execute_observe_main,
@@ -54,12 +56,12 @@ class TestAstrokatYAML(unittest.TestCase):
             duration=10.0,
             az=10.0,
             el=50.0,
-            sim_radec_regex=r"16:00:05.19 8:50:57.6",
+            sim_radec_regex=r"16:00:02.59 8:50:57.6",
             corelib_radec_regex=r"15:59:[0-5]\d\.\d+ 8:50:[0-5]\d\.\d+",
             logs=result
         )
         self.assert_started_target_track(
-            "Moon", duration=10.0, az=63.4, el=66.7, logs=result
+            "Moon", duration=10.0, az=63.5, el=66.7, logs=result
         )
 
         self.assertIn("Single run through observation target list", result)
@@ -236,6 +238,41 @@ class TestAstrokatYAML(unittest.TestCase):
         self.assertIn("Jupiter observed for 60.0 sec", result)
         self.assertIn("Moon observed for 40.0 sec", result)
 
+    def test_mosaic_sim(self):
+        """Mosaic pointings expanded from YAML mosaic definition."""
+        execute_observe_main("test_obs/mosaic-sim.yaml")
+
+        # get result and make sure everything ran properly
+        result = LoggedTelescope.user_logger_stream.getvalue()
+        self.assertIn("Single run through observation target list", result)
+        self.assertIn("BP calibrators are ['J0010-4153']", result)
+        self.assertIn("GAIN calibrators are ['J0155-4048']", result)
+        for pointing in range(7):
+            self.assertIn("NGC641_{} observed for 120.0 sec".format(pointing), result)
+
+    def test_multi_lst_sim(self):
+        """Start the next LST loop on its first visible target."""
+        LoggedTelescope.reset_user_logger_stream()
+        execute_observe_main("test_obs/multi-lst-sim.yaml")
+
+        result = LoggedTelescope.user_logger_stream.getvalue()
+        self.assertIn("Moving to next LST loop", result)
+        # the slew to the next loop is done before the loop starts
+        next_loop = result.index("Observation loop 2 of 2")
+        self.assertLess(
+            result.index("Slewed to J0408-6545, first target of next LST loop"),
+            next_loop)
+        first_slew = result[next_loop:].split("Slewing to first target")[1]
+        first_slew = first_slew[:first_slew.index("Initialising Track")]
+        # J0137+3309 is listed first, but below the horizon at the boundary
+        self.assertIn("Slewed to J0408-6545", first_slew)
+        self.assertNotIn("Slewed to J0137+3309", first_slew)
+        # already on target, the first slew of the loop takes no time
+        lines = result[next_loop:].splitlines()
+        slewing = [line for line in lines if "Slewing to first target" in line][0]
+        slewed = [line for line in lines if "Slewed to J0408-6545" in line][0]
+        self.assertEqual(slewing.split(" - ")[0], slewed.split(" - ")[0])
+
     def test_below_horizon(self):
         """Below horizon test."""
         execute_observe_main("test_obs/below-horizon-sim.yaml")
@@ -301,3 +338,130 @@ class TestAstrokatYAML(unittest.TestCase):
                 yaml_start_time_str,
                 msg="katpoint str time conversion mismatch for {}".format(test_file)
             )
+
+
+class TestPrepareTargets(unittest.TestCase):
+    """Tests just in time observation loop target preparation."""
+
+    def test_prepared_once(self):
+        obs_dict = {
+            "LST": "0:00-4:00",
+            "target_list": [
+                "name=J1939-6342, radec=19:39:25.03 -63:42:45.6, "
+                "tags=bpcal, duration=30.0",
+            ],
+            "mosaic": [
+                {"name": "M", "centre": "10 -30", "extent": 0.4, "spacing": 0.4,
+                 "duration": 10.0},
+            ],
+        }
+        with patch("astrokat.targets.read", wraps=observe_main.targets.read) as read:
+            obs_targets = observe_main.prepare_targets(obs_dict, 0)
+            self.assertIs(observe_main.prepare_targets(obs_dict, 0), obs_targets)
+            self.assertEqual(read.call_count, 1)
+        self.assertIs(obs_dict["target_list"], obs_targets)
+        self.assertEqual(obs_targets["name"].tolist(), ["J1939-6342", "M_0"])
+
+    def test_array_location(self):
+        antenna = katpoint.Antenna("ref, -30:42:39.8, 21:26:38.0, 1035.0")
+        kat = Namespace(dry_run=False, sources=katpoint.Catalogue(antenna=antenna))
+        self.assertEqual(observe_main.array_location(kat), antenna.description)
+        # catalogues use the antenna of the live session
+        catalogue = observe_main.catalogue_from_targets(
+            ["Sun, special"],
+            antenna=observe_main.reference_antenna(observe_main.array_location(kat)))
+        self.assertEqual(catalogue.antenna.description, antenna.description)
+        kat.dry_run = True
+        self.assertIsNone(observe_main.array_location(kat))
+
+
+class FakeSensor(object):
+    def __init__(self, value):
+        self.value = value
+
+    def get_value(self):
+        return self.value
+
+
+class TestDumpTiming(unittest.TestCase):
+    """Tests correlator dump timing for noise diode alignment."""
+
+    def setUp(self):
+        array = Namespace(dry_run=False, sensor={})
+        self.kat = Namespace(array=array, sensors=sensors.SensorSnapshot(array))
+        self.correlator = Namespace(int_time=FakeSensor(8.0),
+                                    sync_time=FakeSensor(1573714800.0))
+        self.session = Namespace(
+            cbf=Namespace(correlator=Namespace(sensor=self.correlator)))
+
+    def test_sync_time(self):
+        self.assertEqual(observe_main.dump_timing(self.kat, self.session),
+                         (8.0, 1573714800.0))
+
+    def test_sync_time_missing(self):
+        del self.correlator.sync_time
+        with patch("astrokat.observe_main.user_logger") as logger:
+            self.assertEqual(observe_main.dump_timing(self.kat, self.session),
+                             (8.0, None))
+        self.assertEqual(logger.warning.call_count, 1)
+
+    def test_dry_run(self):
+        self.kat.array.dry_run = True
+        self.assertEqual(observe_main.dump_timing(self.kat, self.session), (0.5, None))
+
+
+class TestCaptureInit(unittest.TestCase):
+    """Tests capture initialisation in the background."""
+
+    def test_join(self):
+        def capture_init():
+            raise RuntimeError("Capture-init failed")
+
+        join = observe_main._start_capture_init(Namespace(capture_init=capture_init))
+        # errors are kept until the join, without hiding other errors
+        join(reraise=False)
+        with self.assertRaises(RuntimeError):
+            join()
+
+
+class TestNextRiseTime(unittest.TestCase):
+    """Tests waiting for the next target to rise."""
+
+    def setUp(self):
+        self.observer = observe_main.reference_antenna().observer
+        self.obs_targets = observe_main.targets.read([
+            "name=J1733-1304, radec=17:33:02.7058 -13:04:49.548, tags=target, "
+            "duration=600.0",
+            "name=azel, azel=10 50, tags=target, duration=10.0",
+        ])
+        self.now = 1520673600.0  # 2018-03-10 09:20:00, J1733-1304 below horizon
+
+    def test_next_rise_time(self):
+        with patch("time.time", return_value=self.now):
+            rise_time, name = observe_main.next_rise_time(self.obs_targets,
+                                                          self.observer)
+        self.assertEqual(name, "J1733-1304")
+        self.assertGreater(rise_time, self.now)
+        target = katpoint.Target(self.obs_targets[0]["target"])
+        antenna = observe_main.reference_antenna()
+        _, el = target.azel(rise_time + 1.0, antenna=antenna)
+        self.assertAlmostEqual(el, katpoint.deg2rad(20.0), places=3)
+        # observer is not changed by the query
+        self.assertNotEqual(self.observer.horizon, ephem.degrees("20"))
+
+    def test_always_up_target(self):
+        obs_targets = observe_main.targets.read([
+            "name=circumpolar, radec=6:00:00 -85:00:00, tags=target, duration=60.0",
+        ])
+        with patch("time.time", return_value=self.now):
+            rise_time, name = observe_main.next_rise_time(obs_targets, self.observer)
+        self.assertIsNone(rise_time)
+        self.assertIsNone(name)
+
+    def test_rise_after_end_time(self):
+        with patch("time.time", return_value=self.now):
+            rise_time, name = observe_main.next_rise_time(self.obs_targets,
+                                                          self.observer,
+                                                          end_time=self.now + 600.0)
+        self.assertIsNone(rise_time)
+        self.assertIsNone(name)
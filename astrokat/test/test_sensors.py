@@ -0,0 +1,160 @@
+"""Test batched sensor snapshots."""
+from __future__ import absolute_import
+
+import threading
+import unittest
+
+from astrokat import sensors
+
+
+class FakeSensor(object):
+    """Counts sensor reads."""
+
+    def __init__(self, value):
+        self.value = value
+        self.reads = 0
+        self.threads = set()
+
+    def get_value(self):
+        self.reads += 1
+        self.threads.add(threading.current_thread().name)
+        return self.value
+
+
+class FakeSensors(dict):
+    """Array sensor collection."""
+
+    def get(self, name, default=None):
+        return dict.get(self, name, default)
+
+
+class FakeKat(object):
+    def __init__(self, **values):
+        self.sensor = FakeSensors((name, FakeSensor(value))
+                                  for name, value in values.items())
+
+
+class FakeKATCPSensor(FakeSensor):
+    """Sensor of a KATCP resource."""
+
+    def __init__(self, parent_name, name, value):
+        super(FakeKATCPSensor, self).__init__(value)
+        self.parent_name = parent_name
+        self.name = name
+
+
+class FakeMessage(object):
+    def __init__(self, *arguments):
+        self.arguments = list(arguments)
+
+    def reply_ok(self):
+        return self.arguments[0] == b"ok"
+
+
+class FakeRequests(object):
+    def __init__(self, sensors, fail=False):
+        self.sensors = sensors
+        self.fail = fail
+        self.patterns = []
+
+    def sensor_value(self, pattern):
+        self.patterns.append(pattern)
+        if self.fail:
+            return FakeMessage(b"fail", b"unknown"), []
+        informs = [FakeMessage(b"1.0", b"1", sensor.name.encode(), b"nominal",
+                               str(sensor.value).encode())
+                   for sensor in self.sensors]
+        return FakeMessage(b"ok", str(len(informs)).encode()), informs
+
+
+class FakeResource(object):
+    def __init__(self, sensors, fail=False):
+        self.req = FakeRequests(sensors, fail=fail)
+
+
+class TestSensorSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.kat = FakeKat(sub_band="l", sub_product="c856M4k", sub_pool_resources="")
+        self.snapshot = sensors.SensorSnapshot(self.kat)
+
+    def test_concurrent_read(self):
+        for name in self.kat.sensor:
+            self.snapshot.add(name)
+        self.snapshot.refresh()
+        for sensor in self.kat.sensor.values():
+            self.assertEqual(sensor.reads, 1)
+            # sensors are not read from the calling thread
+            self.assertNotIn(threading.current_thread().name, sensor.threads)
+        self.assertEqual(self.snapshot.get("sub_band"), "l")
+        self.assertEqual(self.snapshot.get("sub_product"), "c856M4k")
+        self.assertEqual(self.kat.sensor["sub_band"].reads, 1)
+
+    def test_read_on_demand(self):
+        self.assertEqual(self.snapshot.get("sub_band"), "l")
+        self.assertEqual(self.snapshot.get("sub_band"), "l")
+        self.assertEqual(self.kat.sensor["sub_band"].reads, 1)
+        self.assertEqual(self.kat.sensor["sub_product"].reads, 0)
+
+    def test_refresh(self):
+        self.snapshot.get("sub_band")
+        self.kat.sensor["sub_band"].value = "u"
+        self.assertEqual(self.snapshot.get("sub_band"), "l")
+        self.snapshot.refresh(["sub_band"])
+        self.assertEqual(self.snapshot.get("sub_band"), "u")
+        self.assertEqual(self.kat.sensor["sub_band"].reads, 2)
+
+    def test_explicit_sensor(self):
+        int_time = FakeSensor(0.5)
+        self.snapshot.add("int_time", int_time)
+        self.assertEqual(self.snapshot.get("int_time"), 0.5)
+        self.assertEqual(int_time.reads, 1)
+
+    def test_missing_sensor(self):
+        self.assertFalse(self.snapshot.available("approved_schedule"))
+        with self.assertRaises(RuntimeError):
+            self.snapshot.get("approved_schedule")
+        self.assertIsNone(self.snapshot.get("approved_schedule", None))
+        self.assertEqual(self.snapshot.get("approved_schedule", ""), "")
+
+    def test_add_once(self):
+        int_time = FakeSensor(0.5)
+        self.snapshot.add("int_time", int_time)
+        self.assertEqual(self.snapshot.get("int_time"), 0.5)
+        self.assertIs(self.snapshot.add("int_time", FakeSensor(2.0)), int_time)
+        self.assertEqual(self.snapshot.get("int_time"), 0.5)
+        self.assertEqual(int_time.reads, 1)
+
+    def _katcp_sensors(self, fail=False):
+        int_time = FakeKATCPSensor("cbf", "int-time", 0.499)
+        sync_time = FakeKATCPSensor("cbf", "sync-time", 1539000000)
+        self.kat.cbf = FakeResource([int_time, sync_time], fail=fail)
+        self.snapshot.add("int_time", int_time)
+        self.snapshot.add("sync_time", sync_time)
+        self.snapshot.add("sub_band")
+        self.snapshot.refresh()
+        return int_time, sync_time
+
+    def test_resource_read(self):
+        int_time, sync_time = self._katcp_sensors()
+        # one request for all sensors of the resource
+        self.assertEqual(self.kat.cbf.req.patterns,
+                         ["/^(int\\-time|sync\\-time)$/"])
+        self.assertEqual(int_time.reads + sync_time.reads, 0)
+        self.assertEqual(self.kat.sensor["sub_band"].reads, 1)
+        self.assertEqual(self.snapshot.get("int_time"), 0.499)
+        self.assertEqual(self.snapshot.get("sync_time"), 1539000000)
+        self.assertEqual(self.snapshot.get("sub_band"), "l")
+
+    def test_resource_read_failure(self):
+        int_time, sync_time = self._katcp_sensors(fail=True)
+        # sensors are read one by one instead
+        self.assertEqual(len(self.kat.cbf.req.patterns), 1)
+        self.assertEqual((int_time.reads, sync_time.reads), (1, 1))
+        self.assertEqual(self.snapshot.get("int_time"), 0.499)
+        self.assertEqual(self.snapshot.get("sync_time"), 1539000000)
+
+    def test_shared_snapshot(self):
+        self.assertIs(sensors.sensor_snapshot(self.kat),
+                      sensors.sensor_snapshot(self.kat))
+        self.assertIsNot(sensors.sensor_snapshot(self.kat),
+                         sensors.sensor_snapshot(FakeKat()))
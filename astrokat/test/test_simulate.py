@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import threading
 import unittest
 
 from collections import namedtuple
@@ -20,7 +21,7 @@ class TestSimSession(unittest.TestCase):
         observer = ephem.Observer()
         observer.date = ephem.Date(start_time)
         simulate.setobserver(observer)
-        self.antenna = katpoint.Antenna(observatory._ref_location)
+        self.antenna = katpoint.Antenna(observatory.reference_location())
         self.mock_kat = mock.Mock()
         self.mock_kat.obs_params = {"durations": {"start_time": start_time}}
         self.DUT = simulate.SimSession(self.mock_kat)
@@ -74,3 +75,25 @@ class TestSimSession(unittest.TestCase):
             self.DUT._fake_slew_(initial_target)
             slew_time = self.DUT._slew_time(test.az2, test.el2)
             self.assertAlmostEqual(slew_time, test.slew_time, places=2)
+
+    def _background_capture_init(self):
+        thread = threading.Thread(target=self.DUT.capture_init)
+        thread.start()
+        thread.join()
+
+    def test_capture_init_overlaps_slew(self):
+        start_time = self.DUT.time
+        self._background_capture_init()
+        # initialisation in the background does not advance the session time
+        self.assertEqual(self.DUT.time, start_time)
+        self.DUT.track(self.azel_target(32.0, 64.0), slew_only=True)
+        self.DUT.capture_start()
+        self.assertAlmostEqual(self.DUT.time - start_time,
+                               simulate._DEFAULT_SLEW_TIME_SEC)
+
+    def test_capture_start_waits_for_capture_init(self):
+        start_time = self.DUT.time
+        self._background_capture_init()
+        self.DUT.capture_start()
+        self.assertAlmostEqual(self.DUT.time - start_time,
+                               simulate._SIM_OVERHEAD_SEC)
@@ -0,0 +1,231 @@
+"""Test astrokat target coordinate conversions."""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import katpoint
+import numpy as np
+from mock import patch
+
+from astrokat import observe_main, simulate, targets
+
+
+class TestCoordinateConversions(unittest.TestCase):
+    def test_radec_decimal_degrees(self):
+        tgt_type, tgt_coord = targets.get_coordinates_as_radec("radec=10.5 -30.25")
+        self.assertEqual(tgt_type, "radec")
+        self.assertEqual(tgt_coord, "00:42:00.000 -30:15:00.000")
+
+    def test_radec_sexagesimal(self):
+        _, tgt_coord = targets.get_coordinates_as_radec(
+            "radec=+17:05:19.53524 -39:26:50.4693")
+        self.assertEqual(tgt_coord, "17:05:19.535 -39:26:50.469")
+        _, tgt_coord = targets.get_coordinates_as_radec("radec=0:00:00 -0:30:00")
+        self.assertEqual(tgt_coord, "00:00:00.000 -00:30:00.000")
+
+    def test_radec_astropy_format(self):
+        _, tgt_coord = targets.get_coordinates_as_radec("radec=12h30m00s -30d00m00s")
+        self.assertEqual(tgt_coord, "12:30:00.000 -30:00:00.000")
+
+    def test_sexagesimal_rounding_carry(self):
+        self.assertEqual(targets._sexagesimal(1.9999999999), "02:00:00.000")
+        self.assertEqual(targets._sexagesimal(0.5, alwayssign=True), "+00:30:00.000")
+
+    def test_galactic_to_radec(self):
+        tgt_type, tgt_coord = targets.get_coordinates_as_radec("gal=-10 40")
+        self.assertEqual(tgt_type, "radec")
+        self.assertEqual(tgt_coord, "15:10:14.311 -09:51:42.593")
+        # galactic centre
+        ra_deg, dec_deg = targets.galactic_to_radec(0., 0.)
+        self.assertAlmostEqual(ra_deg, 266.40499, places=4)
+        self.assertAlmostEqual(dec_deg, -28.93617, places=4)
+
+
+class TestTargetCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_round_trip(self):
+        target_items = [
+            "name=J1939-6342, radec=19:39:25.03 -63:42:45.6, tags=bpcal, duration=30.0",
+            "name=Moon, special=special , tags=target, duration=10.0, nd=off",
+        ]
+        key = targets.cache_key("plan hash", "version", 0, None)
+        self.assertIsNone(targets.load_cached(key, cache_dir=self.cache_dir))
+        obs_targets = targets.read(target_items)
+        targets.save_cached(key, obs_targets, cache_dir=self.cache_dir)
+        cached = targets.load_cached(key, cache_dir=self.cache_dir)
+        self.assertIsInstance(cached, np.recarray)
+        self.assertEqual(cached.dtype, obs_targets.dtype)
+        self.assertEqual(cached["target"].tolist(), obs_targets["target"].tolist())
+        self.assertEqual(cached["noise_diode"].tolist(), [None, "off"])
+        # cached table must be writable for observation counters
+        cached[0]["obs_cntr"] += 1
+        self.assertEqual(cached[0]["obs_cntr"], 1)
+        self.assertEqual(cached["flux_model"].tolist(),
+                         obs_targets["flux_model"].tolist())
+        # cache files can be read without unpickling objects
+        filename = os.path.join(self.cache_dir, "{}.npz".format(key))
+        with np.load(filename, allow_pickle=False) as cached_file:
+            for field in cached_file.files:
+                self.assertNotEqual(cached_file[field].dtype, object)
+
+    def test_cache_write_failure(self):
+        obs_targets = targets.read(
+            ["name=J1939-6342, radec=19:39:25.03 -63:42:45.6, tags=bpcal, duration=30.0"])
+        with patch("numpy.savez", side_effect=IOError("disk full")):
+            self.assertIsNone(targets.save_cached("key", obs_targets,
+                                                  cache_dir=self.cache_dir))
+        # no partially written files left behind
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_cache_key_depends_on_all_items(self):
+        self.assertNotEqual(targets.cache_key("a", "1.0", 0),
+                            targets.cache_key("a", "1.1", 0))
+        self.assertNotEqual(targets.cache_key("a", "1.0", 0),
+                            targets.cache_key("a", "1.0", 1))
+        # (az, el) conversions depend on the observer location
+        self.assertNotEqual(targets.cache_key("a", "1.0", 0, 0, simulate.ref_antenna),
+                            targets.cache_key("a", "1.0", 0, 0, "other, 0, 0, 0"))
+
+    def test_cache_version(self):
+        with patch("astrokat.__version__", "0.0+unknown.202101010000"):
+            version = observe_main._cache_version()
+        # unknown versions do not change with the import time
+        with patch("astrokat.__version__", "0.0+unknown.202101010001"):
+            self.assertEqual(observe_main._cache_version(), version)
+        with patch("astrokat.__version__", "1.2.3"):
+            self.assertEqual(observe_main._cache_version(), "1.2.3")
+
+    def test_cache_unicode_strings(self):
+        strings, kinds = targets._encode_column([u"J0408-6545", None, ()])
+        values = targets._decode_column(strings, kinds)
+        self.assertEqual(values.tolist(), [u"J0408-6545", None, ()])
+
+
+class TestEphemerisTable(unittest.TestCase):
+    def setUp(self):
+        self.antenna = katpoint.Antenna(simulate.MEERKAT_REFERENCE_LOCATION)
+        self.start_time = 1549557000.0  # 2019-02-07 16:30:00
+
+    def test_interpolation_matches_ephem(self):
+        target = katpoint.Target("Moon, special")
+        table = targets.EphemerisTable(target.body,
+                                       self.antenna.observer,
+                                       self.start_time,
+                                       self.start_time + 6 * 3600.)
+        self.assertLess(table.max_error, 1.0)
+        timestamps = self.start_time + np.linspace(0., 6 * 3600., 17)
+        az, el = table.azel(timestamps)
+        for cnt, timestamp in enumerate(timestamps):
+            exp_az, exp_el = target.azel(timestamp, antenna=self.antenna)
+            self.assertAlmostEqual(el[cnt], exp_el, places=5)
+            self.assertAlmostEqual(np.cos(az[cnt] - exp_az), 1.0, places=9)
+
+    def test_covers(self):
+        target = katpoint.Target("Jupiter, special")
+        table = targets.EphemerisTable(target.body,
+                                       self.antenna.observer,
+                                       self.start_time,
+                                       self.start_time + 3600.)
+        self.assertTrue(table.covers([self.start_time, self.start_time + 3600.]))
+        self.assertFalse(table.covers(self.start_time - 1.))
+
+
+class TestMosaic(unittest.TestCase):
+    def test_hex_offsets(self):
+        x, y = targets.mosaic_offsets(0.8, 0.4, grid="hex")
+        self.assertEqual(len(x), 7)
+        # all neighbouring pointings are one spacing apart
+        dist = np.hypot(x[:, np.newaxis] - x, y[:, np.newaxis] - y)
+        self.assertAlmostEqual(dist[dist > 0].min(), 0.4)
+        self.assertIn((0.0, 0.0), list(zip(x, y)))
+
+    def test_square_offsets(self):
+        x, y = targets.mosaic_offsets(1.0, 0.5, grid="square")
+        self.assertEqual(len(x), 9)
+        self.assertAlmostEqual(np.abs(x).max(), 0.5)
+        self.assertAlmostEqual(np.abs(y).max(), 0.5)
+        # grid is centred, a narrow extent only keeps the centre row
+        x, y = targets.mosaic_offsets([1.0, 0.5], 0.5, grid="square")
+        self.assertEqual(len(x), 3)
+        self.assertTrue(np.all(y == 0))
+
+    def test_unknown_grid(self):
+        with self.assertRaises(RuntimeError):
+            targets.mosaic_offsets(1.0, 0.5, grid="triangle")
+
+    def test_mosaic_targets(self):
+        obs_targets = targets.mosaic_targets("NGC641",
+                                             "01:38:13.25 -42:37:41.0",
+                                             extent=0.8,
+                                             spacing=0.4,
+                                             duration=120.0)
+        self.assertEqual(len(obs_targets), 7)
+        self.assertEqual(obs_targets[3]["name"], "NGC641_3")
+        self.assertEqual(obs_targets[3]["target_str"],
+                         "radec=01:38:13.250 -42:37:41.000")
+        self.assertEqual(obs_targets[3]["duration"], 120.0)
+        self.assertEqual(obs_targets[3]["obs_type"], "track")
+        for target in obs_targets["target"]:
+            katpoint.Target(target)
+
+    def test_read_mosaic(self):
+        obs_targets = targets.read_mosaic([
+            {"name": "A", "centre": "10 -30", "extent": 0.8, "spacing": 0.4,
+             "duration": 10., "type": "track", "nd": 2},
+            {"name": "B", "centre": "20 -30", "extent": 0.4, "spacing": 0.4,
+             "duration": 10., "grid": "square", "projection": "TAN"},
+        ])
+        self.assertEqual(len(obs_targets), 8)
+        self.assertEqual(obs_targets[0]["noise_diode"], "2")
+        self.assertEqual(obs_targets[-1]["name"], "B_0")
+
+
+class TestArrayTimestamps(unittest.TestCase):
+    def setUp(self):
+        antenna = katpoint.Antenna(simulate.MEERKAT_REFERENCE_LOCATION)
+        self.location = targets.observer_as_earth_location(antenna.observer)
+        self.timestamps = 1532368800.0 + np.array([0., 0.5, 3600.25])
+
+    def test_radec_to_altaz(self):
+        alt, az = targets.radec_to_altaz("19:39:25.03", "-63:42:45.6",
+                                         self.location, self.timestamps)
+        self.assertEqual(alt.shape, self.timestamps.shape)
+        for cnt, timestamp in enumerate(self.timestamps):
+            alt_, az_ = targets.radec_to_altaz("19:39:25.03", "-63:42:45.6",
+                                               self.location, timestamp)
+            self.assertAlmostEqual(alt[cnt], alt_)
+            self.assertAlmostEqual(az[cnt], az_)
+        # sub-second timestamps are no longer truncated
+        self.assertNotAlmostEqual(az[0], az[1], places=5)
+
+    def test_altaz_to_radec(self):
+        ra, dec = targets.altaz_to_radec(10., 50., self.location, self.timestamps)
+        self.assertEqual(ra.shape, self.timestamps.shape)
+        ra_hms, dec_dms = targets.altaz_to_radec(10., 50.,
+                                                 self.location,
+                                                 self.timestamps,
+                                                 as_string=True)
+        self.assertEqual(len(ra_hms), 3)
+        self.assertEqual((ra_hms[0], dec_dms[0]),
+                         targets.altaz_to_radec(10., 50.,
+                                                self.location,
+                                                self.timestamps[0],
+                                                as_string=True))
+
+    def test_solarbody_to_radec(self):
+        ra, dec = targets.solarbody_to_radec("moon", self.location, self.timestamps)
+        self.assertEqual(dec.shape, self.timestamps.shape)
+        ra_, dec_ = targets.solarbody_to_radec("moon",
+                                               self.location,
+                                               self.timestamps[2])
+        self.assertAlmostEqual(ra[2], ra_)
+        self.assertAlmostEqual(dec[2], dec_)
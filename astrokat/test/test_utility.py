@@ -0,0 +1,136 @@
+"""Test astrokat utilities."""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import ephem
+import katpoint
+import numpy as np
+
+from astrokat import simulate, targets, timeconv, utility
+from astrokat.test.testutils import yaml_path
+
+
+class TestLST2UTC(unittest.TestCase):
+    def setUp(self):
+        self.antenna = katpoint.Antenna(simulate.MEERKAT_REFERENCE_LOCATION)
+
+    def lst_error(self, timestamps, req_lst):
+        lst = np.degrees(self.antenna.local_sidereal_time(timestamps)) / 15.
+        # wrapped difference in seconds
+        return ((lst - req_lst + 12.) % 24. - 12.) * 3600.
+
+    def test_lst2utc(self):
+        date = datetime.datetime(2019, 2, 7, 13, 0)
+        utc_datetime = utility.lst2utc(5.3, simulate.MEERKAT_REFERENCE_LOCATION,
+                                       date=date)
+        self.assertEqual(utc_datetime.date(), date.date())
+        timestamp = utility.datetime2timestamp(utc_datetime)
+        self.assertLess(abs(self.lst_error(timestamp, 5.3)), 0.1)
+
+    def test_lst2timestamp_batch(self):
+        req_lst = np.linspace(0., 23.9, 25)
+        dates = [datetime.date(2019, 2, 7)] * 12 + [datetime.date(2023, 7, 1)] * 13
+        timestamps = utility.lst2timestamp(req_lst, self.antenna, date=dates)
+        self.assertEqual(timestamps.shape, req_lst.shape)
+        self.assertTrue(np.all(np.abs(self.lst_error(timestamps, req_lst)) < 0.1))
+        # all solutions fall on the requested UTC dates
+        utc_dates = [datetime.datetime.utcfromtimestamp(ts).date() for ts in timestamps]
+        self.assertEqual(utc_dates, dates)
+
+    def test_timestamp2lst_batch(self):
+        timestamps = np.linspace(1549497600., 1549497600. + 3 * 86400., 50)
+        lst = utility.timestamp2lst(timestamps, self.antenna)
+        self.assertEqual(lst.shape, timestamps.shape)
+        self.assertTrue(np.all(np.abs(self.lst_error(timestamps, lst)) < 0.1))
+        self.assertIsInstance(utility.timestamp2lst(timestamps[0], self.antenna), float)
+
+
+class TestReadYAML(unittest.TestCase):
+    def setUp(self):
+        self.yaml_file = yaml_path("test_obs/multi-lst-sim.yaml")
+
+    def test_streamed_target_lists(self):
+        data = utility.read_yaml(self.yaml_file)
+        streamed = utility.read_yaml(self.yaml_file, stream_target_lists=True)
+        self.assertEqual(streamed["durations"], data["durations"])
+        for obs_loop, streamed_loop in zip(data["observation_loop"],
+                                           streamed["observation_loop"]):
+            self.assertEqual(streamed_loop["LST"], obs_loop["LST"])
+            self.assertIsInstance(streamed_loop["target_list"],
+                                  utility.StreamedTargetList)
+            self.assertEqual(list(streamed_loop["target_list"]),
+                             obs_loop["target_list"])
+
+    def test_target_list_chunks(self):
+        chunks = list(utility.iter_target_list(self.yaml_file, loop_idx=1, chunksize=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertTrue(chunks[0][0].startswith("name=J0137+3309"))
+
+    def test_read_streamed_targets(self):
+        streamed = utility.read_yaml(self.yaml_file, stream_target_lists=True)
+        target_list = streamed["observation_loop"][1]["target_list"]
+        target_list.chunksize = 2
+        obs_targets = targets.read(target_list)
+        self.assertEqual(obs_targets["name"].tolist(),
+                         ["J0137+3309", "J0408-6545", "J2206-1835"])
+
+    def test_aliased_target_lists(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        yaml_file = os.path.join(tmp_dir, "alias.yaml")
+        with open(yaml_file, "w") as fout:
+            fout.write(
+                "observation_loop:\n"
+                "  - LST: 19:30-23:30\n"
+                "    target_list: &tl\n"
+                "      - name=J1939-6342, radec=19:39:25.03 -63:42:45.6, duration=60.0\n"
+                "      - name=J2206-1835, radec=22:06:10.42 -18:35:38.7, duration=60.0\n"
+                "  - LST: 23:30-03:30\n"
+                "    target_list: *tl\n"
+            )
+        data = utility.read_yaml(yaml_file)
+        streamed = utility.read_yaml(yaml_file, stream_target_lists=True)
+        for obs_loop, streamed_loop in zip(data["observation_loop"],
+                                           streamed["observation_loop"]):
+            self.assertEqual(len(obs_loop["target_list"]), 2)
+            self.assertEqual(list(streamed_loop["target_list"]),
+                             obs_loop["target_list"])
+
+
+class TestTimeConversions(unittest.TestCase):
+    def setUp(self):
+        self.datetime = datetime.datetime(2019, 2, 7, 16, 30, 0, 250000)
+        self.timestamp = 1549557000.25
+
+    def test_datetime_round_trip(self):
+        self.assertEqual(timeconv.to_timestamp(self.datetime), self.timestamp)
+        self.assertEqual(timeconv.to_datetime(self.timestamp), self.datetime)
+        self.assertEqual(utility.timestamp2datetime(self.timestamp), self.datetime)
+        self.assertEqual(utility.datetime2timestamp(self.datetime), self.timestamp)
+
+    def test_ephem_date(self):
+        ephem_date = timeconv.to_ephem_date(self.timestamp)
+        self.assertIsInstance(ephem_date, ephem.Date)
+        self.assertEqual(ephem_date, ephem.Date(self.datetime))
+        self.assertAlmostEqual(timeconv.to_timestamp(ephem_date), self.timestamp,
+                               places=4)
+
+    def test_arrays(self):
+        timestamps = self.timestamp + np.arange(3) * 0.5
+        datetimes = timeconv.to_datetime64(timestamps)
+        self.assertEqual(datetimes.dtype, np.dtype("datetime64[us]"))
+        self.assertEqual(datetimes[0], np.datetime64(self.datetime))
+        np.testing.assert_array_equal(timeconv.to_timestamp(datetimes), timestamps)
+        ephem_dates = timeconv.to_ephem_date(timestamps)
+        self.assertEqual(ephem_dates.shape, (3,))
+        self.assertAlmostEqual(ephem_dates[0], timeconv.to_ephem_date(self.timestamp))
+        # object arrays of datetimes and dates
+        np.testing.assert_array_equal(
+            timeconv.to_timestamp(np.array([self.datetime, self.datetime.date()])),
+            [self.timestamp, 1549497600.0])
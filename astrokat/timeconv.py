@@ -0,0 +1,114 @@
+"""Time conversions between UTC timestamps, datetimes and ephem dates.
+
+Timestamps are float seconds since the Unix epoch (UTC),
+datetime objects are naive UTC times.
+All conversions are arithmetic, no string formatting or parsing,
+and accept NumPy arrays where noted.
+"""
+from __future__ import division
+from __future__ import absolute_import
+
+import datetime
+import ephem
+import numpy
+
+# Unix epoch as naive UTC datetime and numpy datetime64
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH64 = numpy.datetime64("1970-01-01T00:00:00", "us")
+# Unix epoch as ephem (Dublin Julian) date
+EPHEM_UNIX_EPOCH = 25567.5
+SECONDS_PER_DAY = 86400.0
+# ratio of sidereal to solar (UT1) time rates
+SIDEREAL_RATE = 1.00273790935
+
+
+def to_timestamp(value):
+    """Convert a time to UTC seconds since the Unix epoch.
+
+    Parameters
+    ----------
+    value: float, datetime, date, numpy.datetime64, ephem.Date or array
+        Time to convert, an array of datetime64 or float values is
+        converted in a single operation
+
+    Returns
+    -------
+    timestamp: float or array
+
+    """
+    # ephem.Date is a float subclass, check it first
+    if isinstance(value, ephem.Date):
+        return (float(value) - EPHEM_UNIX_EPOCH) * SECONDS_PER_DAY
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        return (value - _EPOCH).total_seconds()
+    if isinstance(value, datetime.date):
+        return (value - _EPOCH.date()).total_seconds()
+    value = numpy.asarray(value)
+    if numpy.issubdtype(value.dtype, numpy.datetime64):
+        usec = (value.astype("datetime64[us]") - _EPOCH64).astype(numpy.int64)
+        timestamp = usec / 1e6
+    elif value.dtype == object:
+        timestamp = numpy.array([to_timestamp(val) for val in value.ravel()],
+                                dtype=float).reshape(value.shape)
+    else:
+        timestamp = value.astype(float)
+    if timestamp.ndim == 0:
+        return float(timestamp)
+    return timestamp
+
+
+def to_datetime(timestamp):
+    """Convert UTC timestamp to naive UTC datetime, rounded to microseconds.
+
+    Parameters
+    ----------
+    timestamp: float
+        UTC seconds since the Unix epoch
+
+    Returns
+    -------
+    datetime: datetime.datetime
+
+    """
+    return _EPOCH + datetime.timedelta(seconds=float(timestamp))
+
+
+def to_datetime64(value):
+    """Convert time(s) to numpy datetime64 with microsecond resolution.
+
+    Parameters
+    ----------
+    value: float, datetime, numpy.datetime64, ephem.Date or array
+        Time(s) to convert
+
+    Returns
+    -------
+    datetime64: numpy.datetime64 or array
+
+    """
+    usec = numpy.round(numpy.asarray(to_timestamp(value)) * 1e6).astype(numpy.int64)
+    return _EPOCH64 + usec.astype("timedelta64[us]")
+
+
+def to_ephem_date(value):
+    """Convert time(s) to ephem (Dublin Julian) dates.
+
+    Parameters
+    ----------
+    value: float, datetime, numpy.datetime64, ephem.Date or array
+        Time(s) to convert
+
+    Returns
+    -------
+    date: ephem.Date, or float array of dates for array input
+
+    """
+    date = numpy.asarray(to_timestamp(value)) / SECONDS_PER_DAY + EPHEM_UNIX_EPOCH
+    if date.ndim == 0:
+        return ephem.Date(float(date))
+    return date
+
+
+# -fin-
@@ -1,10 +1,13 @@
 """Astrokat utilities."""
 import datetime
+import hashlib
 import katpoint
 import numpy
 import time
 import yaml
 
+from . import timeconv
+
 
 class NotAllTargetsUpError(Exception):
     """Raise error when not all targets are at the desired horizon.
@@ -18,11 +21,219 @@ class NoTargetsUpError(Exception):
     """No targets are above the horizon at the start of the observation."""
 
 
-def read_yaml(filename):
-    """Read config .yaml file."""
+# use the libyaml bindings when available
+try:
+    _SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    _SafeLoader = yaml.SafeLoader
+
+
+def _target_list_events(events):
+    """Label YAML parser events that belong to observation loop target lists.
+
+    Yields (loop index, event) pairs, where the loop index is None for
+    events outside of the `observation_loop` `target_list` sequences.
+
+    """
+    # open collections, mappings track the current key
+    path = []
+
+    def next_node():
+        if path and path[-1]["type"] == "map":
+            path[-1]["expect_key"] = True
+        elif path:
+            path[-1]["index"] += 1
+
+    loop_idx = None
+    depth = 0
+    for event in events:
+        if loop_idx is not None:
+            if isinstance(event, yaml.CollectionStartEvent):
+                depth += 1
+            elif isinstance(event, yaml.CollectionEndEvent):
+                depth -= 1
+            yield loop_idx, event
+            if depth == 0:
+                loop_idx = None
+                next_node()
+            continue
+        if isinstance(event, (yaml.ScalarEvent, yaml.AliasEvent)):
+            if path and path[-1]["type"] == "map" and path[-1]["expect_key"]:
+                path[-1]["key"] = getattr(event, "value", None)
+                path[-1]["expect_key"] = False
+            else:
+                next_node()
+        elif isinstance(event, yaml.CollectionStartEvent):
+            if (isinstance(event, yaml.SequenceStartEvent)
+                    and len(path) == 3
+                    and path[0].get("key") == "observation_loop"
+                    and path[1]["type"] == "seq"
+                    and path[2].get("key") == "target_list"):
+                loop_idx = path[1]["index"]
+                depth = 1
+                yield loop_idx, event
+                continue
+            if isinstance(event, yaml.MappingStartEvent):
+                path.append({"type": "map", "key": None, "expect_key": True})
+            else:
+                path.append({"type": "seq", "index": 0})
+        elif isinstance(event, yaml.CollectionEndEvent):
+            path.pop()
+            next_node()
+        yield None, event
+
+
+def iter_target_list(filename, loop_idx=0, chunksize=1000):
+    """Stream the target list of an observation loop from a YAML file.
+
+    Parameters
+    ----------
+    filename: str
+        Observation file
+    loop_idx: int
+        Index of the observation loop
+    chunksize: int
+        Maximum number of target strings per chunk
+
+    Yields
+    ------
+    chunk: list
+        Target strings in file order
+
+    """
+    chunk = []
+    found = False
+    with open(filename, "r") as stream:
+        for idx, event in _target_list_events(yaml.parse(stream, Loader=_SafeLoader)):
+            if idx != loop_idx:
+                if found:
+                    break
+                continue
+            found = True
+            if isinstance(event, yaml.ScalarEvent):
+                chunk.append(event.value)
+                if len(chunk) >= chunksize:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+
+class StreamedTargetList(object):
+    """Target list of an observation loop, read from the YAML file on use.
+
+    Iterating over the list streams the target strings from the file,
+    `chunks` gives them in bounded size lists.
+
+    """
+
+    def __init__(self, filename, loop_idx, chunksize=1000):
+        self.filename = filename
+        self.loop_idx = loop_idx
+        self.chunksize = chunksize
+
+    def chunks(self):
+        """Target strings in lists of at most `chunksize` items."""
+        return iter_target_list(self.filename,
+                                loop_idx=self.loop_idx,
+                                chunksize=self.chunksize)
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for target_item in chunk:
+                yield target_item
+
+    def __repr__(self):
+        return "{}({!r}, {})".format(type(self).__name__, self.filename, self.loop_idx)
+
+
+class _NotStreamable(Exception):
+    """Target lists share YAML nodes via anchors and aliases."""
+
+
+class _StreamedTargetListLoader(yaml.composer.Composer,
+                                yaml.constructor.SafeConstructor,
+                                yaml.resolver.Resolver):
+    """Safe YAML loader that leaves out observation loop target lists.
+
+    The target list sequences are composed as empty lists,
+    `read_yaml` replaces them with `StreamedTargetList` objects.
+    Files with aliases, or target lists that are not plain sequences of
+    strings, raise `_NotStreamable` and need a normal load.
+
+    """
+
+    def __init__(self, stream):
+        self._events = self._skip_target_lists(yaml.parse(stream, Loader=_SafeLoader))
+        self._event = None
+        yaml.composer.Composer.__init__(self)
+        yaml.constructor.SafeConstructor.__init__(self)
+        yaml.resolver.Resolver.__init__(self)
+
+    @staticmethod
+    def _skip_target_lists(events):
+        depth = 0
+        for loop_idx, event in _target_list_events(events):
+            # aliases can refer to (or into) target lists that are not composed
+            if isinstance(event, yaml.AliasEvent):
+                raise _NotStreamable()
+            if loop_idx is None:
+                yield event
+            elif getattr(event, "anchor", None) is not None:
+                raise _NotStreamable()
+            elif isinstance(event, yaml.CollectionStartEvent):
+                depth += 1
+                if depth > 1:
+                    # target list items are strings
+                    raise _NotStreamable()
+                yield event
+            elif isinstance(event, yaml.CollectionEndEvent):
+                depth -= 1
+                if depth == 0:
+                    yield event
+
+    def check_event(self, *choices):
+        event = self.peek_event()
+        if event is None:
+            return False
+        return not choices or isinstance(event, choices)
+
+    def peek_event(self):
+        if self._event is None:
+            self._event = next(self._events, None)
+        return self._event
+
+    def get_event(self):
+        event = self.peek_event()
+        self._event = None
+        return event
+
+    def dispose(self):
+        pass
+
+
+def read_yaml(filename, stream_target_lists=False):
+    """Read config .yaml file.
+
+    Parameters
+    ----------
+    filename: str
+        YAML file name
+    stream_target_lists: bool
+        Do not load observation loop target lists into memory,
+        replace them with `StreamedTargetList` objects
+
+    """
+    loader = _StreamedTargetListLoader if stream_target_lists else _SafeLoader
     with open(filename, "r") as stream:
         try:
-            data = yaml.safe_load(stream)
+            try:
+                data = yaml.load(stream, Loader=loader)
+            except _NotStreamable:
+                # target lists only resolved by a normal load
+                stream_target_lists = False
+                stream.seek(0)
+                data = yaml.load(stream, Loader=_SafeLoader)
         except yaml.parser.ParserError:
             return {}
 
@@ -72,8 +283,13 @@ def read_yaml(filename):
         # -> if len(obs_loop) > 0:
         if "LST" not in obs_loop.keys():
             raise RuntimeError("Observation LST not provided, exiting")
-        if "target_list" not in obs_loop.keys():
+        if "target_list" not in obs_loop.keys() and "mosaic" not in obs_loop.keys():
             raise RuntimeError("Empty target list, exiting")
+    if stream_target_lists:
+        for loop_idx, obs_loop in enumerate(data["observation_loop"]):
+            # target lists are composed as empty lists by the streaming loader
+            if obs_loop.get("target_list") == []:
+                obs_loop["target_list"] = StreamedTargetList(filename, loop_idx)
 
     if "scan" in data.keys():
         if "start" in data["scan"].keys():
@@ -86,25 +302,33 @@ def read_yaml(filename):
     return data
 
 
+def file_hash(filename):
+    """Content hash of a file, e.g. to identify an unchanged observation plan."""
+    hasher = hashlib.sha1()
+    with open(filename, "rb") as stream:
+        for chunk in iter(lambda: stream.read(65536), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 def datetime2timestamp(datetime_obj):
     """Safely convert a datetime object to a UTC timestamp.
 
     UTC seconds since epoch, reverse of `timestamp2datetime`
-    method described in this module
+    method described in this module, see `astrokat.timeconv.to_timestamp`
 
     """
-    epoch = datetime.datetime.utcfromtimestamp(0)
-    return (datetime_obj - epoch).total_seconds()
+    return timeconv.to_timestamp(datetime_obj)
 
 
 def timestamp2datetime(timestamp):
     """Safely convert a timestamp to UTC datetime object.
 
     UTC datetime object, reverse of `datetime2timestamp`
-    method described in this module
+    method described in this module, see `astrokat.timeconv.to_datetime`
 
     """
-    return datetime.datetime.utcfromtimestamp(timestamp)
+    return timeconv.to_datetime(timestamp)
 
 
 def get_lst(yaml_lst, multi_loop=False):
@@ -155,53 +379,103 @@ def get_lst(yaml_lst, multi_loop=False):
     return start_lst, end_lst
 
 
-def lst2utc(req_lst, ref_location, date=None):
-    """Find LST for given date else for Today.
+def _midnight_lst(ref_location, midnight):
+    """LST [hours] at UTC midnight timestamps, calculated once per date."""
+    if not isinstance(ref_location, katpoint.Antenna):
+        ref_location = katpoint.Antenna(ref_location)
+    observer = ref_location.observer.copy()
+    unique_midnight, day_idx = numpy.unique(midnight, return_inverse=True)
+    midnight_lst = numpy.empty(unique_midnight.shape)
+    for cnt, timestamp in enumerate(unique_midnight):
+        observer.date = timeconv.to_ephem_date(timestamp)
+        midnight_lst[cnt] = numpy.degrees(observer.sidereal_time()) / 15.
+    return midnight_lst[day_idx].reshape(numpy.shape(midnight))
+
+
+def timestamp2lst(timestamp, ref_location):
+    """LST at the given UTC timestamps, the inverse of `lst2timestamp`.
 
     Parameters
     ----------
-    req_lst: datetime
-        Request LST
-    ref_location: `EarthLocation()`
+    timestamp: float, datetime or array
+        UTC time, see `astrokat.timeconv.to_timestamp`
+    ref_location: str or katpoint.Antenna
         Location on earth where LST is being measured
-    date: datetime
-        Date when LST is being measured
 
     Returns
     -------
-        time_range: katpoint.Timestamp
-            UTC date and time
-        lst_range: float
-            LST range
+    lst: float or array
+        Local sidereal time [hours]
 
     """
+    timestamp = numpy.asarray(timeconv.to_timestamp(timestamp), dtype=float)
+    midnight = numpy.floor(timestamp / 86400.) * 86400.
+    lst = _midnight_lst(ref_location, midnight)
+    lst = (lst + (timestamp - midnight) / 3600. * timeconv.SIDEREAL_RATE) % 24.
+    if lst.ndim == 0:
+        return float(lst)
+    return lst
+
+
+def lst2timestamp(req_lst, ref_location, date=None):
+    """UTC timestamps at which the requested LSTs occur.
+
+    The LST at UTC midnight of each date is calculated once with ephem,
+    the requested LST is then reached at the sidereal rate,
+    accurate to well under a second.
+
+    Parameters
+    ----------
+    req_lst: float or array
+        Requested LST [hours]
+    ref_location: str or katpoint.Antenna
+        Location on earth where LST is being measured
+    date: datetime.date or array of datetime.date, optional
+        UTC date when LST is being measured, default is today
+
+    Returns
+    -------
+    timestamp: float or array
+        First UTC timestamp on the date with the requested LST
 
-    def get_lst_range(date):
-        date_timestamp = time.mktime(date.timetuple())  # this will be local time
-        time_range = katpoint.Timestamp(date_timestamp).secs + numpy.arange(
-            0, 24.0 * 3600.0, 60
-        )
-        lst_range = numpy.degrees(target.antenna.local_sidereal_time(time_range)) / 15.0
-        return time_range, lst_range
-
-    req_lst = float(req_lst)
-    cat = katpoint.Catalogue(add_specials=True)
-    cat.antenna = katpoint.Antenna(ref_location)
-    target = cat["Zenith"]
+    """
     if date is None:  # find the best UTC for today
-        date = datetime.date.today()
-    else:
-        date = date.replace(hour=0, minute=0, second=0, microsecond=0)
-    [time_range, lst_range] = get_lst_range(date)
-    lst_idx = numpy.abs(lst_range - req_lst).argmin()
-    if lst_range[lst_idx] < req_lst:
-        x = lst_range[lst_idx:lst_idx + 2]
-        y = time_range[lst_idx:lst_idx + 2]
+        date = time.time()
     else:
-        x = lst_range[lst_idx - 1:lst_idx + 1]
-        y = time_range[lst_idx - 1:lst_idx + 1]
-    linefit = numpy.poly1d(numpy.polyfit(x, y, 1))
-    return datetime.datetime.utcfromtimestamp(linefit(req_lst))
+        date = timeconv.to_timestamp(numpy.asarray(date, dtype=object))
+    midnight = numpy.floor(numpy.asarray(date) / 86400.) * 86400.
+    req_lst, midnight = numpy.broadcast_arrays(numpy.asarray(req_lst, dtype=float),
+                                               midnight)
+    midnight_lst = _midnight_lst(ref_location, midnight)
+    sidereal_hours = (req_lst - midnight_lst) % 24.
+    timestamp = midnight + sidereal_hours * 3600. / timeconv.SIDEREAL_RATE
+    if timestamp.ndim == 0:
+        return float(timestamp)
+    return timestamp
+
+
+def lst2utc(req_lst, ref_location, date=None):
+    """Find UTC for the requested LST on given date else for Today.
+
+    Parameters
+    ----------
+    req_lst: float or array
+        Request LST [hours]
+    ref_location: str or katpoint.Antenna
+        Location on earth where LST is being measured
+    date: datetime or array of datetime
+        Date when LST is being measured
+
+    Returns
+    -------
+    utc_datetime: datetime or list of datetime
+        UTC date and time
+
+    """
+    timestamp = lst2timestamp(req_lst, ref_location, date=date)
+    if numpy.ndim(timestamp) == 0:
+        return timeconv.to_datetime(timestamp)
+    return [timeconv.to_datetime(ts) for ts in numpy.ravel(timestamp)]
 
 
 # -fin-
@@ -73,7 +73,7 @@ def longformat_date(date_str):
 def lst2datetime(lst, date):
     date_str = longformat_date(date)
     utc_datetime = datetime.strptime(date_str, "%Y-%m-%d %H:%M")
-    date_lst = lst2utc(lst, Observatory().location, date=utc_datetime)
+    date_lst = lst2utc(lst, Observatory().kat, date=utc_datetime)
     return ("{} {} LST corresponds to {}Z UTC"
             .format(date, lst, date_lst))
 
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Noise diode timing verification report from observation logs."""
+
+import argparse
+import sys
+
+from astrokat import ndreport, __version__
+
+
+def cli(prog):
+    """Noise diode timing report for MeerKAT observations."""
+    usage = "{} [options] --log <observation.log>".format(prog)
+    description = ("Verify noise diode timing against correlator dumps "
+                   "and slews from an observation or dry-run log, "
+                   "generated with --debug logging")
+
+    parser = argparse.ArgumentParser(usage=usage, description=description)
+    parser.add_argument("--version", action="version", version=__version__)
+    parser.add_argument(
+        "--log",
+        type=str,
+        required=True,
+        help="Observation log file, '-' reads from stdin",
+    )
+    parser.add_argument(
+        "--dump-period",
+        type=float,
+        default=0.5,
+        help="Correlator integration time [sec] (default = %(default)s)",
+    )
+    parser.add_argument(
+        "--dump-start",
+        type=float,
+        help="Timestamp of the first correlator dump, "
+             "default is the capture start time in the log",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-3,
+        help="Allowed timing error [sec] (default = %(default)s)",
+    )
+
+    return parser.parse_args()
+
+
+def main(args):
+    """Print noise diode timing summary."""
+    if args.log == "-":
+        timeline = ndreport.parse_log(sys.stdin)
+    else:
+        with open(args.log) as log:
+            timeline = ndreport.parse_log(log)
+    summary = ndreport.report(timeline,
+                              args.dump_period,
+                              dump_start=args.dump_start,
+                              tolerance=args.tolerance)
+    print("Correlator dumps: {dumps} ({dumps_nd_on} ND on, "
+          "{dumps_nd_off} ND off, {dumps_nd_partial} partial)".format(**summary))
+    print("ND transitions: {transitions} ({misaligned_transitions} off dump edge, "
+          "max offset {max_transition_offset:.3f} sec)".format(**summary))
+    print("Digitiser requests out of sync: {requests_out_of_sync} "
+          "(max spread {max_antenna_spread:.3f} sec)".format(**summary))
+    if summary["slews"] is None:
+        print("Slews with ND on: not available, no slews in log")
+    else:
+        print("Slews with ND on: {slews_with_nd} of {slews} "
+              "({nd_on_during_slews:.1f} sec ND on)".format(**summary))
+
+
+if __name__ == "__main__":
+    main(cli(sys.argv[0]))
+
+
+# -fin-
@@ -15,7 +15,10 @@ import os
 import sys
 
 from astrokat import Observatory, read_yaml, katpoint_target_string, __version__
-from astrokat.utility import datetime2timestamp, timestamp2datetime
+from astrokat.observatory import reference_antenna
+from astrokat.targets import read_mosaic
+from astrokat.timeconv import to_ephem_date, to_timestamp
+from astrokat.utility import timestamp2datetime, timestamp2lst
 from copy import deepcopy
 from datetime import datetime, timedelta
 
@@ -372,9 +375,10 @@ def source_elevation(catalogue, ref_antenna):
     # All times and timestamps assumed UTC, no special conversion to
     # accommodate SAST allowed to prevent confusion
     creation_date = catalogue.antenna.observer.date
-    creation_timestamp = datetime2timestamp(creation_date.datetime())
+    creation_timestamp = to_timestamp(creation_date)
     time_range = creation_timestamp + numpy.arange(0, 24.0 * 60.0 * 60.0, 360.0)
     timestamps = [timestamp2datetime(ts) for ts in time_range]
+    ephem_dates = to_ephem_date(time_range)
 
     fig = plt.figure(figsize=(15, 7), facecolor="white")
     ax = plt.subplot(111)
@@ -384,8 +388,8 @@ def source_elevation(catalogue, ref_antenna):
 
     for cnt, target in enumerate(catalogue.targets):
         elev = []
-        for idx, timestamp in enumerate(timestamps):
-            catalogue.antenna.observer.date = ephem.Date(timestamp)
+        for ephem_date in ephem_dates:
+            catalogue.antenna.observer.date = ephem_date
             target.body.compute(catalogue.antenna.observer)
             elev.append(numpy.degrees(target.body.alt))
 
@@ -424,13 +428,12 @@ def source_elevation(catalogue, ref_antenna):
     ax.xaxis.set_major_locator(locator)
     utc_timestamps = [locs_lbl.strftime("%H:%M") for locs_lbl in locs_labels]
 
-    lst_timestamps = []
-    for locs_ts in locs_labels:
-        catalogue.antenna.observer.date = ephem.Date(locs_ts)
-        lst_time = "{}".format(catalogue.antenna.observer.sidereal_time())
-        lst_time_str = datetime.strptime(lst_time,
-                                         "%H:%M:%S.%f").strftime("%H:%M")
-        lst_timestamps.append(lst_time_str)
+    # LST of all tick positions in one conversion
+    lst_hours = timestamp2lst(numpy.array(locs_labels, dtype=object),
+                              catalogue.antenna)
+    lst_minutes = numpy.floor(lst_hours * 60.).astype(int) % (24 * 60)
+    lst_timestamps = ["{:02d}:{:02d}".format(*divmod(minute, 60))
+                      for minute in lst_minutes]
 
     ax.set_xticklabels(lst_timestamps,
                        rotation=30,
@@ -446,7 +449,7 @@ def source_elevation(catalogue, ref_antenna):
     ax2.set_xticklabels(utc_timestamps,
                         rotation=30,
                         fontsize=10)
-    ax2.set_xlabel('Time (UTC) starting from {}'.format(datetime.utcfromtimestamp(
+    ax2.set_xlabel('Time (UTC) starting from {}'.format(timestamp2datetime(
         creation_timestamp).strftime('%Y-%m-%d %H:%M:%S')))
 
     return fig
@@ -819,17 +822,19 @@ def best_cal_cover(catalogue, katpt_target, ref_antenna):
     horizon = numpy.degrees(ref_antenna.observer.horizon)
     if separation > 20.0:  # calibrator rises some time after target
         # add another calibrator preceding the target
-        observatory = Observatory(horizon=horizon,
-                                  datetime=ref_antenna.observer.date)
+        observatory = Observatory(horizon=horizon)
+        date = ref_antenna.observer.date
         [tgt_rise_time,
          tgt_set_time] = observatory.target_rise_and_set_times(katpt_target.body,
-                                                               lst=False)
+                                                               lst=False,
+                                                               date=date)
         closest_cals = []
         for each_cal in catalogue:
             try:
                 [cal_rise_time,
                  cal_set_time] = observatory.target_rise_and_set_times(each_cal.body,
-                                                                       lst=False)
+                                                                       lst=False,
+                                                                       date=date)
             except ephem.NeverUpError:
                 continue
             except ephem.AlwaysUpError:
@@ -901,7 +906,7 @@ def main(creation_time,
     observatory = Observatory()
     location = observatory.location
     node_config_available = observatory.node_config_available
-    ref_antenna = katpoint.Antenna(location)
+    ref_antenna = reference_antenna(location)
     ref_antenna.observer.date = ephem.Date(creation_time)
     ref_antenna.observer.horizon = ephem.degrees(str(horizon))
 
@@ -909,14 +914,17 @@ def main(creation_time,
 
     if viewfile is not None:
         # check if view file in CSV or YAML
-        data_dict = read_yaml(viewfile)
+        data_dict = read_yaml(viewfile, stream_target_lists=True)
         if data_dict:
             catalogue = katpoint.Catalogue()
             catalogue.antenna = ref_antenna
             for observation_cycle in data_dict["observation_loop"]:
-                for target_item in observation_cycle["target_list"]:
+                for target_item in observation_cycle.get("target_list", []):
                     name, target = katpoint_target_string(target_item)
                     catalogue.add(katpoint.Target(target))
+                if "mosaic" in observation_cycle:
+                    mosaic = read_mosaic(observation_cycle["mosaic"])
+                    catalogue.add(mosaic["target"].tolist())
         else:  # assume CSV
             # output observation stats for catalogue
             with open(viewfile, 'r') as fin:
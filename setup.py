@@ -17,6 +17,7 @@ setup(
         "scripts/astrokat-catalogue2obsfile.py",
         "scripts/astrokat-coords.py",
         "scripts/astrokat-lst.py",
+        "scripts/astrokat-nd-report.py",
         "scripts/astrokat-observe.py",
         "scripts/astrokat-targets.py",
     ],
@@ -51,6 +52,7 @@ setup(
         "matplotlib",
         "numpy",
         "pyyaml",
+        "six",
     ],
     extras_require={"live": ["katcorelib", "katconf"]},
 )